@@ -0,0 +1,400 @@
+"""Precomputed user/interest affinity matrices.
+
+``U`` is a sparse user x interest incidence matrix and ``S`` a sparse
+interest x interest cosine matrix that keeps, per interest, its ``neighbours``
+best scores above the similarity threshold (itself included, at 1.0).
+Scoring users for a set of weighted interests is ``U @ w`` and user-to-user
+affinity is the row ``(U[a] @ S) @ U.T``, so a pick is a row lookup plus
+top-k instead of a graph traversal. ``S`` is built a block of rows at a time,
+so it never needs the dense n x n product.
+
+Replacing a user's interests only rewrites that user's row of ``U``, plus the
+rows of ``S`` that a new or re-embedded interest enters or leaves; each row
+remembers the score a newcomer has to beat, so the result is the same as a
+full ``rebuild``. ``rebuild`` itself computes without the lock and swaps the
+matrices in at the end, replaying profile updates made in the meantime.
+
+For the global fallback each user also has a centroid, the normalised mean
+of their interest vectors, kept in one dense matrix ``C``. ``nearest_users``
+ranks every user against a query in one product ``C @ q`` and skips, by a
+per-row bitmap, users without interests and users this process has put in
+their cooldown (``mark_cooled``).
+"""
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+
+from interest_index import normalize_rows
+
+# Queries scored per product in nearest_users, so users x queries stays small
+NEAREST_QUERY_BLOCK = 16
+# Scores held at once while building S: rows per block = this / number of interests
+SIMILARITY_BLOCK_ENTRIES = 1 << 22
+
+
+def top_neighbours(rows, vectors, k, threshold):
+    """Rows of ``S`` for ``vectors[rows]``, as CSR, and the score a newcomer must beat per row.
+
+    A row keeps its ``k`` best cosines above ``threshold`` and always its own
+    column. Its floor is the lowest kept score once the row is full, else
+    ``threshold``.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    n = len(vectors)
+    floors = np.full(len(rows), threshold, dtype=np.float32)
+    blocks = []
+    step = max(1, SIMILARITY_BLOCK_ENTRIES // max(n, 1))
+    for start in range(0, len(rows), step):
+        block_rows = rows[start:start + step]
+        scores = vectors[block_rows] @ vectors.T
+        scores[np.arange(len(block_rows)), block_rows] = np.inf
+        if n > k:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            kept = np.take_along_axis(scores, top, axis=1)
+        else:
+            top, kept = np.broadcast_to(np.arange(n), scores.shape), scores
+        kept[np.isinf(kept)] = 1.0
+        keep = kept > threshold
+        if n > k:
+            full = keep.all(axis=1)
+            floors[start:start + step][full] = kept[full].min(axis=1)
+        counts = keep.sum(axis=1)
+        blocks.append(sparse.csr_matrix(
+            (kept[keep], (np.repeat(np.arange(len(block_rows)), counts), top[keep])),
+            shape=(len(block_rows), n), dtype=np.float32))
+    if not blocks:
+        return sparse.csr_matrix((0, n), dtype=np.float32), floors
+    similarity = sparse.vstack(blocks, format="csr")
+    similarity.sort_indices()
+    return similarity, floors
+
+
+class AffinityModel:
+    def __init__(self, threshold=0.5, neighbours=50):
+        self.threshold = threshold
+        self.neighbours = neighbours
+        self.loaded_at = None
+        self._lock = threading.RLock()
+        self._user_ids = []             # row -> user id
+        self._user_rows = {}            # user id -> row
+        self._user_interests = {}       # user id -> tuple of interest ids
+        self._interest_ids = []         # column -> interest id
+        self._interest_cols = {}        # interest id -> column
+        self._n_interests = 0
+        self._vectors = np.empty((0, 0), dtype=np.float32)     # column -> normalised vector
+        self._floors = np.empty(0, dtype=np.float32)           # row of S -> score a newcomer must beat
+        # S, as CSR for products; edits go to a LIL copy made on the first one
+        self._similarity = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self._similarity_lil = None
+        # LIL keeps one list per row, so replacing a user's interests is O(row);
+        # the CSR copy used for products is rebuilt lazily after a change
+        self._users = sparse.lil_matrix((0, 0), dtype=np.float32)
+        self._users_csr = None
+        # C, over-allocated by row; rebuilt from U @ V when an interest's vector changes
+        self._centroids = np.empty((0, 0), dtype=np.float32)
+        self._centroids_stale = False
+        self._profiled = np.zeros(0, dtype=bool)          # row -> has at least one interest vector
+        self._cooled_until = np.zeros(0, dtype=np.float64)  # row -> cooldown end known to this process
+        self._replay = None     # user id -> interest ids updated while a rebuild runs
+
+    def __len__(self):
+        return len(self._user_ids)
+
+    @property
+    def rebuilding(self):
+        """True between ``track_updates`` and the end of the next ``rebuild``."""
+        return self._replay is not None
+
+    def track_updates(self):
+        """Remember profile updates from now on, so the next ``rebuild`` replays them."""
+        with self._lock:
+            if self._replay is None:
+                self._replay = {}
+
+    def rebuild(self, interest_index, memberships):
+        """Rebuild both matrices from the interest index and (user_id, interest_ids) pairs.
+
+        Reads keep using the old matrices until the new ones are ready. Call
+        ``track_updates`` before reading ``memberships`` so no update is lost.
+        """
+        started = time.monotonic()
+        ids, matrix = interest_index.snapshot()
+        interest_cols = {interest_id: col for col, interest_id in enumerate(ids)}
+        similarity, floors = top_neighbours(np.arange(len(ids)), matrix, self.neighbours, self.threshold)
+
+        user_ids, user_interests, rows, cols = [], {}, [], []
+        for user_id, interest_ids in memberships:
+            row = len(user_ids)
+            user_ids.append(user_id)
+            user_interests[user_id] = tuple(interest_ids)
+            for col in {interest_cols.get(i) for i in interest_ids} - {None}:
+                rows.append(row)
+                cols.append(col)
+        users = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                                  shape=(len(user_ids), len(ids)))
+
+        with self._lock:
+            # Cooldowns are known by user, not row, across a rebuild
+            now = time.time()
+            cooled = {self._user_ids[row]: float(self._cooled_until[row])
+                      for row in np.flatnonzero(self._cooled_until[:len(self._user_ids)] > now)}
+            self._interest_ids = list(ids)
+            self._interest_cols = interest_cols
+            self._n_interests = len(ids)
+            self._vectors = matrix
+            self._floors = floors
+            self._similarity, self._similarity_lil = similarity, None
+            self._user_ids = user_ids
+            self._user_rows = {user_id: row for row, user_id in enumerate(user_ids)}
+            self._user_interests = user_interests
+            self._users = users.tolil()
+            self._users_csr = users
+            self._centroids = np.zeros((len(user_ids), matrix.shape[1]), dtype=np.float32)
+            self._profiled = np.zeros(len(user_ids), dtype=bool)
+            self._cooled_until = np.array([cooled.get(user_id, 0.0) for user_id in user_ids],
+                                          dtype=np.float64)
+            self._centroids_stale = True
+            replay, self._replay = self._replay or {}, None
+            for user_id, interest_ids in replay.items():
+                self.update_user(user_id, interest_ids, interest_index)
+            self.loaded_at = started
+
+    def update_user(self, user_id, interest_ids, interest_index):
+        """Replace one user's row, pulling any new or changed interest vectors from the index."""
+        with self._lock:
+            if self._replay is not None:
+                self._replay[user_id] = tuple(interest_ids)
+            if self._n_interests == 0 and interest_index.dim:
+                self._vectors = np.empty((0, interest_index.dim), dtype=np.float32)
+            ids, vectors = [], []
+            for interest_id in dict.fromkeys(interest_ids):
+                vector = interest_index.get_vector(interest_id)
+                if vector is not None and vector.size == self._vectors.shape[1]:
+                    ids.append(interest_id)
+                    vectors.append(vector)
+            if ids:
+                self._set_interests(ids, np.array(vectors, dtype=np.float32))
+
+            row = self._user_rows.get(user_id)
+            if row is None:
+                row = len(self._user_ids)
+                self._user_ids.append(user_id)
+                self._user_rows[user_id] = row
+                self._users.resize((row + 1, self._n_interests))
+            self._grow_users(len(self._user_ids))
+            cols = sorted({self._interest_cols[i] for i in ids})
+            self._users.rows[row] = cols
+            self._users.data[row] = [1.0] * len(cols)
+            self._user_interests[user_id] = tuple(interest_ids)
+            self._users_csr = None
+            if not self._centroids_stale:
+                self._set_centroid(row, cols)
+
+    def user_interests(self, user_id):
+        return self._user_interests.get(user_id, ())
+
+    def top_users(self, interest_weights, k=10, exclude_user_ids=()):
+        """Users ranked by the summed weight of their interests in ``interest_weights``."""
+        with self._lock:
+            weights = np.zeros(self._n_interests, dtype=np.float32)
+            for interest_id, weight in interest_weights.items():
+                col = self._interest_cols.get(interest_id)
+                if col is not None:
+                    weights[col] = weight
+            if not weights.any():
+                return []
+            return self._select(self._csr() @ weights, k, exclude_user_ids)
+
+    def similar_users(self, user_id, k=10, exclude_user_ids=()):
+        """Users with the highest affinity to ``user_id``: one row of ``U @ S @ U.T``."""
+        with self._lock:
+            row = self._user_rows.get(user_id)
+            if row is None:
+                return []
+            users = self._csr()
+            profile = (users[row] @ self._similarity_csr()).toarray().ravel()
+            scores = users @ profile
+            return self._select(scores, k, [user_id, *exclude_user_ids])
+
+    def user_centroid(self, user_id):
+        """Normalised mean of the user's interest vectors, or None if they have none."""
+        with self._lock:
+            row = self._user_rows.get(user_id)
+            if row is None:
+                return None
+            self._ensure_centroids()
+            return self._centroids[row].copy() if self._profiled[row] else None
+
+    def mark_cooled(self, user_ids, until):
+        """Skip these users in ``nearest_users`` until ``until`` (epoch seconds)."""
+        with self._lock:
+            for user_id in user_ids:
+                row = self._user_rows.get(user_id)
+                if row is not None:
+                    self._cooled_until[row] = max(self._cooled_until[row], until)
+
+    def clear_cooled(self):
+        with self._lock:
+            self._cooled_until[:] = 0.0
+
+    def nearest_users(self, queries, k=10, exclude_user_ids=(), now=None):
+        """Top ``k`` ``(user_id, cosine)`` per query vector over every user centroid.
+
+        Users without interests, users in ``exclude_user_ids`` and users marked
+        cooled are masked out before the top-k, so each list holds up to ``k``
+        users that may still be recommended.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_centroids()
+            n = len(self._user_ids)
+            if n == 0 or k <= 0 or not len(queries):
+                return [[] for _ in queries]
+            allowed = self._profiled[:n] & (self._cooled_until[:n] <= now)
+            for user_id in exclude_user_ids:
+                row = self._user_rows.get(user_id)
+                if row is not None:
+                    allowed[row] = False
+            available = int(allowed.sum())
+            queries = normalize_rows(np.array(queries, dtype=np.float32).reshape(len(queries), -1))
+            if available == 0 or queries.shape[1] != self._centroids.shape[1]:
+                return [[] for _ in queries]
+
+            results = []
+            k = min(k, available)
+            for start in range(0, len(queries), NEAREST_QUERY_BLOCK):
+                block = self._centroids[:n] @ queries[start:start + NEAREST_QUERY_BLOCK].T
+                block[~allowed] = -np.inf
+                for scores in block.T:
+                    top = np.argpartition(-scores, k - 1)[:k] if k < n else np.flatnonzero(allowed)
+                    top = top[np.argsort(-scores[top], kind="stable")]
+                    results.append([(self._user_ids[row], float(scores[row])) for row in top])
+            return results
+
+    def _set_centroid(self, row, cols):
+        if cols:
+            centroid = self._vectors[cols].sum(axis=0)
+            norm = np.linalg.norm(centroid)
+            self._centroids[row] = centroid / norm if norm else 0.0
+            self._profiled[row] = bool(norm)
+        else:
+            self._centroids[row] = 0.0
+            self._profiled[row] = False
+
+    def _ensure_centroids(self):
+        """Recompute every centroid as ``U @ V`` (row sums, then normalised) after a vector change."""
+        if not self._centroids_stale:
+            return
+        n_users, n = len(self._user_ids), self._n_interests
+        if n:
+            sums = np.asarray(self._csr() @ self._vectors[:n], dtype=np.float32)
+            self._profiled[:n_users] = np.linalg.norm(sums, axis=1) > 0
+            self._centroids[:n_users] = normalize_rows(sums)
+        else:
+            self._centroids[:n_users] = 0.0
+            self._profiled[:n_users] = False
+        self._centroids_stale = False
+
+    def _grow_users(self, size):
+        dim = self._vectors.shape[1]
+        if self._centroids.shape[1] != dim:
+            # First vectors arrived after an empty rebuild
+            self._centroids = np.zeros((self._centroids.shape[0], dim), dtype=np.float32)
+            self._centroids_stale = True
+        capacity = self._centroids.shape[0]
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 64)
+        centroids = np.zeros((capacity, dim), dtype=np.float32)
+        centroids[:len(self._centroids)] = self._centroids
+        profiled = np.zeros(capacity, dtype=bool)
+        profiled[:len(self._profiled)] = self._profiled
+        cooled_until = np.zeros(capacity, dtype=np.float64)
+        cooled_until[:len(self._cooled_until)] = self._cooled_until
+        self._centroids, self._profiled, self._cooled_until = centroids, profiled, cooled_until
+
+    def _csr(self):
+        if self._users_csr is None:
+            self._users_csr = self._users.tocsr()
+        return self._users_csr
+
+    def _similarity_csr(self):
+        if self._similarity is None:
+            self._similarity = self._similarity_lil.tocsr()
+        return self._similarity
+
+    def _select(self, scores, k, exclude_user_ids):
+        for user_id in exclude_user_ids:
+            row = self._user_rows.get(user_id)
+            if row is not None:
+                scores[row] = 0.0
+        keep = np.flatnonzero(scores > 0)
+        if keep.size == 0 or k <= 0:
+            return []
+        if keep.size > k:
+            keep = keep[np.argpartition(-scores[keep], k - 1)[:k]]
+        keep = keep[np.argsort(-scores[keep], kind="stable")]
+        return [(self._user_ids[row], float(scores[row])) for row in keep]
+
+    def _set_interests(self, interest_ids, vectors):
+        """Add or refresh interest columns and recompute the rows of ``S`` they enter or leave."""
+        n_before = self._n_interests
+        cols = []
+        for interest_id in interest_ids:
+            col = self._interest_cols.get(interest_id)
+            if col is None:
+                col = self._n_interests
+                self._grow(col + 1)
+                self._interest_ids.append(interest_id)
+                self._interest_cols[interest_id] = col
+                self._n_interests += 1
+            cols.append(col)
+        n = self._n_interests
+        existing = [i for i, col in enumerate(cols) if col < n_before]
+        old = self._vectors[[cols[i] for i in existing]].copy()
+        if existing and not np.array_equal(old, vectors[existing]):
+            # Users holding a re-embedded interest have a stale centroid
+            self._centroids_stale = True
+        self._vectors[cols] = vectors
+
+        # Rows a changed column may have been kept in, and rows it now beats the floor of
+        floors = self._floors[:n]
+        affected = np.zeros(n, dtype=bool)
+        affected[cols] = True
+        if existing:
+            old_scores = old @ self._vectors[:n].T
+            affected |= ((old_scores >= floors) & (old_scores > self.threshold)).any(axis=0)
+        affected |= (vectors @ self._vectors[:n].T > floors).any(axis=0)
+        rows = np.flatnonzero(affected)
+        block, self._floors[rows] = top_neighbours(rows, self._vectors[:n], self.neighbours, self.threshold)
+
+        similarity = self._lil(n)
+        for i, row in enumerate(rows):
+            span = slice(block.indptr[i], block.indptr[i + 1])
+            similarity.rows[row] = block.indices[span].tolist()
+            similarity.data[row] = block.data[span].tolist()
+        self._similarity = None
+        if self._users.shape[1] != n:
+            self._users.resize((len(self._user_ids), n))
+
+    def _lil(self, n):
+        """The editable copy of ``S``, sized for ``n`` interests."""
+        if self._similarity_lil is None:
+            self._similarity_lil = self._similarity.tolil()
+        if self._similarity_lil.shape != (n, n):
+            self._similarity_lil.resize((n, n))
+        return self._similarity_lil
+
+    def _grow(self, size):
+        capacity = self._vectors.shape[0]
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 64)
+        n = self._n_interests
+        vectors = np.zeros((capacity, self._vectors.shape[1]), dtype=np.float32)
+        vectors[:n] = self._vectors[:n]
+        floors = np.full(capacity, self.threshold, dtype=np.float32)
+        floors[:n] = self._floors[:n]
+        self._vectors, self._floors = vectors, floors
@@ -0,0 +1,429 @@
+"""Async (ASGI) serving mode for the backend API.
+
+Same routes and responses as api.py, served by Quart on top of the neo4j
+``AsyncGraphDatabase`` driver so a single process can keep hundreds of
+coaster/profile requests in flight while they wait on Neo4j. CPU-bound work
+(embedding, index scoring, user ranking) is pushed to a thread pool so it
+never blocks the event loop.
+
+Run with any ASGI server, e.g.:
+
+    hypercorn asgi:app --bind 0.0.0.0:5000
+
+Startup follows api.py: with the default STARTUP_MODE=eager the server waits
+for Neo4j and the schema check before serving, with ``lazy`` it serves at
+once and leaves them (and the model) to ``/ready`` or the first request.
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from quart import Quart, Response, g, jsonify, request, websocket
+
+import db
+import metrics
+import startup
+import validation
+from coaster_hub import COASTER_SEND_TIMEOUT_SECONDS, MAX_DISPATCH_PICKS, CoasterHub, sse_frame
+from cooldown_store import COOLDOWN_BACKEND, COOLDOWN_SYNC_SECONDS
+from embeddings import embedding_cache, require_model, tokenize
+from graph_backend import GRAPH_BACKEND, create_connection
+from metrics import span
+from neo4j_connection import Neo4jConnection
+from schema import SCHEMA_BOOTSTRAP, ensure_schema
+from startup import PROBE_PATHS, STARTUP_MODE
+
+load_dotenv()
+
+metrics.configure_logging()
+log = logging.getLogger(__name__)
+
+# Threads available for CPU-bound scoring and embedding
+ASGI_CPU_WORKERS = int(os.getenv("ASGI_CPU_WORKERS", str(min(8, (os.cpu_count() or 1) + 2))))
+
+
+class AsyncNeo4jConnection(Neo4jConnection):
+    """Neo4jConnection with awaitable I/O: the parent's flows, with their steps awaited.
+
+    Queries go to the async driver and compute steps to the thread pool, so
+    every public method of the parent returns a coroutine here.
+    """
+
+    def __init__(self, driver, executor):
+        self.executor = executor
+        self._cooldown_task = None
+        self._background = set()
+        super().__init__(driver)
+        self._index_lock = asyncio.Lock()
+
+    async def close(self):
+        if self._cooldown_task is not None:
+            self._cooldown_task.cancel()
+            self._cooldown_task = None
+            try:
+                await self.sync_cooldowns(pull=False)
+            except Exception:
+                log.exception("Final cooldown sync failed")
+        await self.driver.close()
+
+    def _start_cooldown_sync(self):
+        # Constructed inside startup_stages(), so the loop is already running
+        self._cooldown_task = asyncio.get_running_loop().create_task(self._cooldown_loop())
+
+    async def _cooldown_loop(self):
+        while True:
+            try:
+                await self.sync_cooldowns()
+            except Exception:
+                log.exception("Cooldown sync failed")
+            await asyncio.sleep(COOLDOWN_SYNC_SECONDS)
+
+    async def _offload(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def _run(self, flow):
+        value, error = None, None
+        while True:
+            try:
+                step = flow.send(value) if error is None else flow.throw(error)
+            except StopIteration as done:
+                return done.value
+            try:
+                value, error = await self._step(*step), None
+            except Exception as e:
+                value, error = None, e
+
+    async def _step(self, kind, target, args):
+        if kind == "read":
+            return await db.async_read_query(self.driver, target, **args)
+        if kind == "write":
+            return await db.async_write_query(self.driver, target, **args)
+        if kind == "transaction":
+            return await db.async_write_statements(self.driver, target)
+        if kind == "compute":
+            return await self._offload(target, *args)
+        if kind == "exclusive":
+            # Only one coroutine reloads; the others wait and reuse its result
+            async with self._index_lock:
+                return await self._run(target)
+        if kind == "background":
+            # Held until done, so the task isn't garbage collected mid-flight
+            task = asyncio.get_running_loop().create_task(self._run(target))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+            return None
+        raise ValueError(f"Unknown flow step: {kind}")
+
+
+class OffloadedConnection:
+    """Awaitable facade over a synchronous connection, used for GRAPH_BACKEND=memory."""
+
+    def __init__(self, conn, executor):
+        self._conn = conn
+        self._executor = executor
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(attr, *args, **kwargs))
+        return call
+
+
+app = Quart(__name__)
+executor = ThreadPoolExecutor(max_workers=ASGI_CPU_WORKERS, thread_name_prefix="scoring")
+neo4j_conn = None
+metrics.register_stats("profile_cache",
+                       lambda: neo4j_conn.profile_cache.stats() if neo4j_conn is not None else {})
+coaster_hub = CoasterHub()
+metrics.register_stats("coasters", coaster_hub.stats)
+metrics.register_stats("cooldowns",
+                       lambda: neo4j_conn.cooldowns.stats()
+                       if neo4j_conn is not None and neo4j_conn.cooldowns is not None else {})
+
+
+_schema_checked = not SCHEMA_BOOTSTRAP or GRAPH_BACKEND == "memory"
+
+
+# The connection and schema stages are one-off and synchronous: they run off
+# the loop on the regular driver, which is closed again afterwards
+def _check_connection():
+    """Wait for Neo4j to answer; the in-memory graph has nothing to reach."""
+    if GRAPH_BACKEND == "memory":
+        return
+    try:
+        db.get_driver().verify_connectivity()
+    finally:
+        db.close_driver()
+
+
+def _bootstrap_schema():
+    global _schema_checked
+    if _schema_checked:
+        return
+    try:
+        ensure_schema()
+    finally:
+        db.close_driver()
+    _schema_checked = True
+
+
+# In order; the server is ready once all of them have run
+STARTUP_STAGES = [("connection", _check_connection), ("schema", _bootstrap_schema),
+                  ("tokenizer", lambda: tokenize("")), ("embedding_model", require_model)]
+
+
+async def _run_stage(name, fn):
+    await asyncio.get_running_loop().run_in_executor(None, startup.stage, name, fn)
+
+
+@app.before_serving
+async def startup_stages():
+    global neo4j_conn
+    if GRAPH_BACKEND == "memory":
+        neo4j_conn = OffloadedConnection(create_connection(GRAPH_BACKEND), executor)
+    else:
+        neo4j_conn = AsyncNeo4jConnection(db.create_async_driver(), executor)
+    if STARTUP_MODE != "eager":
+        return
+    try:
+        await _run_stage("connection", _check_connection)
+        await _run_stage("schema", _bootstrap_schema)
+    except Exception:
+        # Serve anyway: /ready reports the failure and the next request retries the schema
+        log.exception("Startup stage failed")
+
+
+@app.before_request
+async def bootstrap_schema():
+    """Create missing constraints/indexes before the first request is served; retried until it succeeds."""
+    if _schema_checked or request.path in PROBE_PATHS:
+        return
+    try:
+        await _run_stage("schema", _bootstrap_schema)
+    except Exception:
+        log.exception("Schema bootstrap failed")
+
+
+@app.after_serving
+async def shutdown():
+    if neo4j_conn is not None:
+        await neo4j_conn.close()
+    executor.shutdown(wait=False)
+
+
+@app.before_request
+async def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+async def record_latency(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.request_duration.observe(time.perf_counter() - started, method=request.method,
+                                         route=route, status=response.status_code)
+    return response
+
+
+@app.after_request
+async def add_cors_headers(response):
+    # Same open CORS policy as flask_cors' CORS(app) in api.py
+    response.headers.setdefault("Access-Control-Allow-Origin", "*")
+    response.headers.setdefault("Access-Control-Allow-Headers", "Content-Type")
+    response.headers.setdefault("Access-Control-Allow-Methods", "GET, POST, PUT, OPTIONS")
+    return response
+
+
+@app.route('/api/profile/<user_id>', methods=['POST'])
+async def create_user(user_id):
+    try:
+        user_data = await request.get_json() or {}
+        created = await neo4j_conn.create_user(user_id, user_data)
+        if created:
+            return jsonify({"message": "User created successfully"})
+        else:
+            return jsonify({"message": "User already exists"}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/profile/interests/<user_id>', methods=['GET'])
+async def get_interests(user_id):
+    """The user's interests with an ETag; a matching If-None-Match gets a 304.
+
+    With the profile cache on (the default) a repeat request costs one indexed
+    read of User.profileVersion. With PROFILE_CACHE_SIZE=0 every request runs
+    the full interests query, and a 304 only saves the bandwidth.
+    """
+    try:
+        include_vectors = request.args.get('vectors', default='true').lower() != 'false'
+        body, etag = await neo4j_conn.get_user_profile(user_id, include_vectors)
+        if request.if_none_match.contains(etag):
+            response = Response("", status=304)
+        else:
+            response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/profile/interests/<user_id>', methods=['PUT'])
+async def update_interests(user_id):
+    try:
+        interests = await request.get_json()
+        success = await neo4j_conn.update_user_interests(user_id, interests)
+        if success:
+            return jsonify({"message": "Interests updated successfully"})
+        else:
+            return jsonify({"error": "Failed to update interests"}), 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/profile/interests:bulk', methods=['PUT'])
+async def bulk_update_interests():
+    try:
+        entries = validation.bulk_entries(await request.get_json())
+
+        result = await neo4j_conn.bulk_update_user_interests(entries)
+        return jsonify({"message": "Interests updated successfully", **result})
+    except validation.InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/interests/similar/<interest_id>', methods=['GET'])
+async def find_similar_interests(interest_id):
+    try:
+        limit = request.args.get('limit', default=10, type=int)
+        user_id = request.args.get('user_id')
+        similar_interests = await neo4j_conn.find_similar_interests(validation.interest_id(interest_id), limit, user_id)
+        return jsonify(similar_interests)
+    except validation.InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/interests/similar:batch', methods=['POST'])
+async def find_similar_interests_batch():
+    try:
+        interest_ids, limit, user_ids = validation.similar_batch(
+            await request.get_json(), request.args.get('limit', default=10, type=int))
+        results = await neo4j_conn.find_similar_interests_batch(interest_ids, limit, user_ids)
+        return jsonify(results)
+    except validation.InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/users/similar/<user_id>', methods=['GET'])
+async def find_similar_users(user_id):
+    try:
+        limit = request.args.get('limit', default=10, type=int)
+        similar_users = await neo4j_conn.find_similar_users(user_id, limit)
+        return jsonify({"user_id": user_id, "similar_users": similar_users})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/coasters/<user_id>/events', methods=['GET'])
+async def coaster_events(user_id):
+    """Server-Sent Events stream of the picks ``user_id``'s coaster should light up for."""
+    subscriber = coaster_hub.subscribe(user_id)
+
+    async def events():
+        # Backpressure comes from the server: the next frame is only built once this one is written
+        async for frame in coaster_hub.frames(subscriber):
+            yield sse_frame(frame)
+
+    response = Response(events(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    # Quart ends responses after RESPONSE_TIMEOUT; this one stays open until the coaster leaves
+    response.timeout = None
+    return response
+
+
+@app.websocket('/api/coasters/<user_id>/ws')
+async def coaster_websocket(user_id):
+    """Same frames as the SSE stream, one JSON array per WebSocket message."""
+    subscriber = coaster_hub.subscribe(user_id)
+
+    async def send(frame):
+        await websocket.send(json.dumps(frame, separators=(",", ":")))
+
+    await websocket.accept()
+    await coaster_hub.stream(subscriber, send, COASTER_SEND_TIMEOUT_SECONDS)
+
+
+@app.route('/api/coasters/dispatch', methods=['POST'])
+async def dispatch_picks():
+    """Fan ``{"picks": {picked user: [matched users]}}`` out to the connected coasters."""
+    try:
+        body = await request.get_json() or {}
+        picks = body.get("picks")
+        if not isinstance(picks, dict) or not all(isinstance(users, list) for users in picks.values()):
+            return jsonify({"error": "picks must map each picked user id to a list of user ids"}), 400
+        if len(picks) > MAX_DISPATCH_PICKS:
+            return jsonify({"error": f"At most {MAX_DISPATCH_PICKS} picks per request"}), 400
+        with span("dispatch_picks.publish"):
+            delivered = coaster_hub.publish(picks)
+        return jsonify({"picks": len(picks), "delivered": delivered})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/stats/coasters', methods=['GET'])
+async def coaster_stats():
+    return jsonify(coaster_hub.stats())
+
+
+@app.route('/ready', methods=['GET'])
+async def readiness():
+    """200 once every startup stage has run; until then 503 at once, while the stages run in the background."""
+    is_ready = startup.ready(name for name, _ in STARTUP_STAGES)
+    if not is_ready:
+        startup.warm_up(STARTUP_STAGES)
+    return jsonify({"ready": is_ready, "mode": STARTUP_MODE, **startup.report()}), 200 if is_ready else 503
+
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/api/stats/pool', methods=['GET'])
+async def pool_stats():
+    return jsonify(db.pool_metrics.snapshot())
+
+
+@app.route('/api/stats/profile-cache', methods=['GET'])
+async def profile_cache_stats():
+    return jsonify(neo4j_conn.profile_cache.stats())
+
+
+@app.route('/api/stats/cooldowns', methods=['GET'])
+async def cooldown_stats():
+    cooldowns = neo4j_conn.cooldowns
+    return jsonify({"backend": COOLDOWN_BACKEND, **(cooldowns.stats() if cooldowns is not None else {})})
+
+
+@app.route('/api/stats/embedding-cache', methods=['GET'])
+async def embedding_cache_stats():
+    return jsonify(embedding_cache.stats())
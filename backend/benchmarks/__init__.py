@@ -0,0 +1 @@
+"""Benchmark harness for the backend routes; run ``python -m benchmarks.run`` from backend/."""
@@ -0,0 +1,252 @@
+"""Load test for the coaster push channel (asgi.py, coaster_hub.py).
+
+    cd backend
+    python -m benchmarks.coaster_load --spawn --connections 5000 --rounds 20 --output push.json
+
+Opens ``--connections`` idle SSE subscriptions (one per synthetic user id),
+records the server's resident memory before and after, then posts
+``--rounds`` dispatches of ``--round-size`` picks each and measures the time
+from dispatch to each message arriving. ``--spawn`` starts
+``hypercorn asgi:app`` on the in-memory graph backend in a subprocess so the
+server's RSS can be read; otherwise ``--url`` points at a running server.
+The client is plain asyncio streams, so one client process holds thousands
+of connections.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_kb(pid):
+    """Resident set size of ``pid`` and its children in kB, from /proc (Linux only); None elsewhere."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            total = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        # hypercorn serves from a worker process it spawns
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, StopIteration):
+        return None
+    return total + sum(rss_kb(child) or 0 for child in children)
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(port, data_dir):
+    env = {**os.environ, "GRAPH_BACKEND": "memory", "MEMORY_GRAPH_PERSISTENCE": "none",
+           "MEMORY_GRAPH_PATH": os.path.join(data_dir, "graph.json"),
+           "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING")}
+    server = subprocess.Popen([sys.executable, "-m", "hypercorn", "asgi:app",
+                               "--bind", f"127.0.0.1:{port}", "--backlog", "2048"],
+                              cwd=BACKEND_DIR, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("hypercorn exited during startup")
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("hypercorn did not start within 60s")
+
+
+def http_json(method, url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=30) as response:
+        return json.loads(response.read())
+
+
+class Client:
+    """Idle SSE subscriptions that timestamp every message they receive."""
+
+    def __init__(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.received = 0
+        self.latencies = []
+        self.failed = 0
+        self.tasks = []
+
+    async def connect(self, user_id, handshakes):
+        async with handshakes:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                writer.write(f"GET /api/coasters/{user_id}/events HTTP/1.1\r\n"
+                             f"Host: {self.host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+                await writer.drain()
+                status = await reader.readline()
+                if b" 200 " not in status:
+                    raise ConnectionError(status)
+                while await reader.readline() not in (b"\r\n", b""):
+                    pass
+            except (OSError, ConnectionError):
+                self.failed += 1
+                return
+        self.tasks.append(asyncio.create_task(self.listen(reader, writer)))
+
+    async def listen(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                # Chunked transfer encoding: payload lines start with "data: "
+                if line.startswith(b"data: "):
+                    now = time.time()
+                    for message in json.loads(line[6:]):
+                        self.received += 1
+                        self.latencies.append(now - message["sent_at"])
+        except (OSError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+def percentile_ms(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 3) if values else None
+
+
+async def run(args, url, server_pid):
+    rng = random.Random(args.seed)
+    user_ids = [f"coaster-{i}" for i in range(args.connections)]
+    client = Client(url)
+    rss_before = rss_kb(server_pid) if server_pid else None
+
+    started = time.perf_counter()
+    handshakes = asyncio.Semaphore(args.concurrency)
+    await asyncio.gather(*(client.connect(user_id, handshakes) for user_id in user_ids))
+    connect_seconds = time.perf_counter() - started
+    await asyncio.sleep(args.idle_seconds)
+    rss_idle = rss_kb(server_pid) if server_pid else None
+    stats_idle = await asyncio.to_thread(http_json, "GET", f"{url}/api/stats/coasters")
+
+    expected = 0
+    dispatch_ms = []
+    for _ in range(args.rounds):
+        members = rng.sample(user_ids, args.round_size * args.group_size)
+        picks = {members[i]: members[i + 1:i + args.group_size]
+                 for i in range(0, len(members), args.group_size)}
+        t0 = time.perf_counter()
+        result = await asyncio.to_thread(http_json, "POST", f"{url}/api/coasters/dispatch",
+                                         {"picks": picks})
+        dispatch_ms.append(time.perf_counter() - t0)
+        expected += result["delivered"]
+        await asyncio.sleep(args.round_interval)
+
+    deadline = time.monotonic() + 10
+    while client.received < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    stats_done = await asyncio.to_thread(http_json, "GET", f"{url}/api/stats/coasters")
+    await client.close()
+
+    connected = args.connections - client.failed
+    return {
+        "connections": connected,
+        "failed_connections": client.failed,
+        "connect_seconds": round(connect_seconds, 3),
+        "server_rss_kb": {"before": rss_before, "idle": rss_idle},
+        "server_kb_per_connection": round((rss_idle - rss_before) / connected, 2)
+        if rss_before and rss_idle and connected else None,
+        "client_rss_kb": rss_kb(os.getpid()),
+        "hub_idle": stats_idle,
+        "hub_done": stats_done,
+        "messages": {"expected": expected, "received": client.received},
+        "dispatch_p50_ms": percentile_ms(dispatch_ms, 50),
+        "dispatch_p99_ms": percentile_ms(dispatch_ms, 99),
+        "delivery_p50_ms": percentile_ms(client.latencies, 50),
+        "delivery_p99_ms": percentile_ms(client.latencies, 99),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the coaster push channel")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="server to test (without --spawn)")
+    parser.add_argument("--spawn", action="store_true",
+                        help="start hypercorn asgi:app on the memory backend and measure its RSS")
+    parser.add_argument("--connections", type=int, default=2000, help="idle SSE subscriptions")
+    parser.add_argument("--concurrency", type=int, default=200, help="handshakes in flight at once")
+    parser.add_argument("--idle-seconds", type=float, default=2.0,
+                        help="wait after connecting before measuring memory")
+    parser.add_argument("--rounds", type=int, default=20, help="dispatch requests")
+    parser.add_argument("--round-size", type=int, default=50, help="picks per dispatch")
+    parser.add_argument("--group-size", type=int, default=3, help="picked user plus matched users")
+    parser.add_argument("--round-interval", type=float, default=0.1, help="seconds between dispatches")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    if args.round_size * args.group_size > args.connections:
+        parser.error("--round-size * --group-size must not exceed --connections")
+
+    fd_limit = raise_fd_limit()
+    if fd_limit < args.connections + 64:
+        print(f"Open file limit is {fd_limit}; some connections will fail", file=sys.stderr)
+
+    server = None
+    url = args.url.rstrip("/")
+    with tempfile.TemporaryDirectory() as data_dir:
+        if args.spawn:
+            port = free_port()
+            server = spawn_server(port, data_dir)
+            url = f"http://127.0.0.1:{port}"
+        try:
+            result = asyncio.run(run(args, url, server.pid if server else None))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    report = {
+        "generated_at": datetime.datetime.now(datetime.UTC).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "result": result,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Deterministic stand-in for the word embedding model.
+
+Exposes the same attributes as EmbeddingStore / gensim KeyedVectors that
+embeddings.py uses. Words are grouped into topics and each word vector is its
+topic centre plus noise, so interests built from the same topic come out
+similar and the similarity threshold behaves roughly like it does on GloVe.
+"""
+import numpy as np
+
+
+def word_for(index):
+    """Alphabetic pseudo-word for ``index`` (simple_preprocess drops digits)."""
+    letters = []
+    index += 26 * 26  # at least three letters, so min_len never drops a word
+    while index:
+        index, rem = divmod(index, 26)
+        letters.append(chr(ord("a") + rem))
+    return "".join(reversed(letters))
+
+
+class FakeEmbeddingModel:
+    def __init__(self, vocab_size=5000, dim=100, n_topics=50, noise=0.35, seed=0):
+        rng = np.random.default_rng(seed)
+        centres = rng.standard_normal((n_topics, dim)).astype(np.float32)
+        self.topic_of = np.arange(vocab_size) % n_topics
+        vectors = centres[self.topic_of] + noise * rng.standard_normal((vocab_size, dim)).astype(np.float32)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.index_to_key = [word_for(i) for i in range(vocab_size)]
+        self.key_to_index = {word: i for i, word in enumerate(self.index_to_key)}
+        self.vector_size = dim
+        self.n_topics = n_topics
+
+    def __contains__(self, word):
+        return word in self.key_to_index
+
+    def __getitem__(self, word):
+        return self.vectors[self.key_to_index[word]]
+
+    def topic_words(self, topic):
+        return [self.index_to_key[i] for i in np.flatnonzero(self.topic_of == topic)]
@@ -0,0 +1,284 @@
+"""In-memory stand-in for the Neo4j driver, for benchmarks only.
+
+It does not parse Cypher: each query constant the backend sends is mapped to
+a Python handler over adjacency dicts, so the routes run unchanged through
+db.py. A query with no handler raises, rather than quietly returning nothing
+and making a benchmark look faster than it is.
+"""
+import datetime
+import random
+import threading
+
+import neo4j_connection as nc
+import schedule_person_picker as spp
+
+
+def _normalise(query):
+    return " ".join(query.split())
+
+
+def _parse_iso(value):
+    return datetime.datetime.fromisoformat(value)
+
+
+def _now():
+    return datetime.datetime.now(datetime.UTC)
+
+
+class StubResult(list):
+    def single(self):
+        return self[0] if self else None
+
+    def consume(self):
+        return None
+
+
+class StubGraph:
+    """Users, interests and INTERESTED_IN links held in dicts."""
+
+    def __init__(self, seed=0):
+        self.users = {}             # user id -> {"name", "lastUpdated", "createdAt", "interestsUpdatedAt"}
+        self.interests = {}         # interest id -> {"name", "description", "vector"}
+        self.user_interests = {}    # user id -> {interest id: None}, ordered so runs repeat
+        self.interest_users = {}    # interest id -> {user id: None}
+        self.lock = threading.RLock()
+        self.random = random.Random(seed)
+        self.handlers = {_normalise(query): handler for query, handler in [
+            (nc.USER_EXISTS_QUERY, self.user_exists),
+            (nc.CREATE_USER_QUERY, self.create_user),
+            (nc.USER_INTERESTS_QUERY, self.get_user_interests),
+            (nc.USER_INTEREST_SUMMARY_QUERY, self.get_user_interest_summary),
+            (nc.PROFILE_VERSION_QUERY, self.profile_version),
+            (nc.WARM_CACHE_QUERY, self.warm_cache),
+            (nc.CLEAR_USER_INTERESTS_QUERY, self.clear_user_interests),
+            (nc.MERGE_USER_INTERESTS_QUERY, self.merge_user_interests),
+            (nc.INTEREST_VECTORS_QUERY, self.interest_vectors),
+            (nc.SOURCE_INTEREST_QUERY, self.source_interest),
+            (nc.SOURCE_VECTORS_QUERY, self.source_vectors),
+            (nc.SIMILAR_USERS_QUERY, self.similar_users),
+            (nc.SIMILAR_USERS_BATCH_QUERY, self.similar_users_batch),
+            (nc.UPDATE_USER_TIMESTAMPS_QUERY, self.update_user_timestamps),
+            (nc.USER_INTEREST_IDS_QUERY, self.user_interest_ids),
+            (nc.ELIGIBLE_USERS_QUERY, self.eligible_users),
+            (nc.SIMILAR_USERS_CANDIDATES_QUERY, self.similar_users_candidates),
+            (nc.SIMILAR_USERS_BATCH_CANDIDATES_QUERY, self.similar_users_batch_candidates),
+            (nc.USER_NAMES_QUERY, self.user_names),
+            (nc.FLUSH_USER_COOLDOWNS_QUERY, self.flush_user_cooldowns),
+            (nc.RECENT_COOLDOWNS_QUERY, self.recent_cooldowns),
+            (spp.RANDOM_USER_INTERESTS_QUERY, self.random_user_interests),
+            (spp.ALL_USERS_QUERY, self.all_users),
+        ]}
+
+    def run(self, query, params):
+        handler = self.handlers.get(_normalise(query))
+        if handler is None:
+            raise NotImplementedError(f"No stand-in for query: {_normalise(query)[:80]}")
+        with self.lock:
+            return StubResult(handler(**params))
+
+    def reset_cooldowns(self):
+        with self.lock:
+            for user in self.users.values():
+                user["lastUpdated"] = None
+
+    def _merge_user(self, user_id, name=None):
+        user = self.users.get(user_id)
+        if user is None:
+            now = _now()
+            user = self.users[user_id] = {"name": name or f"User {user_id}", "lastUpdated": now,
+                                          "createdAt": now, "interestsUpdatedAt": None}
+            self.user_interests[user_id] = {}
+            return user, True
+        return user, False
+
+    def _eligible(self, user_id, cutoff):
+        last_updated = self.users[user_id]["lastUpdated"]
+        return last_updated is None or last_updated < cutoff
+
+    def _interest_row(self, interest_id):
+        interest = self.interests[interest_id]
+        return {"id": interest_id, "name": interest["name"],
+                "description": interest["description"], "vector": interest["vector"]}
+
+    # Handlers, one per query constant
+
+    def user_exists(self, user_id):
+        return [{"count": int(user_id in self.users)}]
+
+    def create_user(self, user_id, name):
+        _, created = self._merge_user(user_id, name)
+        return [{"created": created}]
+
+    def get_user_interests(self, user_id):
+        self._merge_user(user_id)
+        return [self._interest_row(i) for i in self.user_interests[user_id]]
+
+    def get_user_interest_summary(self, user_id):
+        return [{key: value for key, value in row.items() if key != "vector"}
+                for row in self.get_user_interests(user_id)]
+
+    def profile_version(self, user_id):
+        user = self.users.get(user_id)
+        return [{"version": user.get("profileVersion")}] if user is not None else []
+
+    def warm_cache(self, limit):
+        rows = [{"name": interest["name"], "description": interest["description"],
+                 "vector": interest["vector"]}
+                for interest in self.interests.values()
+                if interest["vector"] is not None and interest["name"] is not None]
+        return rows[:limit]
+
+    def clear_user_interests(self, users):
+        now = _now()
+        for entry in users:
+            user, _ = self._merge_user(entry["user_id"], entry.get("name"))
+            user["interestsUpdatedAt"] = now
+            user["profileVersion"] = user.get("profileVersion", 0) + 1
+            for interest_id in self.user_interests[entry["user_id"]]:
+                self.interest_users[interest_id].pop(entry["user_id"], None)
+            self.user_interests[entry["user_id"]] = {}
+        return []
+
+    def merge_user_interests(self, users):
+        linked = 0
+        for entry in users:
+            if entry["user_id"] not in self.users:
+                continue
+            for interest in entry["interests"]:
+                self.interests[interest["id"]] = {"name": interest["name"],
+                                                  "description": interest["description"],
+                                                  "vector": interest["vector"]}
+                self.user_interests[entry["user_id"]][interest["id"]] = None
+                self.interest_users.setdefault(interest["id"], {})[entry["user_id"]] = None
+                linked += 1
+        return [{"linked": linked}]
+
+    def interest_vectors(self):
+        return [self._interest_row(i) for i, interest in self.interests.items()
+                if interest["vector"] is not None]
+
+    def source_interest(self, interest_id):
+        if interest_id not in self.interests:
+            return []
+        row = self._interest_row(interest_id)
+        return [{"id": row["id"], "name": row["name"], "vector": row["vector"]}]
+
+    def source_vectors(self, interest_ids):
+        return [{"id": i, "vector": self.interests[i]["vector"]} for i in interest_ids
+                if i in self.interests and self.interests[i]["vector"] is not None]
+
+    def _users_for(self, interest_ids, cutoff, limit=100):
+        matched = {}
+        for interest_id in interest_ids:
+            for user_id in self.interest_users.get(interest_id, ()):
+                if user_id not in matched and len(matched) >= limit:
+                    continue
+                if cutoff is None or self._eligible(user_id, cutoff):
+                    matched.setdefault(user_id, []).append(
+                        {"interest_id": interest_id,
+                         "interest_name": self.interests[interest_id]["name"]})
+        return [{"user_id": user_id, "user_name": self.users[user_id]["name"],
+                 "interests": interests} for user_id, interests in matched.items()]
+
+    def similar_users(self, interest_ids, one_hour_ago_iso):
+        return self._users_for(interest_ids, _parse_iso(one_hour_ago_iso))
+
+    def similar_users_batch(self, requests, one_hour_ago_iso):
+        cutoff = _parse_iso(one_hour_ago_iso)
+        return [{"source_id": req["source_id"], **row}
+                for req in requests for row in self._users_for(req["interest_ids"], cutoff)]
+
+    def similar_users_candidates(self, interest_ids, candidate_limit):
+        return self._users_for(interest_ids, None, limit=candidate_limit)
+
+    def similar_users_batch_candidates(self, requests, candidate_limit):
+        return [{"source_id": req["source_id"], **row}
+                for req in requests for row in self._users_for(req["interest_ids"], None,
+                                                               limit=candidate_limit)]
+
+    def user_names(self, user_ids):
+        return [{"user_id": user_id, "user_name": self.users[user_id]["name"]}
+                for user_id in user_ids if user_id in self.users]
+
+    def flush_user_cooldowns(self, rows):
+        for row in rows:
+            user = self.users.get(row["user_id"])
+            notified = datetime.datetime.fromtimestamp(row["notified_ms"] / 1000, datetime.UTC)
+            if user is not None and (user["lastUpdated"] is None or user["lastUpdated"] < notified):
+                user["lastUpdated"] = notified
+        return []
+
+    def recent_cooldowns(self, since_ms):
+        return [{"user_id": user_id, "notified_ms": int(user["lastUpdated"].timestamp() * 1000)}
+                for user_id, user in self.users.items()
+                if user["lastUpdated"] is not None and user["lastUpdated"].timestamp() * 1000 >= since_ms]
+
+    def update_user_timestamps(self, user_ids, current_time_iso):
+        current = _parse_iso(current_time_iso)
+        updated = 0
+        for user_id in user_ids:
+            if user_id in self.users:
+                self.users[user_id]["lastUpdated"] = current
+                updated += 1
+        return [{"updated_count": updated}]
+
+    def user_interest_ids(self):
+        return [{"user_id": user_id, "interest_ids": list(interest_ids)}
+                for user_id, interest_ids in self.user_interests.items() if interest_ids]
+
+    def eligible_users(self, user_ids, one_hour_ago_iso):
+        cutoff = _parse_iso(one_hour_ago_iso)
+        return [{"user_id": user_id, "user_name": self.users[user_id]["name"]}
+                for user_id in user_ids
+                if user_id in self.users and self._eligible(user_id, cutoff)]
+
+    def random_user_interests(self, count):
+        user_ids = [user_id for user_id, interest_ids in self.user_interests.items() if interest_ids]
+        picked = self.random.sample(user_ids, min(count, len(user_ids)))
+        return [{"user_id": user_id, "interests": list(self.user_interests[user_id])}
+                for user_id in picked]
+
+    def all_users(self):
+        rows = []
+        for user_id, user in self.users.items():
+            last_updated = user["lastUpdated"]
+            rows.append({"user_id": user_id, "interests": list(self.user_interests[user_id]),
+                         "last_notified_ms": int(last_updated.timestamp() * 1000)
+                         if last_updated else None})
+        return rows
+
+
+class StubSession:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, parameters=None, **kwargs):
+        return self.graph.run(query, {**(parameters or {}), **kwargs})
+
+    def execute_read(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    def execute_write(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    def close(self):
+        pass
+
+
+class StubDriver:
+    """Just enough of ``neo4j.Driver`` for db.py's session helpers."""
+
+    def __init__(self, graph=None):
+        self.graph = graph or StubGraph()
+
+    def session(self, **config):
+        return StubSession(self.graph)
+
+    def close(self):
+        pass
@@ -0,0 +1,57 @@
+"""Synthetic lab populations: an interest catalog and users with Zipf-distributed interests."""
+import numpy as np
+
+
+class Population:
+    def __init__(self, users, catalog, popularity_cdf):
+        self.users = users              # [{"user_id", "name", "interests": [catalog entries]}]
+        self.catalog = catalog          # [{"id", "name", "description"}]
+        self._cdf = popularity_cdf      # over catalog positions, most popular first in rank order
+
+    def __len__(self):
+        return len(self.users)
+
+    def sample_interests(self, rng, count):
+        """``count`` distinct catalog entries drawn by popularity."""
+        picked = {}
+        while len(picked) < count:
+            for position in np.searchsorted(self._cdf, rng.random(2 * count)):
+                picked.setdefault(int(position), None)
+                if len(picked) == count:
+                    break
+        return [self.catalog[position] for position in picked]
+
+
+def generate_population(n_users, model, n_interests=None, interests_per_user=5,
+                        zipf_a=1.1, seed=0):
+    """Build a population of ``n_users`` whose interest names are made of ``model`` words.
+
+    Each interest is 1-3 words from one topic of the fake model; interest
+    popularity follows a Zipf law with exponent ``zipf_a``, and each user has
+    between 1 and ``2 * interests_per_user - 1`` interests.
+    """
+    rng = np.random.default_rng(seed)
+    n_interests = n_interests or max(500, n_users // 20)
+    topic_words = [model.topic_words(topic) for topic in range(model.n_topics)]
+
+    catalog = []
+    for position in range(n_interests):
+        words = topic_words[rng.integers(len(topic_words))]
+        name = " ".join(rng.choice(words, size=rng.integers(1, 4), replace=False))
+        catalog.append({"id": position + 1, "name": name,
+                        "description": f"Synthetic interest {position + 1}"})
+
+    # Popularity by rank, with ranks shuffled so popular interests aren't the low ids
+    weights = 1.0 / np.arange(1, n_interests + 1) ** zipf_a
+    weights = weights[rng.permutation(n_interests)]
+    cdf = np.cumsum(weights / weights.sum())
+    cdf[-1] = 1.0
+
+    counts = rng.integers(1, 2 * interests_per_user, size=n_users)
+    draws = np.searchsorted(cdf, rng.random((n_users, 4 * interests_per_user)))
+    users = []
+    for n, (count, row) in enumerate(zip(counts, draws)):
+        positions = list(dict.fromkeys(row.tolist()))[:count]
+        users.append({"user_id": f"user-{n}", "name": f"User {n}",
+                      "interests": [catalog[position] for position in positions]})
+    return Population(users, catalog, cdf)
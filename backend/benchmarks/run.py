@@ -0,0 +1,236 @@
+"""Latency and throughput benchmark for the backend routes on synthetic populations.
+
+    cd backend
+    python -m benchmarks.run --sizes 1k,10k,100k --requests 200 --output bench.json
+
+Each population is seeded through the bulk import path, then every endpoint
+is called ``--requests`` times through the Flask test client against the
+in-memory stand-in in graph_stub.py (``--backend stub``, which still runs
+every Cypher round-trip through db.py) or on the in-process graph backend
+(``--backend memory``, see memory_graph.py). Cooldowns are reset before each
+endpoint so runs are comparable. The report (p50/p95/p99 latency and
+throughput per endpoint) is JSON so it can be diffed between commits.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+import db
+import embeddings
+import metrics
+from memory_graph import MemoryGraphConnection
+from neo4j_connection import MAX_BULK_USERS, Neo4jConnection
+
+from .fake_model import FakeEmbeddingModel
+from .graph_stub import StubDriver, StubGraph
+from .population import generate_population
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    if text.endswith("k"):
+        return int(float(text[:-1]) * 1000)
+    return int(text)
+
+
+def summarise(latencies, errors, elapsed):
+    ms = np.array(latencies) * 1000
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+
+
+def measure(calls):
+    """Time each zero-argument call; a falsy return counts as an error."""
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for call in calls:
+        t0 = time.perf_counter()
+        ok = call()
+        latencies.append(time.perf_counter() - t0)
+        if not ok:
+            errors += 1
+    return summarise(latencies, errors, time.perf_counter() - started)
+
+
+def reset_cooldowns(conn, graph):
+    if isinstance(conn, MemoryGraphConnection):
+        for user in conn._users.values():
+            user["lastUpdated"] = None
+    else:
+        graph.reset_cooldowns()
+    if conn.cooldowns is not None:
+        conn.cooldowns.clear()
+    conn.affinity.clear_cooled()
+
+
+def endpoint_calls(client, population, rng, requests, batch_size):
+    """Pre-built calls per endpoint, so argument generation isn't timed."""
+    import schedule_person_picker
+
+    users = population.users
+
+    def random_pick():
+        # Same shape as the scheduler: a random user, then one of their interests
+        user = users[rng.integers(len(users))]
+        while not user["interests"]:
+            user = users[rng.integers(len(users))]
+        return user["interests"][rng.integers(len(user["interests"]))]["id"]
+
+    def ok(response):
+        return response.status_code == 200
+
+    def get_profile(user_id):
+        return lambda: ok(client.get(f"/api/profile/interests/{user_id}"))
+
+    def put_profile(user_id, interests):
+        return lambda: ok(client.put(f"/api/profile/interests/{user_id}", json=interests))
+
+    def similar(interest_id):
+        return lambda: ok(client.get(f"/api/interests/similar/{interest_id}"))
+
+    def similar_batch(interest_ids):
+        return lambda: ok(client.post("/api/interests/similar:batch",
+                                      json={"interest_ids": interest_ids}))
+
+    def scheduler_pick():
+        interest_id, _ = schedule_person_picker.get_random_user_interest()
+        return interest_id is not None
+
+    return {
+        "GET /api/profile/interests/<user_id>": [
+            get_profile(users[rng.integers(len(users))]["user_id"]) for _ in range(requests)],
+        "PUT /api/profile/interests/<user_id>": [
+            put_profile(user["user_id"],
+                        population.sample_interests(rng, max(1, len(user["interests"]))))
+            for user in (users[rng.integers(len(users))] for _ in range(requests))],
+        "GET /api/interests/similar/<interest_id>": [
+            similar(random_pick()) for _ in range(requests)],
+        "POST /api/interests/similar:batch": [
+            similar_batch([random_pick() for _ in range(batch_size)]) for _ in range(requests)],
+        "schedule_person_picker.get_random_user_interest": [scheduler_pick] * requests,
+    }
+
+
+def run_population(n_users, args):
+    model = FakeEmbeddingModel(vocab_size=args.vocab, dim=args.dim, seed=args.seed)
+    embeddings.set_model(model)
+    population = generate_population(n_users, model, n_interests=args.catalog,
+                                     interests_per_user=args.interests_per_user,
+                                     zipf_a=args.zipf, seed=args.seed)
+
+    graph = StubGraph(seed=args.seed)
+    driver = StubDriver(graph)
+    # The scheduler's queries go through db.py's shared driver rather than the connection
+    db.set_driver(driver)
+    import api
+
+    if args.backend == "memory":
+        conn = MemoryGraphConnection(persistence="none")
+    else:
+        conn = Neo4jConnection(driver)
+    api.neo4j_conn = conn
+    api._schema_checked = True
+
+    started = time.perf_counter()
+    links = 0
+    for start in range(0, len(population.users), MAX_BULK_USERS):
+        links += conn.bulk_update_user_interests(
+            population.users[start:start + MAX_BULK_USERS])["links"]
+    seed_seconds = time.perf_counter() - started
+    reset_cooldowns(conn, graph)
+
+    client = api.app.test_client()
+    rng = np.random.default_rng(args.seed)
+    calls = endpoint_calls(client, population, rng, args.requests, args.batch_size)
+    if args.backend == "memory":
+        # The scheduler reads Neo4j directly, which the memory backend replaces
+        del calls["schedule_person_picker.get_random_user_interest"]
+
+    # First similarity call loads the interest index; reported separately
+    t0 = time.perf_counter()
+    calls["GET /api/interests/similar/<interest_id>"][0]()
+    cold_start_ms = (time.perf_counter() - t0) * 1000
+
+    endpoints = {}
+    for name, endpoint in calls.items():
+        reset_cooldowns(conn, graph)
+        endpoints[name] = measure(endpoint)
+        print(f"  {name}: p50 {endpoints[name]['p50_ms']}ms "
+              f"p99 {endpoints[name]['p99_ms']}ms", file=sys.stderr)
+
+    return {
+        "backend": args.backend,
+        "users": len(population.users),
+        "interests": len(population.catalog),
+        "links": links,
+        "seed_seconds": round(seed_seconds, 3),
+        "cold_start_ms": round(cold_start_ms, 3),
+        "endpoints": endpoints,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the backend routes on synthetic populations")
+    parser.add_argument("--sizes", default="1k,10k,100k",
+                        help="comma-separated user counts, e.g. 1k,10k,100k")
+    parser.add_argument("--backend", choices=["stub", "memory"], default="stub",
+                        help="Neo4j driver stand-in, or the in-process graph backend")
+    parser.add_argument("--requests", type=int, default=200, help="calls per endpoint")
+    parser.add_argument("--batch-size", type=int, default=10,
+                        help="interest ids per similar:batch call")
+    parser.add_argument("--catalog", type=int, default=None,
+                        help="number of interests (default: max(500, users / 20))")
+    parser.add_argument("--interests-per-user", type=int, default=5)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of interest popularity")
+    parser.add_argument("--vocab", type=int, default=5000, help="fake embedding vocabulary size")
+    parser.add_argument("--dim", type=int, default=100, help="fake embedding dimensions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="keep the backend's own output")
+    args = parser.parse_args(argv)
+
+    # Configured before api is imported, so the backend's own INFO/DEBUG lines stay quiet
+    metrics.configure_logging(level=metrics.LOG_LEVEL if args.verbose else "WARNING")
+
+    populations = []
+    for size in [parse_size(size) for size in args.sizes.split(",")]:
+        print(f"Benchmarking {size} users...", file=sys.stderr)
+        with open(os.devnull, "w") as devnull:
+            quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+            with quiet:
+                populations.append(run_population(size, args))
+
+    report = {
+        "generated_at": datetime.datetime.now(datetime.UTC).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("output", "verbose")},
+        "populations": populations,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Fan-out of coaster picks to subscribed coasters (asgi.py only).
+
+A coaster subscribes by user id over Server-Sent Events or a WebSocket and
+then idles until someone it should light up for is picked. The scheduler
+posts each round's picks once; ``CoasterHub.publish`` turns them into one
+message per group member and appends them to each member's subscriber
+without awaiting anything, so a round costs O(recipients) however many
+coasters are connected.
+
+Each connection's writer waits for its subscriber, then lingers
+COASTER_COALESCE_SECONDS so that everything published meanwhile goes out
+as one frame. Pending messages per connection are capped at
+COASTER_MAX_PENDING (the oldest are dropped and counted), and a send that
+takes longer than COASTER_SEND_TIMEOUT_SECONDS closes the connection, so a
+slow or stalled coaster can neither grow memory nor hold up the others.
+
+Subscriptions are per process: with several ASGI workers the scheduler has
+to reach the worker a coaster is connected to, e.g. by running one worker
+for the push channel.
+"""
+import asyncio
+import itertools
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+COASTER_COALESCE_SECONDS = float(os.getenv("COASTER_COALESCE_SECONDS", "0.05"))
+COASTER_MAX_PENDING = int(os.getenv("COASTER_MAX_PENDING", "100"))
+COASTER_SEND_TIMEOUT_SECONDS = float(os.getenv("COASTER_SEND_TIMEOUT_SECONDS", "10"))
+# Idle connections get a keep-alive this often so proxies don't close them
+COASTER_HEARTBEAT_SECONDS = float(os.getenv("COASTER_HEARTBEAT_SECONDS", "25"))
+# Upper bound on picks accepted by one dispatch request
+MAX_DISPATCH_PICKS = int(os.getenv("MAX_DISPATCH_PICKS", "1000"))
+
+
+def pick_messages(picks, sent_at=None):
+    """``(user_id, message)`` per member of every ``{picked user: [matched users]}`` group."""
+    sent_at = time.time() if sent_at is None else sent_at
+    for picked_user_id, matched_user_ids in picks.items():
+        group = [picked_user_id, *matched_user_ids]
+        for user_id in group:
+            yield user_id, {"type": "match", "user_id": user_id, "picked_user_id": picked_user_id,
+                            "matched_user_ids": [other for other in group if other != user_id],
+                            "sent_at": sent_at}
+
+
+class Subscriber:
+    """One connected coaster: a bounded list of messages waiting for the next frame."""
+
+    __slots__ = ("user_id", "seq", "pending", "max_pending", "dropped", "frames", "_ready")
+
+    def __init__(self, user_id, seq, max_pending=COASTER_MAX_PENDING):
+        self.user_id = user_id
+        self.seq = seq
+        self.pending = []
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.frames = 0
+        self._ready = asyncio.Event()
+
+    def offer(self, message):
+        if len(self.pending) >= self.max_pending:
+            # Newer picks matter more to a coaster than ones it is already behind on
+            del self.pending[0]
+            self.dropped += 1
+        self.pending.append(message)
+        self._ready.set()
+
+    async def next_frame(self, coalesce_seconds=COASTER_COALESCE_SECONDS,
+                         heartbeat_seconds=COASTER_HEARTBEAT_SECONDS):
+        """Every message published since the last frame; ``[]`` if the heartbeat interval passed first."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), heartbeat_seconds)
+        except asyncio.TimeoutError:
+            return []
+        if coalesce_seconds > 0:
+            await asyncio.sleep(coalesce_seconds)
+        self._ready.clear()
+        frame, self.pending = self.pending, []
+        self.frames += 1
+        return frame
+
+
+class CoasterHub:
+    """Subscribers by user id; must only be used from the event loop thread."""
+
+    def __init__(self, max_pending=COASTER_MAX_PENDING):
+        self.max_pending = max_pending
+        self._subscribers = {}      # user_id -> {seq: Subscriber}; a user may have several coasters
+        self._seq = itertools.count()
+        self.published = 0
+        self.delivered = 0
+        self.undelivered = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+
+    def __len__(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def subscribe(self, user_id):
+        subscriber = Subscriber(user_id, next(self._seq), self.max_pending)
+        self._subscribers.setdefault(user_id, {})[subscriber.seq] = subscriber
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscribers = self._subscribers.get(subscriber.user_id)
+        if subscribers is None:
+            return
+        subscribers.pop(subscriber.seq, None)
+        if not subscribers:
+            del self._subscribers[subscriber.user_id]
+        self.dropped += subscriber.dropped
+
+    def publish(self, picks):
+        """Queue the messages for ``{picked user: [matched users]}``; returns how many were queued."""
+        delivered = undelivered = 0
+        for user_id, message in pick_messages(picks):
+            subscribers = self._subscribers.get(user_id)
+            if not subscribers:
+                undelivered += 1
+                continue
+            for subscriber in subscribers.values():
+                subscriber.offer(message)
+                delivered += 1
+        self.published += len(picks)
+        self.delivered += delivered
+        self.undelivered += undelivered
+        return delivered
+
+    async def frames(self, subscriber):
+        """Frames for ``subscriber`` until the consumer stops iterating; then it is unsubscribed."""
+        try:
+            while True:
+                yield await subscriber.next_frame()
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def stream(self, subscriber, send, send_timeout=COASTER_SEND_TIMEOUT_SECONDS):
+        """Send frames through ``send(messages)`` until the connection goes away or stalls."""
+        frames = self.frames(subscriber)
+        try:
+            async for frame in frames:
+                try:
+                    await asyncio.wait_for(send(frame), send_timeout)
+                except asyncio.TimeoutError:
+                    self.slow_disconnects += 1
+                    return
+        finally:
+            await frames.aclose()
+
+    def stats(self):
+        return {
+            "connections": len(self),
+            "users": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "undelivered": self.undelivered,
+            "dropped": self.dropped + sum(subscriber.dropped for subscribers in self._subscribers.values()
+                                          for subscriber in subscribers.values()),
+            "slow_disconnects": self.slow_disconnects,
+        }
+
+
+def sse_frame(messages):
+    """One SSE event carrying ``messages`` as a JSON array, or a comment line as a heartbeat."""
+    if not messages:
+        return b": keepalive\n\n"
+    return b"event: picks\ndata: " + json.dumps(messages, separators=(",", ":")).encode() + b"\n\n"
@@ -0,0 +1,176 @@
+"""In-process cooldown state: who was recommended recently and may not be again yet.
+
+With ``COOLDOWN_BACKEND=store`` the similarity routes check and start cooldowns
+here instead of filtering on, and writing, ``User.lastUpdated`` in every
+request, so a GET no longer takes write locks on User nodes. Each user's
+cooldown end is a dict entry, which makes "eligible now?" a single lookup;
+the same ends are bucketed on a time wheel so expired users are dropped a
+whole bucket at a time rather than by scanning every entry.
+
+Notifications are queued and written back to ``User.lastUpdated`` in one
+batched UNWIND by the connection's sync loop, which also pulls the cooldowns
+started by other workers and the scheduler (see Neo4jConnection.sync_cooldowns).
+The state can be snapshotted to a JSON file so a restart keeps it without the
+graph.
+"""
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "graph" filters on and writes User.lastUpdated in each request (the original
+# behaviour); "store" uses the in-process CooldownStore below
+COOLDOWN_BACKEND = os.getenv("COOLDOWN_BACKEND", "graph")
+# Same variable as schedule_person_picker.py, so both agree on the window
+COOLDOWN_SECONDS = float(os.getenv("COOLDOWN_SECONDS", "3600"))
+COOLDOWN_BUCKET_SECONDS = float(os.getenv("COOLDOWN_BUCKET_SECONDS", "60"))
+# How often queued notifications are flushed to the graph and other workers' pulled
+COOLDOWN_SYNC_SECONDS = float(os.getenv("COOLDOWN_SYNC_SECONDS", "5"))
+# Write notifications back to User.lastUpdated (the scheduler and other workers read it)
+COOLDOWN_WRITE_BACK = os.getenv("COOLDOWN_WRITE_BACK", "true").lower() in ("1", "true", "yes")
+# Optional JSON snapshot, loaded on start and rewritten after every sync
+COOLDOWN_SNAPSHOT_PATH = os.getenv("COOLDOWN_SNAPSHOT_PATH", "")
+
+SNAPSHOT_VERSION = 1
+
+
+class CooldownStore:
+    """Thread-safe ``user_id -> cooldown end`` map with a time wheel for expiry."""
+
+    def __init__(self, cooldown_seconds=COOLDOWN_SECONDS, bucket_seconds=COOLDOWN_BUCKET_SECONDS,
+                 write_back=COOLDOWN_WRITE_BACK):
+        self.cooldown_seconds = cooldown_seconds
+        self.bucket_seconds = bucket_seconds
+        self.write_back = write_back
+        self._until = {}        # user_id -> epoch seconds the cooldown ends
+        self._notified = {}     # user_id -> epoch seconds of the notification that started it
+        self._wheel = {}        # bucket number -> user ids whose cooldown ends in that bucket
+        self._swept = self._bucket(time.time())
+        self._pending = {}      # user_id -> notified at, not yet written back to the graph
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.expired = 0
+        self.flushed = 0
+
+    def __len__(self):
+        return len(self._until)
+
+    def _bucket(self, timestamp):
+        return int(timestamp // self.bucket_seconds)
+
+    def _start(self, user_id, notified_at, now):
+        """Start (or extend) a cooldown; a notification older than the current one is ignored."""
+        until = notified_at + self.cooldown_seconds
+        if until <= now or until <= self._until.get(user_id, 0.0):
+            return False
+        self._until[user_id] = until
+        self._notified[user_id] = notified_at
+        self._wheel.setdefault(self._bucket(until), set()).add(user_id)
+        return True
+
+    def _sweep(self, now):
+        """Forget users whose cooldown ended in a bucket that is now wholly in the past."""
+        current = self._bucket(now)
+        while self._swept < current:
+            for user_id in self._wheel.pop(self._swept, ()):
+                # Users re-notified since are still listed in their old bucket
+                if self._bucket(self._until.get(user_id, 0.0)) == self._swept:
+                    del self._until[user_id]
+                    del self._notified[user_id]
+                    self.expired += 1
+            self._swept += 1
+            if not self._wheel:
+                self._swept = current
+
+    def eligible(self, user_id, now=None):
+        now = time.time() if now is None else now
+        return self._until.get(user_id, 0.0) <= now
+
+    def filter_eligible(self, user_ids, now=None):
+        """The ``user_ids`` not cooling down, in order."""
+        now = time.time() if now is None else now
+        until = self._until
+        return [user_id for user_id in user_ids if until.get(user_id, 0.0) <= now]
+
+    def record(self, user_ids, now=None):
+        """Start the cooldown for users that were just recommended."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._sweep(now)
+            for user_id in user_ids:
+                self._start(user_id, now, now)
+                if self.write_back:
+                    self._pending[user_id] = now
+            self.recorded += len(user_ids)
+
+    def merge(self, notified, now=None):
+        """Fold in ``{user_id: notified_at}`` seen elsewhere (the graph or a snapshot)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._sweep(now)
+            return sum(self._start(user_id, notified_at, now)
+                       for user_id, notified_at in notified.items())
+
+    def drain_pending(self):
+        """Queued ``{"user_id", "notified_at"}`` rows to write back; they are removed from the queue."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return [{"user_id": user_id, "notified_at": notified_at}
+                for user_id, notified_at in pending.items()]
+
+    def restore_pending(self, rows):
+        """Re-queue rows whose write failed, unless the user was notified again since."""
+        with self._lock:
+            for row in rows:
+                self._pending.setdefault(row["user_id"], row["notified_at"])
+
+    def mark_flushed(self, count):
+        with self._lock:
+            self.flushed += count
+
+    def clear(self):
+        with self._lock:
+            self._until.clear()
+            self._notified.clear()
+            self._wheel.clear()
+            self._pending.clear()
+
+    def save(self, path):
+        with self._lock:
+            state = {"version": SNAPSHOT_VERSION, "cooldown_seconds": self.cooldown_seconds,
+                     "notified": dict(self._notified), "pending": dict(self._pending)}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Merge a snapshot written by ``save``; returns the number of cooldowns still running."""
+        if not os.path.exists(path):
+            return 0
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported cooldown snapshot version: {state.get('version')}")
+        if self.write_back:
+            self.restore_pending([{"user_id": user_id, "notified_at": notified_at}
+                                  for user_id, notified_at in state["pending"].items()])
+        return self.merge(state["notified"])
+
+    def stats(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._sweep(now)
+            return {
+                "users": len(self._until),
+                "buckets": len(self._wheel),
+                "pending": len(self._pending),
+                "recorded": self.recorded,
+                "expired": self.expired,
+                "flushed": self.flushed,
+            }
@@ -0,0 +1,261 @@
+"""Shared, tuned Neo4j driver used by api.py, asgi.py and schedule_person_picker.py.
+
+One driver (and so one connection pool) per process. Queries go through
+``read_query`` / ``write_query``, which run as managed transactions via
+``execute_read`` / ``execute_write`` so the driver routes them to the right
+cluster member and retries transient failures.
+"""
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from dotenv import load_dotenv
+from neo4j import AsyncGraphDatabase, GraphDatabase, READ_ACCESS, WRITE_ACCESS
+
+import metrics
+
+load_dotenv()
+
+NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
+# api.py historically read NEO4J_USER and the scheduler NEO4J_USERNAME; accept both
+NEO4J_USER = os.getenv("NEO4J_USER") or os.getenv("NEO4J_USERNAME") or "neo4j"
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE") or None
+
+# Pool tuning
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "100"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "60"))
+NEO4J_CONNECTION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "30"))
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))
+NEO4J_KEEP_ALIVE = os.getenv("NEO4J_KEEP_ALIVE", "true").lower() in ("1", "true", "yes")
+
+
+class PoolMetrics:
+    """Counters describing how hard the connection pool is being used."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.sessions = 0
+        self.reads = 0
+        self.writes = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+
+    def acquire(self):
+        with self._lock:
+            self.in_use += 1
+            self.sessions += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def release(self, access_mode, elapsed, failed):
+        with self._lock:
+            self.in_use -= 1
+            self.busy_seconds += elapsed
+            if access_mode == WRITE_ACCESS:
+                self.writes += 1
+            else:
+                self.reads += 1
+            if failed:
+                self.failures += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "max_pool_size": NEO4J_MAX_POOL_SIZE,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "utilisation": self.in_use / NEO4J_MAX_POOL_SIZE,
+                "peak_utilisation": self.peak_in_use / NEO4J_MAX_POOL_SIZE,
+                "sessions": self.sessions,
+                "reads": self.reads,
+                "writes": self.writes,
+                "failures": self.failures,
+                "busy_seconds": self.busy_seconds,
+                "acquisition_timeout": NEO4J_ACQUISITION_TIMEOUT,
+                "keep_alive": NEO4J_KEEP_ALIVE,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+# Bolt round-trips: every statement is one, so transactions that run several
+# statements (e.g. the interest replace) count each of them
+bolt_queries = metrics.counter("neo4j_queries_total", "Cypher statements sent over Bolt", ("mode",))
+transaction_duration = metrics.histogram("neo4j_transaction_duration_seconds",
+                                         "Session time per managed transaction, including retries",
+                                         ("mode", "outcome"))
+metrics.register_stats("neo4j_pool", pool_metrics.snapshot)
+
+
+def _mode(access_mode):
+    return "write" if access_mode == WRITE_ACCESS else "read"
+
+_driver = None
+_driver_lock = threading.Lock()
+
+
+def _driver_config():
+    return {
+        "auth": (NEO4J_USER, NEO4J_PASSWORD),
+        "max_connection_pool_size": NEO4J_MAX_POOL_SIZE,
+        "connection_acquisition_timeout": NEO4J_ACQUISITION_TIMEOUT,
+        "connection_timeout": NEO4J_CONNECTION_TIMEOUT,
+        "max_connection_lifetime": NEO4J_MAX_CONNECTION_LIFETIME,
+        "keep_alive": NEO4J_KEEP_ALIVE,
+    }
+
+
+def create_driver():
+    return GraphDatabase.driver(NEO4J_URI, **_driver_config())
+
+
+def create_async_driver():
+    """An ``AsyncGraphDatabase`` driver with the same pool tuning, for the ASGI app."""
+    return AsyncGraphDatabase.driver(NEO4J_URI, **_driver_config())
+
+
+def get_driver():
+    """The process-wide driver, created on first use."""
+    global _driver
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                _driver = create_driver()
+    return _driver
+
+
+def set_driver(driver):
+    """Swap in a different driver (e.g. after a fork, or a stand-in for benchmarks)."""
+    global _driver
+    with _driver_lock:
+        _driver = driver
+
+
+def close_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+
+@contextmanager
+def session(access_mode=READ_ACCESS, driver=None):
+    """A pooled session that is counted in ``pool_metrics`` while it is open."""
+    driver = driver or get_driver()
+    pool_metrics.acquire()
+    started = time.perf_counter()
+    failed = False
+    try:
+        with driver.session(database=NEO4J_DATABASE, default_access_mode=access_mode) as s:
+            yield s
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        pool_metrics.release(access_mode, elapsed, failed)
+        transaction_duration.observe(elapsed, mode=_mode(access_mode),
+                                     outcome="error" if failed else "ok")
+
+
+def execute_read(work, *args, driver=None, **kwargs):
+    """Run ``work(tx, *args, **kwargs)`` as a retried read transaction."""
+    with session(READ_ACCESS, driver) as s:
+        return s.execute_read(work, *args, **kwargs)
+
+
+def execute_write(work, *args, driver=None, **kwargs):
+    """Run ``work(tx, *args, **kwargs)`` as a retried write transaction."""
+    with session(WRITE_ACCESS, driver) as s:
+        return s.execute_write(work, *args, **kwargs)
+
+
+def _fetch_all(tx, query, params):
+    return list(tx.run(query, params))
+
+
+def _run_statements(tx, statements):
+    records = []
+    for query, params in statements:
+        records = list(tx.run(query, params))
+    return records
+
+
+def write_statements(statements, driver=None):
+    """Run ``[(query, params)]`` in one write transaction and return the last statement's records."""
+    bolt_queries.inc(len(statements), mode="write")
+    return execute_write(_run_statements, statements, driver=driver)
+
+
+def read_query(query, driver=None, **params):
+    """Run one read query and return its records as a list."""
+    bolt_queries.inc(mode="read")
+    return execute_read(_fetch_all, query, params, driver=driver)
+
+
+def write_query(query, driver=None, **params):
+    """Run one write query and return its records as a list."""
+    bolt_queries.inc(mode="write")
+    return execute_write(_fetch_all, query, params, driver=driver)
+
+
+# Async twins of the helpers above, used by asgi.py with an AsyncDriver
+
+@asynccontextmanager
+async def async_session(driver, access_mode=READ_ACCESS):
+    pool_metrics.acquire()
+    started = time.perf_counter()
+    failed = False
+    try:
+        async with driver.session(database=NEO4J_DATABASE, default_access_mode=access_mode) as s:
+            yield s
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        pool_metrics.release(access_mode, elapsed, failed)
+        transaction_duration.observe(elapsed, mode=_mode(access_mode),
+                                     outcome="error" if failed else "ok")
+
+
+async def async_execute_read(driver, work, *args, **kwargs):
+    async with async_session(driver, READ_ACCESS) as s:
+        return await s.execute_read(work, *args, **kwargs)
+
+
+async def async_execute_write(driver, work, *args, **kwargs):
+    async with async_session(driver, WRITE_ACCESS) as s:
+        return await s.execute_write(work, *args, **kwargs)
+
+
+async def _async_fetch_all(tx, query, params):
+    result = await tx.run(query, params)
+    return [record async for record in result]
+
+
+async def async_read_query(driver, query, **params):
+    bolt_queries.inc(mode="read")
+    return await async_execute_read(driver, _async_fetch_all, query, params)
+
+
+async def async_write_query(driver, query, **params):
+    bolt_queries.inc(mode="write")
+    return await async_execute_write(driver, _async_fetch_all, query, params)
+
+
+async def _async_run_statements(tx, statements):
+    records = []
+    for query, params in statements:
+        result = await tx.run(query, params)
+        records = [record async for record in result]
+    return records
+
+
+async def async_write_statements(driver, statements):
+    bolt_queries.inc(len(statements), mode="write")
+    return await async_execute_write(driver, _async_run_statements, statements)
@@ -0,0 +1,103 @@
+"""Compact on-disk word embedding store.
+
+A converted model is a directory holding:
+
+- ``vocab.json``  - list of words, position = row in the matrix
+- ``vectors.npy`` - float32 matrix of shape (len(vocab), vector_size)
+- ``meta.json``   - source model name and shape
+
+The matrix is opened with ``np.load(mmap_mode='r')`` so every worker process
+shares the same pages through the OS page cache instead of holding its own
+parsed copy of the model.
+
+Convert once with:
+
+    python embedding_store.py glove-wiki-gigaword-100
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+VOCAB_FILE = "vocab.json"
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.json"
+
+DEFAULT_STORE_DIR = os.getenv(
+    "EMBEDDING_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+
+
+class EmbeddingStore:
+    """Read-only, memory-mapped word vectors with a KeyedVectors-like interface."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, VOCAB_FILE), encoding="utf-8") as f:
+            self.index_to_key = json.load(f)
+        self.key_to_index = {word: i for i, word in enumerate(self.index_to_key)}
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        self.vector_size = self.vectors.shape[1]
+        self.name = self.meta.get("model")
+
+    @staticmethod
+    def exists(path):
+        return all(os.path.exists(os.path.join(path, name))
+                   for name in (VOCAB_FILE, VECTORS_FILE, META_FILE))
+
+    def __len__(self):
+        return len(self.index_to_key)
+
+    def __contains__(self, word):
+        return word in self.key_to_index
+
+    def __getitem__(self, word):
+        return self.vectors[self.key_to_index[word]]
+
+
+def convert(model_name, out_dir):
+    """Download ``model_name`` with gensim and write it out as an EmbeddingStore."""
+    import gensim.downloader as gensim_downloader
+
+    print(f"Loading {model_name} with gensim...")
+    model = gensim_downloader.load(model_name)
+
+    target = os.path.join(out_dir, model_name)
+    tmp = target + ".tmp"
+    os.makedirs(tmp, exist_ok=True)
+
+    vectors = np.ascontiguousarray(model.vectors, dtype=np.float32)
+    np.save(os.path.join(tmp, VECTORS_FILE), vectors)
+    with open(os.path.join(tmp, VOCAB_FILE), "w", encoding="utf-8") as f:
+        json.dump(list(model.index_to_key), f, ensure_ascii=False)
+    with open(os.path.join(tmp, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "count": vectors.shape[0],
+                   "vector_size": vectors.shape[1], "dtype": "float32"}, f)
+
+    # Swap the finished directory into place so readers never see a partial store
+    if os.path.exists(target):
+        old = target + ".old"
+        os.replace(target, old)
+        os.replace(tmp, target)
+        for name in os.listdir(old):
+            os.remove(os.path.join(old, name))
+        os.rmdir(old)
+    else:
+        os.replace(tmp, target)
+
+    print(f"Wrote {vectors.shape[0]} x {vectors.shape[1]} vectors to {target}")
+    return target
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a gensim model into a memory-mapped embedding store")
+    parser.add_argument("model", help="gensim-data model name, e.g. glove-wiki-gigaword-100")
+    parser.add_argument("--out", default=DEFAULT_STORE_DIR,
+                        help="directory the store is written under (default: backend/models)")
+    args = parser.parse_args()
+    convert(args.model, args.out)
@@ -0,0 +1,283 @@
+"""Word embedding model access and text -> vector conversion.
+
+The model is loaded lazily on the first ``text_to_vector`` call rather than at
+import. A converted, memory-mapped store (see embedding_store.py) is preferred
+when one exists; otherwise the model is loaded through gensim as before.
+gensim itself (its tokenizer pulls in scipy.stats) is imported on first use
+too, so importing this module stays cheap.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+import metrics
+from embedding_cache import EmbeddingCache
+from embedding_store import DEFAULT_STORE_DIR, EmbeddingStore
+from term_weights import EMBEDDING_WEIGHTING, TERM_WEIGHTS_PATH, TermWeights
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+# Using the smaller 'glove-wiki-gigaword-100' model for demonstration
+# Can use larger models like 'word2vec-google-news-300' for better results
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "glove-wiki-gigaword-100")
+FALLBACK_EMBEDDING_MODEL = os.getenv("FALLBACK_EMBEDDING_MODEL", "glove-twitter-25")
+
+# Cache of averaged vectors keyed on the preprocessed token tuple(s)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "0"))
+
+# Look up runs of up to this many words as one phrase key ("machine_learning").
+# Only changes vectors for models with phrase keys; the default glove model has
+# none, so "machine learning" and "learning machines" still embed the same
+EMBEDDING_PHRASES = os.getenv("EMBEDDING_PHRASES", "false").lower() in ("1", "true", "yes")
+EMBEDDING_PHRASE_MAX_WORDS = int(os.getenv("EMBEDDING_PHRASE_MAX_WORDS", "3"))
+# Weight of description terms relative to name terms; 0 embeds the name only
+EMBEDDING_DESCRIPTION_WEIGHT = float(os.getenv("EMBEDDING_DESCRIPTION_WEIGHT", "0"))
+
+embedding_cache = EmbeddingCache(max_size=EMBEDDING_CACHE_SIZE,
+                                 ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS)
+metrics.register_stats("embedding_cache", embedding_cache.stats)
+
+_model = None
+_model_loaded = False
+_model_lock = threading.Lock()
+_term_weights = None
+
+
+def _load_model(name):
+    store_path = os.path.join(DEFAULT_STORE_DIR, name)
+    if EmbeddingStore.exists(store_path):
+        log.info("Opening memory-mapped embedding store", extra={"path": store_path})
+        return EmbeddingStore(store_path)
+
+    # No converted store yet: parse the model with gensim (slow, held per process)
+    import gensim.downloader as gensim_downloader
+    log.info("No embedding store, loading model with gensim", extra={"path": store_path, "model": name})
+    return gensim_downloader.load(name)
+
+
+def get_model():
+    """Return the embedding model, loading it on first use. None if nothing could be loaded."""
+    global _model, _model_loaded
+    if _model_loaded:
+        return _model
+
+    with _model_lock:
+        if _model_loaded:
+            return _model
+
+        log.info("Loading Word2Vec model", extra={"model": EMBEDDING_MODEL})
+        try:
+            _model = _load_model(EMBEDDING_MODEL)
+            log.info("Word2Vec model loaded")
+        except Exception:
+            log.exception("Error loading Word2Vec model")
+            # Fallback to a smaller model if needed
+            try:
+                _model = _load_model(FALLBACK_EMBEDDING_MODEL)
+                log.info("Fallback Word2Vec model loaded", extra={"model": FALLBACK_EMBEDDING_MODEL})
+            except Exception:
+                log.error("Could not load any Word2Vec model. Using dummy vectors.")
+                _model = None
+        _model_loaded = True
+        return _model
+
+
+def require_model():
+    """``get_model()``, raising if no model could be loaded (for the readiness stage)."""
+    model = get_model()
+    if model is None:
+        raise RuntimeError("No embedding model could be loaded; interests would get dummy vectors")
+    return model
+
+
+def set_model(model):
+    """Swap in a different model (e.g. a deterministic stand-in for benchmarks)."""
+    global _model, _model_loaded
+    with _model_lock:
+        _model = model
+        _model_loaded = True
+    embedding_cache.clear()
+
+
+def tokenize(text):
+    """Normalised token tuple for ``text``; this is the embedding cache key."""
+    from gensim.utils import simple_preprocess
+    try:
+        text = text.encode('utf-8').decode('utf-8')
+        return tuple(simple_preprocess(text))
+    except Exception as e:
+        log.warning("Error during preprocessing (encoding issue): %s", e)
+        return ()
+
+
+def warm_embedding_cache(records):
+    """Seed the cache from stored (name, description, vector) rows, e.g. existing Interest nodes.
+
+    Returns the number of entries loaded. Stored vectors are trusted as-is, so
+    re-run reembed.py after switching EMBEDDING_MODEL or the weighting settings.
+    """
+    loaded = 0
+    for record in records:
+        name_tokens = tokenize(record.get("name") or "")
+        key = _document_key(name_tokens, _description_tokens(record.get("description")))
+        vector = record.get("vector")
+        if not name_tokens or vector is None or len(vector) == 0:
+            continue
+        cached = np.asarray(vector, dtype=np.float32)
+        cached.setflags(write=False)
+        embedding_cache.put(key, cached)
+        loaded += 1
+    embedding_cache.warm_loaded += loaded
+    return loaded
+
+
+def get_term_weights():
+    """Corpus term weights for EMBEDDING_WEIGHTING, loaded once; uniform if none were fitted."""
+    global _term_weights
+    if _term_weights is not None:
+        return _term_weights
+    with _model_lock:
+        if _term_weights is None:
+            weights = TermWeights("mean")
+            if EMBEDDING_WEIGHTING != "mean":
+                try:
+                    weights = TermWeights.load(TERM_WEIGHTS_PATH, EMBEDDING_WEIGHTING)
+                    log.info("Term weights loaded", extra={"path": TERM_WEIGHTS_PATH,
+                                                           "scheme": EMBEDDING_WEIGHTING,
+                                                           "documents": weights.documents})
+                except FileNotFoundError:
+                    log.warning("No term weights fitted yet, run reembed.py; using plain means",
+                                extra={"path": TERM_WEIGHTS_PATH})
+            _term_weights = weights
+        return _term_weights
+
+
+def set_term_weights(weights):
+    """Swap in freshly fitted weights (reembed.py) and drop vectors built with the old ones."""
+    global _term_weights
+    with _model_lock:
+        _term_weights = weights
+    embedding_cache.clear()
+
+
+def _description_tokens(description):
+    if EMBEDDING_DESCRIPTION_WEIGHT <= 0 or not description:
+        return ()
+    return tokenize(description)
+
+
+def _document_key(name_tokens, description_tokens):
+    """Embedding cache key: the name's tokens, plus the description's when it is weighted in."""
+    if description_tokens:
+        return (name_tokens, description_tokens)
+    return name_tokens
+
+
+def terms(tokens, key_to_index):
+    """Model keys for ``tokens``: longest multi-word phrase first, then single words.
+
+    Models with phrase entries (e.g. word2vec-google-news-300) have
+    ``machine_learning``, so "machine learning" gets that vector rather than
+    the average of its words. Without phrase merging, or with a model that has
+    no phrase keys, word order is lost. Out-of-vocabulary words are dropped.
+    """
+    max_words = EMBEDDING_PHRASE_MAX_WORDS if EMBEDDING_PHRASES else 1
+    found = []
+    i = 0
+    while i < len(tokens):
+        for n in range(min(max_words, len(tokens) - i), 0, -1):
+            key = "_".join(tokens[i:i + n])
+            if key in key_to_index:
+                found.append(key)
+                i += n
+                break
+        else:
+            i += 1
+    return found
+
+
+def text_to_vector(text):
+    """Convert text to a vector using Word2Vec"""
+    return texts_to_vectors([text])[0]
+
+
+def texts_to_vectors(texts):
+    """Embed many texts in one pass (see ``embed_interests``)."""
+    return _embed([(text, None) for text in texts])
+
+
+def embed_interests(interests):
+    """One vector per ``{"name", "description"}`` dict, in order.
+
+    Cache hits are served directly; every remaining interest is resolved with a
+    single gather from the embedding matrix followed by a segmented weighted
+    mean, so the cost is one vectorised operation rather than a Python loop per
+    word. Terms are weighted by ``get_term_weights`` and description terms
+    additionally by EMBEDDING_DESCRIPTION_WEIGHT (0 leaves descriptions out).
+    Returns one vector (or zero list) per interest.
+    """
+    return _embed([(interest.get("name"), interest.get("description")) for interest in interests])
+
+
+def _embed(documents):
+    results = [None] * len(documents)
+    pending = {}  # (cache key, name tokens, description tokens) -> positions in ``documents``
+    for pos, (name, description) in enumerate(documents):
+        name_tokens = tokenize(name) if name else ()
+        description_tokens = _description_tokens(description)
+        key = _document_key(name_tokens, description_tokens)
+        cached = embedding_cache.get(key) if key else None
+        if cached is not None:
+            results[pos] = cached
+        else:
+            pending.setdefault((key, name_tokens, description_tokens), []).append(pos)
+
+    if not pending:
+        return results
+
+    word2vec_model = get_model()
+    if word2vec_model is None:
+        for positions in pending.values():
+            for pos in positions:
+                results[pos] = [0.0] * 25
+        return results
+
+    dim = word2vec_model.vector_size
+    key_to_index = word2vec_model.key_to_index
+    weights = get_term_weights()
+    rows, row_weights, starts, segments = [], [], [], []
+    for (key, name_tokens, description_tokens), positions in pending.items():
+        name_terms = terms(name_tokens, key_to_index)
+        description_terms = terms(description_tokens, key_to_index)
+        if not name_terms and not description_terms:
+            for pos in positions:
+                results[pos] = [0.0] * dim
+            continue
+        starts.append(len(rows))
+        for found, scale in ((name_terms, 1.0), (description_terms, EMBEDDING_DESCRIPTION_WEIGHT)):
+            rows.extend(key_to_index[term] for term in found)
+            row_weights.extend(scale * weights.weight(term) for term in found)
+        # Out-of-vocabulary words don't change the result, so "hiking!" and
+        # "hiking qwzx" share the cache entry of plain "hiking"
+        segments.append((key, _document_key(tuple(name_terms), tuple(description_terms)), positions))
+
+    if rows:
+        row_weights = np.asarray(row_weights, dtype=np.float32)
+        gathered = np.asarray(word2vec_model.vectors[np.array(rows)], dtype=np.float32)
+        sums = np.add.reduceat(gathered * row_weights[:, None], starts, axis=0)
+        means = sums / np.add.reduceat(row_weights, starts)[:, None]
+        for (key, term_key, positions), vector in zip(segments, means):
+            vector = vector.astype(np.float32)
+            vector.setflags(write=False)
+            embedding_cache.put(term_key, vector)
+            if term_key != key:
+                embedding_cache.put(key, vector)
+            for pos in positions:
+                results[pos] = vector
+    return results
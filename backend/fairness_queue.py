@@ -0,0 +1,110 @@
+"""In-memory fairness queue of users eligible for a coaster pick.
+
+Users are ordered by when they were last notified (oldest first) and a user
+only becomes eligible again once the cooldown has passed. Every operation is
+O(log n), so a scheduler tick costs the same whatever the user count.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+
+class FairnessQueue:
+    def __init__(self, cooldown_seconds=3600):
+        self.cooldown_seconds = cooldown_seconds
+        self._heap = []             # (last_notified, seq, user_id); stale entries skipped lazily
+        self._users = {}            # user_id -> {"interests": [...], "last_notified": ts, "seq": n}
+        self._in_flight = set()     # popped but not yet resolved
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._users)
+
+    def _push(self, user_id, last_notified):
+        seq = next(self._seq)
+        self._users[user_id]["last_notified"] = last_notified
+        self._users[user_id]["seq"] = seq
+        heapq.heappush(self._heap, (last_notified, seq, user_id))
+        if len(self._heap) > 2 * len(self._users) + 64:
+            self._compact()
+
+    def _compact(self):
+        """Drop stale heap entries left behind by re-pushes and removals."""
+        self._heap = [(entry["last_notified"], entry["seq"], user_id)
+                      for user_id, entry in self._users.items()]
+        heapq.heapify(self._heap)
+
+    def upsert(self, user_id, interests, last_notified=None):
+        """Add or refresh a user; users without interests are dropped from the queue."""
+        with self._lock:
+            if not interests:
+                self._users.pop(user_id, None)
+                return
+            entry = self._users.get(user_id)
+            if entry is None:
+                self._users[user_id] = {"interests": list(interests)}
+                self._push(user_id, last_notified or 0.0)
+                return
+            entry["interests"] = list(interests)
+            if last_notified is not None and last_notified != entry["last_notified"]:
+                self._push(user_id, max(last_notified, entry["last_notified"]))
+
+    def remove(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._in_flight.discard(user_id)
+
+    def mark_notified(self, user_ids, now=None):
+        """Start the cooldown for users that were just picked or recommended."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for user_id in user_ids:
+                self._in_flight.discard(user_id)
+                if user_id in self._users:
+                    self._push(user_id, now)
+
+    def release(self, user_ids):
+        """Return popped users whose pick failed, keeping their place in the queue."""
+        with self._lock:
+            for user_id in user_ids:
+                self._in_flight.discard(user_id)
+
+    def pop_eligible(self, count, now=None):
+        """Up to ``count`` (user_id, interests) pairs, longest-waiting first, past the cooldown.
+
+        Popped users stay in the queue but are skipped until ``mark_notified``
+        or ``release`` is called for them.
+        """
+        now = time.time() if now is None else now
+        cutoff = now - self.cooldown_seconds
+        picked, skipped = [], []
+        with self._lock:
+            while self._heap and len(picked) < count:
+                last_notified, seq, user_id = self._heap[0]
+                entry = self._users.get(user_id)
+                if entry is None or entry["seq"] != seq:
+                    heapq.heappop(self._heap)  # stale
+                    continue
+                if last_notified > cutoff:
+                    break  # everyone after this is still cooling down
+                heapq.heappop(self._heap)
+                if user_id in self._in_flight:
+                    skipped.append((last_notified, seq, user_id))
+                    continue
+                self._in_flight.add(user_id)
+                picked.append((user_id, list(entry["interests"])))
+                # Keep a heap entry so the user isn't lost if the pick is released
+                skipped.append((last_notified, seq, user_id))
+            for item in skipped:
+                heapq.heappush(self._heap, item)
+        return picked
+
+    def stats(self, now=None):
+        now = time.time() if now is None else now
+        cutoff = now - self.cooldown_seconds
+        with self._lock:
+            eligible = sum(1 for entry in self._users.values() if entry["last_notified"] <= cutoff)
+            return {"users": len(self._users), "eligible": eligible,
+                    "in_flight": len(self._in_flight), "heap_size": len(self._heap)}
@@ -0,0 +1,21 @@
+"""Pick the graph backend behind the API.
+
+``GRAPH_BACKEND=neo4j`` (default) talks to Neo4j over Bolt; ``memory`` keeps
+the whole graph in process (memory_graph.py) for single-node installs.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "neo4j")
+
+
+def create_connection(backend=GRAPH_BACKEND):
+    """A Neo4jConnection, or its in-memory equivalent."""
+    if backend == "memory":
+        from memory_graph import MemoryGraphConnection
+        return MemoryGraphConnection()
+    from neo4j_connection import Neo4jConnection
+    return Neo4jConnection()
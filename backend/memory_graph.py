@@ -0,0 +1,369 @@
+"""In-process graph backend with the same interface as Neo4jConnection.
+
+Users, interests and INTERESTED_IN links live in adjacency dicts and the
+interest vectors in the array-backed InterestIndex, so single-node installs
+answer profile reads and similarity calls without a Bolt round-trip.
+Select it with ``GRAPH_BACKEND=memory`` (see graph_backend.py).
+
+Every change is a small JSON entry applied in memory and then persisted:
+
+- ``write-through``: appended to ``<path>.log`` before the call returns; the
+  log is folded into a snapshot once it reaches MEMORY_GRAPH_COMPACT_ENTRIES
+- ``snapshot``: the whole graph is written to ``<path>`` every
+  MEMORY_GRAPH_SNAPSHOT_SECONDS when it changed, and on close
+- ``none``: nothing is written
+
+On start the snapshot is loaded and any log entries after it are replayed.
+"""
+import atexit
+import datetime
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from neo4j_connection import Neo4jConnection, compute
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+MEMORY_GRAPH_PATH = os.getenv("MEMORY_GRAPH_PATH",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "graph.json"))
+# "write-through", "snapshot" or "none"
+MEMORY_GRAPH_PERSISTENCE = os.getenv("MEMORY_GRAPH_PERSISTENCE", "write-through")
+MEMORY_GRAPH_SNAPSHOT_SECONDS = float(os.getenv("MEMORY_GRAPH_SNAPSHOT_SECONDS", "60"))
+MEMORY_GRAPH_COMPACT_ENTRIES = int(os.getenv("MEMORY_GRAPH_COMPACT_ENTRIES", "10000"))
+# fsync every log append; slower, but a power cut can't lose acknowledged writes
+MEMORY_GRAPH_FSYNC = os.getenv("MEMORY_GRAPH_FSYNC", "false").lower() in ("1", "true", "yes")
+
+# Same cap as the LIMIT in SIMILAR_USERS_QUERY, so both backends rank the same candidates
+CANDIDATE_USERS_LIMIT = 100
+
+SNAPSHOT_VERSION = 1
+
+
+def _epoch(iso):
+    return datetime.datetime.fromisoformat(iso).timestamp()
+
+
+def _in_memory(method):
+    """Override a Neo4jConnection flow with ``method``, run as one in-process step."""
+    @functools.wraps(method)
+    def flow(self, *args):
+        return (yield compute(method, self, *args))
+    return flow
+
+
+class MemoryGraphConnection(Neo4jConnection):
+    # There is no database to run a vector search in
+    similarity_backend = "index"
+
+    def __init__(self, path=MEMORY_GRAPH_PATH, persistence=MEMORY_GRAPH_PERSISTENCE):
+        self.path = path
+        self.persistence = persistence
+        self._users = {}            # user id -> {"name", "lastUpdated", "createdAt", "interestsUpdatedAt"}
+        self._interests = {}        # interest id -> {"name", "description", "vector"}
+        self._user_interests = {}   # user id -> {interest id: None}
+        self._interest_users = {}   # interest id -> {user id: None}
+        self._lock = threading.RLock()
+        self._log = None
+        self._log_entries = 0
+        self._dirty = False
+        self._closed = False
+        self._cooldowns_seeded = False
+        self._load()
+        # No driver: every flow that would reach one is overridden below. The
+        # parent starts the cooldown sync, which reads the graph loaded above.
+        super().__init__(driver=None)
+
+        self.interest_index.rebuild(
+            {"id": interest_id, **interest} for interest_id, interest in self._interests.items())
+        log.info("Memory graph loaded", extra={"users": len(self._users),
+                                               "interests": len(self._interests),
+                                               "persistence": self.persistence})
+
+        if self.persistence == "write-through":
+            self._open_log()
+        elif self.persistence == "snapshot":
+            threading.Thread(target=self._snapshot_loop, name="graph-snapshot", daemon=True).start()
+        if self.persistence != "none":
+            atexit.register(self.close)
+
+    def close(self):
+        # Flushes queued cooldowns through _record, so before the log is closed
+        self._stop_cooldown_sync()
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self.persistence == "snapshot" and self._dirty:
+                self._write_snapshot()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    # Mutations: every change goes through _apply so replay and live writes match
+
+    def _apply(self, entry):
+        op = entry["op"]
+        if op == "create_user":
+            self._users.setdefault(entry["user_id"], {
+                "name": entry["name"], "lastUpdated": entry["at"],
+                "createdAt": entry["at"], "interestsUpdatedAt": None})
+            self._user_interests.setdefault(entry["user_id"], {})
+        elif op == "set_interests":
+            user_id = entry["user_id"]
+            self._apply({"op": "create_user", "user_id": user_id,
+                         "name": entry.get("name") or f"User {user_id}", "at": entry["at"]})
+            self._users[user_id]["interestsUpdatedAt"] = entry["at"]
+            for interest_id in self._user_interests[user_id]:
+                self._interest_users[interest_id].pop(user_id, None)
+            self._user_interests[user_id] = {}
+            for interest in entry["interests"]:
+                self._interests[interest["id"]] = {"name": interest["name"],
+                                                   "description": interest["description"],
+                                                   "vector": interest["vector"]}
+                self._user_interests[user_id][interest["id"]] = None
+                self._interest_users.setdefault(interest["id"], {})[user_id] = None
+        elif op == "touch":
+            for user_id in entry["user_ids"]:
+                if user_id in self._users:
+                    self._users[user_id]["lastUpdated"] = entry["at"]
+        elif op == "cooldowns":
+            for user_id, notified_at in entry["notified"].items():
+                user = self._users.get(user_id)
+                if user is not None and (user["lastUpdated"] is None or user["lastUpdated"] < notified_at):
+                    user["lastUpdated"] = notified_at
+        else:
+            raise ValueError(f"Unknown graph log entry: {op}")
+
+    def _record(self, entry):
+        """Apply one change and persist it according to the persistence mode."""
+        with self._lock:
+            self._apply(entry)
+            self._dirty = True
+            if self._log is not None:
+                self._log.write(json.dumps(entry) + "\n")
+                self._log.flush()
+                if MEMORY_GRAPH_FSYNC:
+                    os.fsync(self._log.fileno())
+                self._log_entries += 1
+                if self._log_entries >= MEMORY_GRAPH_COMPACT_ENTRIES:
+                    self._compact()
+
+    # Persistence
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            for user in snapshot["users"]:
+                user_id = user.pop("id")
+                interest_ids = user.pop("interests")
+                self._users[user_id] = user
+                self._user_interests[user_id] = dict.fromkeys(interest_ids)
+                for interest_id in interest_ids:
+                    self._interest_users.setdefault(interest_id, {})[user_id] = None
+            for interest in snapshot["interests"]:
+                self._interests[interest.pop("id")] = interest
+
+        log_path = self.path + ".log"
+        if os.path.exists(log_path):
+            replayed = 0
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-append; nothing after it was acknowledged
+                        log.warning("Ignoring truncated entry at the end of the graph log",
+                                    extra={"path": log_path})
+                        break
+                    self._apply(entry)
+                    replayed += 1
+            self._log_entries = replayed
+            if replayed:
+                log.info("Replayed graph log", extra={"entries": replayed, "path": log_path})
+
+    def _open_log(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._log = open(self.path + ".log", "a", encoding="utf-8")
+
+    def _write_snapshot(self):
+        """Write the whole graph atomically (temp file + rename)."""
+        with self._lock:
+            snapshot = {
+                "version": SNAPSHOT_VERSION,
+                "users": [{"id": user_id, **user, "interests": list(self._user_interests[user_id])}
+                          for user_id, user in self._users.items()],
+                "interests": [{"id": interest_id, **interest}
+                              for interest_id, interest in self._interests.items()],
+            }
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _compact(self):
+        """Fold the log into a fresh snapshot and start an empty log."""
+        with self._lock:
+            self._write_snapshot()
+            self._log.close()
+            self._log = open(self.path + ".log", "w", encoding="utf-8")
+            self._log_entries = 0
+        log.info("Compacted graph log", extra={"path": self.path})
+
+    def _snapshot_loop(self):
+        while not self._closed:
+            time.sleep(MEMORY_GRAPH_SNAPSHOT_SECONDS)
+            if self._dirty and not self._closed:
+                try:
+                    self._write_snapshot()
+                except Exception:
+                    log.exception("Error writing graph snapshot")
+
+    # Storage behind the Neo4jConnection flows: every step is in-process work
+
+    def _step(self, kind, target, args):
+        if kind in ("read", "write", "transaction"):
+            raise NotImplementedError(f"The memory graph has no Cypher to run ({kind} step)")
+        return super()._step(kind, target, args)
+
+    def _interest_index_stale(self):
+        # The index is updated on every write, so it is never stale
+        return False
+
+    @_in_memory
+    def _user_exists(self, user_id):
+        return user_id in self._users
+
+    @_in_memory
+    def _create_user(self, user_id, user_data):
+        with self._lock:
+            if user_id in self._users:
+                return False
+            self._record({"op": "create_user", "user_id": user_id,
+                          "name": user_data.get("name", f"User {user_id}"), "at": time.time()})
+            return True
+
+    @_in_memory
+    def _get_user_interests(self, user_id, include_vectors):
+        with self._lock:
+            if user_id not in self._users:
+                self._record({"op": "create_user", "user_id": user_id,
+                              "name": f"User {user_id}", "at": time.time()})
+            interests = [{"id": interest_id, **self._interests[interest_id]}
+                         for interest_id in self._user_interests[user_id]]
+        if not include_vectors:
+            for interest in interests:
+                del interest["vector"]
+        return interests
+
+    @_in_memory
+    def _profile_version(self, user_id):
+        # One process holds the whole graph, so any value that changes on save will do
+        with self._lock:
+            user = self._users.get(user_id)
+            return None if user is None else user["interestsUpdatedAt"]
+
+    @_in_memory
+    def _stored_interest_vectors(self, limit):
+        with self._lock:
+            return [{"name": interest["name"], "description": interest["description"],
+                     "vector": interest["vector"]}
+                    for interest in itertools.islice(self._interests.values(), limit)]
+
+    @_in_memory
+    def _replace_interests(self, users):
+        now = time.time()
+        with self._lock:
+            for user in users:
+                self._record({"op": "set_interests", "user_id": user["user_id"],
+                              "name": user["name"], "interests": user["interests"], "at": now})
+        return sum(len(user["interests"]) for user in users)
+
+    @_in_memory
+    def _user_interest_ids(self):
+        with self._lock:
+            return [(user_id, list(interest_ids))
+                    for user_id, interest_ids in self._user_interests.items() if interest_ids]
+
+    @_in_memory
+    def _source_interest(self, interest_id):
+        with self._lock:
+            interest = self._interests.get(interest_id)
+            return None if interest is None else {"id": interest_id, **interest}
+
+    @_in_memory
+    def _source_vectors(self, interest_ids):
+        with self._lock:
+            return {interest_id: self._interests[interest_id]["vector"] for interest_id in interest_ids
+                    if self._interests.get(interest_id, {}).get("vector") is not None}
+
+    def _eligible(self, user_id, cutoff):
+        if self.cooldowns is not None:
+            return self.cooldowns.eligible(user_id)
+        last_updated = self._users[user_id]["lastUpdated"]
+        return last_updated is None or last_updated < cutoff
+
+    def _candidate_users(self, interest_ids, cutoff):
+        """What SIMILAR_USERS_QUERY returns: users past the cooldown holding any of the interests."""
+        matched = {}
+        with self._lock:
+            for interest_id in interest_ids:
+                for user_id in self._interest_users.get(interest_id, ()):
+                    if user_id not in matched and len(matched) >= CANDIDATE_USERS_LIMIT:
+                        continue
+                    if self._eligible(user_id, cutoff):
+                        matched.setdefault(user_id, []).append(
+                            {"interest_id": interest_id,
+                             "interest_name": self._interests[interest_id]["name"]})
+            return [{"user_id": user_id, "user_name": self._users[user_id]["name"],
+                     "interests": interests} for user_id, interests in matched.items()]
+
+    @_in_memory
+    def _similar_users(self, interest_ids, limit, one_hour_ago_iso):
+        return self._candidate_users(interest_ids, _epoch(one_hour_ago_iso))
+
+    @_in_memory
+    def _similar_users_batch(self, requests_param, limit, one_hour_ago_iso):
+        cutoff = _epoch(one_hour_ago_iso)
+        return [{"source_id": request["source_id"], **user} for request in requests_param
+                for user in self._candidate_users(request["interest_ids"], cutoff)]
+
+    @_in_memory
+    def _eligible_user_records(self, user_ids, one_hour_ago_iso):
+        cutoff = _epoch(one_hour_ago_iso)
+        with self._lock:
+            return [{"user_id": user_id, "user_name": self._users[user_id]["name"]}
+                    for user_id in user_ids
+                    if user_id in self._users and self._eligible(user_id, cutoff)]
+
+    @_in_memory
+    def _touch_users(self, user_ids, current_time_iso):
+        self._record({"op": "touch", "user_ids": list(user_ids), "at": _epoch(current_time_iso)})
+
+    @_in_memory
+    def _flush_cooldowns(self, rows):
+        # One "cooldowns" entry per sync instead of a "touch" entry per request
+        self._record({"op": "cooldowns", "notified": {row["user_id"]: row["notified_at"] for row in rows}})
+
+    @_in_memory
+    def _recent_cooldowns(self, since):
+        # Nothing else writes this graph, so only the first sync (the seed) has anything new
+        if self._cooldowns_seeded:
+            return {}
+        self._cooldowns_seeded = True
+        with self._lock:
+            return {user_id: user["lastUpdated"] for user_id, user in self._users.items()
+                    if user["lastUpdated"] is not None and user["lastUpdated"] >= since}
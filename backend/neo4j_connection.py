@@ -0,0 +1,1167 @@
+"""Neo4jConnection: the graph queries and scoring behind the profile and similarity routes.
+
+The Cypher lives in module-level constants. Each operation is written once, as
+a flow (see ``read`` and friends below) that yields its queries and CPU-bound
+steps, so the async twin in asgi.py and the in-memory backend in
+memory_graph.py run exactly the same logic with their own I/O.
+"""
+import datetime
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+import db
+from affinity import AffinityModel
+from cooldown_store import (COOLDOWN_BACKEND, COOLDOWN_SECONDS, COOLDOWN_SNAPSHOT_PATH,
+                            COOLDOWN_SYNC_SECONDS, CooldownStore)
+from embeddings import embed_interests, embedding_cache, warm_embedding_cache
+from interest_index import InterestIndex
+from metrics import span
+from profile_cache import ProfileCache, render
+from schema import INTEREST_VECTOR_INDEX
+from vector_codec import VECTOR_STORAGE, decode_records, decode_vector, encode_rows, vector_to_list
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+# In-process interest index configuration
+# "exact" scans the whole catalog; "ivf" only scans the closest clusters once it is large
+INTEREST_INDEX_BACKEND = os.getenv("INTEREST_INDEX_BACKEND", "exact")
+# "float32", or "int8" codes with a per-row scale (a quarter of the memory)
+INTEREST_INDEX_PRECISION = os.getenv("INTEREST_INDEX_PRECISION", "float32")
+# int8 only: re-score the best limit * this candidates in float16 (0 disables)
+INTEREST_INDEX_RERANK = int(os.getenv("INTEREST_INDEX_RERANK", "4"))
+# Reload from Neo4j periodically so writes made by other workers are picked up
+INTEREST_INDEX_REFRESH_SECONDS = float(os.getenv("INTEREST_INDEX_REFRESH_SECONDS", "300"))
+# Upper bound on interest ids accepted by the batch similarity endpoint
+MAX_SIMILAR_BATCH_SIZE = int(os.getenv("MAX_SIMILAR_BATCH_SIZE", "500"))
+# Upper bound on users accepted by the bulk interest import endpoint
+MAX_BULK_USERS = int(os.getenv("MAX_BULK_USERS", "1000"))
+# Seed the embedding cache from stored Interest vectors before the first profile save
+EMBEDDING_CACHE_WARM_START = os.getenv("EMBEDDING_CACHE_WARM_START", "false").lower() in ("1", "true", "yes")
+
+# "index" scores in-process against InterestIndex; "neo4j" uses the native vector
+# index (see schema.py) via db.index.vector.queryNodes so scoring runs in the database
+SIMILARITY_BACKEND = os.getenv("SIMILARITY_BACKEND", "index")
+
+# "cypher" finds candidate users with a graph traversal per pick; "affinity" ranks
+# them from the precomputed matrices in affinity.py and only asks Neo4j which
+# of the top candidates are out of their cooldown
+USER_RANKING_BACKEND = os.getenv("USER_RANKING_BACKEND", "cypher")
+# Candidates ranked per pick = limit * this, to leave room for users still cooling down
+AFFINITY_OVERFETCH = int(os.getenv("AFFINITY_OVERFETCH", "5"))
+# COOLDOWN_BACKEND=store: candidates read per pick = limit * this, before the
+# users still cooling down are dropped in process
+COOLDOWN_OVERFETCH = int(os.getenv("COOLDOWN_OVERFETCH", "10"))
+# Most similar interests kept per interest in the affinity similarity matrix
+AFFINITY_NEIGHBOURS = int(os.getenv("AFFINITY_NEIGHBOURS", "50"))
+
+# Fill picks that found fewer than ``limit`` users from the users whose interest
+# centroids are nearest the picker's (or the interest's) vector, see affinity.py
+GLOBAL_FALLBACK = os.getenv("GLOBAL_FALLBACK", "false").lower() in ("1", "true", "yes")
+# Candidates are widened until the pick is full or this much of the request has passed
+GLOBAL_FALLBACK_BUDGET_MS = float(os.getenv("GLOBAL_FALLBACK_BUDGET_MS", "50"))
+# First round of candidates per missing user
+GLOBAL_FALLBACK_OVERFETCH = int(os.getenv("GLOBAL_FALLBACK_OVERFETCH", "4"))
+
+# Rendered GET /api/profile/interests responses, per user (see profile_cache.py).
+# Entries are checked against User.profileVersion, so they are safe with several
+# workers; 0 turns the cache off and every GET runs the interests query
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "30"))
+
+SIMILARITY_THRESHOLD = 0.5 # Adjust as needed
+
+USER_EXISTS_QUERY = """
+    MATCH (u:User {id: $user_id})
+    RETURN count(u) as count
+"""
+
+CREATE_USER_QUERY = """
+    MERGE (u:User {id: $user_id})
+    ON CREATE SET u.name = $name, u.lastUpdated = datetime(),
+                  u.createdAt = datetime()
+    // datetime() is fixed per statement, so this only matches a node created just now
+    RETURN u.createdAt = datetime() AS created
+"""
+
+# Create user if not exists and read its interests in the same round-trip
+USER_INTERESTS_QUERY = """
+    MERGE (u:User {id: $user_id})
+    ON CREATE SET u.name = 'User ' + toString($user_id),
+                  u.lastUpdated = datetime(), u.createdAt = datetime()
+    WITH u
+    MATCH (u)-[:INTERESTED_IN]->(i:Interest)
+    RETURN i.id AS id, i.name AS name, i.description AS description,
+           i.vector AS vector
+"""
+
+# Same without the vectors, for clients that only display the interests
+USER_INTEREST_SUMMARY_QUERY = """
+    MERGE (u:User {id: $user_id})
+    ON CREATE SET u.name = 'User ' + toString($user_id),
+                  u.lastUpdated = datetime(), u.createdAt = datetime()
+    WITH u
+    MATCH (u)-[:INTERESTED_IN]->(i:Interest)
+    RETURN i.id AS id, i.name AS name, i.description AS description
+"""
+
+# Bumped by every save of the user's interests; a seek on the User id constraint
+PROFILE_VERSION_QUERY = """
+    MATCH (u:User {id: $user_id})
+    RETURN u.profileVersion AS version
+"""
+
+WARM_CACHE_QUERY = """
+    MATCH (i:Interest)
+    WHERE i.vector IS NOT NULL AND i.name IS NOT NULL
+    RETURN i.name AS name, i.description AS description, i.vector AS vector
+    LIMIT $limit
+"""
+
+# Create missing users and clear their existing interests
+CLEAR_USER_INTERESTS_QUERY = """
+    UNWIND $users AS entry
+    MERGE (u:User {id: entry.user_id})
+    ON CREATE SET u.name = coalesce(entry.name, 'User ' + toString(entry.user_id)),
+                  u.lastUpdated = datetime(), u.createdAt = datetime()
+    // Lets the scheduler sync only users whose interests changed, and every
+    // worker's profile cache see that its entry is out of date
+    SET u.interestsUpdatedAt = datetime(),
+        u.profileVersion = coalesce(u.profileVersion, 0) + 1
+    WITH u
+    OPTIONAL MATCH (u)-[r:INTERESTED_IN]->()
+    DELETE r
+"""
+
+# Use MERGE for both nodes and relationships to prevent duplication
+MERGE_USER_INTERESTS_QUERY = """
+    UNWIND $users AS entry
+    MATCH (u:User {id: entry.user_id})
+    UNWIND entry.interests AS interest
+    MERGE (i:Interest {id: interest.id})
+    SET i.name = interest.name, i.description = interest.description,
+        i.vector = interest.vector
+    MERGE (u)-[:INTERESTED_IN]->(i)
+    RETURN count(*) AS linked
+"""
+
+INTEREST_VECTORS_QUERY = """
+    MATCH (i:Interest)
+    WHERE i.vector IS NOT NULL
+    RETURN i.id AS id, i.name AS name, i.description AS description, i.vector AS vector
+"""
+
+SOURCE_INTEREST_QUERY = """
+    MATCH (i:Interest)
+    WHERE i.id = $interest_id
+    RETURN i.id AS id, i.name AS name, i.vector AS vector
+"""
+
+SOURCE_VECTORS_QUERY = """
+    MATCH (i:Interest)
+    WHERE i.id IN $interest_ids AND i.vector IS NOT NULL
+    RETURN i.id AS id, i.vector AS vector
+"""
+
+# Neo4j reports cosine scores as (1 + cos) / 2; convert back to plain cosine.
+# k is the requested limit + 1 so the source itself can be dropped.
+VECTOR_SEARCH_QUERY = f"""
+    CALL db.index.vector.queryNodes('{INTEREST_VECTOR_INDEX}', $k, $vector)
+    YIELD node, score
+    WHERE node.id <> $interest_id
+    RETURN node.id AS id, node.name AS name, node.description AS description,
+           2 * score - 1 AS similarity
+"""
+
+VECTOR_SEARCH_BATCH_QUERY = f"""
+    MATCH (source:Interest)
+    WHERE source.id IN $interest_ids AND source.vector IS NOT NULL
+    CALL db.index.vector.queryNodes('{INTEREST_VECTOR_INDEX}', $k, source.vector)
+    YIELD node, score
+    WHERE node.id <> source.id
+    RETURN source.id AS source_id, node.id AS id, node.name AS name,
+           node.description AS description, 2 * score - 1 AS similarity
+"""
+
+SIMILAR_USERS_QUERY = """
+MATCH (u:User)-[r:INTERESTED_IN]->(i:Interest)
+WHERE i.id IN $interest_ids
+// Use standard datetime comparison if u.lastUpdated is stored as DateTime
+AND (u.lastUpdated IS NULL OR u.lastUpdated < datetime($one_hour_ago_iso))
+WITH u, i, r
+ORDER BY u.id, i.id // Ordering here might not be necessary if only collecting interests per user
+RETURN u.id AS user_id, u.name AS user_name,
+    collect(distinct {interest_id: i.id, interest_name: i.name}) AS interests
+LIMIT 100 // Limit the number of users fetched initially
+"""
+
+# One UNWIND round-trip fetches candidate users for every source interest
+SIMILAR_USERS_BATCH_QUERY = """
+UNWIND $requests AS req
+CALL {
+    WITH req
+    MATCH (u:User)-[:INTERESTED_IN]->(i:Interest)
+    WHERE i.id IN req.interest_ids
+    AND (u.lastUpdated IS NULL OR u.lastUpdated < datetime($one_hour_ago_iso))
+    WITH u, collect(distinct {interest_id: i.id, interest_name: i.name}) AS interests
+    RETURN u.id AS user_id, u.name AS user_name, interests
+    LIMIT 100
+}
+RETURN req.source_id AS source_id, user_id, user_name, interests
+"""
+
+USER_INTEREST_IDS_QUERY = """
+    MATCH (u:User)-[:INTERESTED_IN]->(i:Interest)
+    RETURN u.id AS user_id, collect(i.id) AS interest_ids
+"""
+
+# Which of the affinity candidates may be recommended right now
+ELIGIBLE_USERS_QUERY = """
+    MATCH (u:User)
+    WHERE u.id IN $user_ids
+    AND (u.lastUpdated IS NULL OR u.lastUpdated < datetime($one_hour_ago_iso))
+    RETURN u.id AS user_id, u.name AS user_name
+"""
+
+# Ensure you are storing datetime objects in Neo4j for this comparison
+UPDATE_USER_TIMESTAMPS_QUERY = """
+MATCH (u:User)
+WHERE u.id IN $user_ids
+SET u.lastUpdated = datetime($current_time_iso)
+RETURN count(u) as updated_count
+"""
+
+# COOLDOWN_BACKEND=store: the cooldown is checked in-process (cooldown_store.py)
+# on the rows these return, so they read a few times more candidates than needed
+SIMILAR_USERS_CANDIDATES_QUERY = """
+MATCH (u:User)-[r:INTERESTED_IN]->(i:Interest)
+WHERE i.id IN $interest_ids
+WITH u, i, r
+ORDER BY u.id, i.id
+RETURN u.id AS user_id, u.name AS user_name,
+    collect(distinct {interest_id: i.id, interest_name: i.name}) AS interests
+LIMIT $candidate_limit
+"""
+
+SIMILAR_USERS_BATCH_CANDIDATES_QUERY = """
+UNWIND $requests AS req
+CALL {
+    WITH req
+    MATCH (u:User)-[:INTERESTED_IN]->(i:Interest)
+    WHERE i.id IN req.interest_ids
+    WITH u, collect(distinct {interest_id: i.id, interest_name: i.name}) AS interests
+    RETURN u.id AS user_id, u.name AS user_name, interests
+    LIMIT $candidate_limit
+}
+RETURN req.source_id AS source_id, user_id, user_name, interests
+"""
+
+USER_NAMES_QUERY = """
+    MATCH (u:User)
+    WHERE u.id IN $user_ids
+    RETURN u.id AS user_id, u.name AS user_name
+"""
+
+# Queued notifications, written back in one statement; never moves lastUpdated backwards
+FLUSH_USER_COOLDOWNS_QUERY = """
+    UNWIND $rows AS row
+    MATCH (u:User {id: row.user_id})
+    WITH u, datetime({epochMillis: row.notified_ms}) AS notified
+    WHERE u.lastUpdated IS NULL OR u.lastUpdated < notified
+    SET u.lastUpdated = notified
+"""
+
+# Cooldowns started by other workers, the scheduler or user creation (range index seek)
+RECENT_COOLDOWNS_QUERY = """
+    MATCH (u:User)
+    WHERE u.lastUpdated >= datetime({epochMillis: $since_ms})
+    RETURN u.id AS user_id, u.lastUpdated.epochMillis AS notified_ms
+"""
+
+
+# Steps yielded by the flows below. A flow is a generator method holding the
+# logic of one operation; it yields each piece of I/O or CPU-bound work it
+# needs as a step and gets the result back. Neo4jConnection._run does the
+# steps in the calling thread, AsyncNeo4jConnection (asgi.py) awaits them on
+# the async driver, so both serve from the same code.
+
+def read(query, **params):
+    """A read query; the flow gets its records."""
+    return ("read", query, params)
+
+
+def write(query, **params):
+    """A write query; the flow gets its records."""
+    return ("write", query, params)
+
+
+def transaction(*statements):
+    """``(query, params)`` statements in one write transaction; the flow gets the last one's records."""
+    return ("transaction", statements, None)
+
+
+def compute(fn, *args):
+    """CPU-bound work, kept off the event loop in the async app."""
+    return ("compute", fn, args)
+
+
+def exclusive(flow):
+    """Run ``flow`` as a sub-flow while holding the connection's reload lock."""
+    return ("exclusive", flow, None)
+
+
+def background(flow):
+    """Start ``flow`` on its own (a thread, or a task in the async app) without waiting for it."""
+    return ("background", flow, None)
+
+
+class Neo4jConnection:
+    similarity_backend = SIMILARITY_BACKEND
+
+    def __init__(self, driver=None):
+        # None shares the process-wide pooled driver from db.py, looked up per query
+        self.driver = driver
+        if self.similarity_backend == "neo4j" and VECTOR_STORAGE != "float":
+            raise ValueError("SIMILARITY_BACKEND=neo4j needs VECTOR_STORAGE=float: "
+                             "the native vector index only reads float arrays")
+        self.interest_index = InterestIndex(backend=INTEREST_INDEX_BACKEND,
+                                            precision=INTEREST_INDEX_PRECISION,
+                                            rerank=INTEREST_INDEX_RERANK)
+        self.affinity = AffinityModel(threshold=SIMILARITY_THRESHOLD, neighbours=AFFINITY_NEIGHBOURS)
+        self._affinity_refreshing = False
+        self.profile_cache = ProfileCache(max_size=PROFILE_CACHE_SIZE,
+                                          ttl_seconds=PROFILE_CACHE_TTL_SECONDS)
+        self._embedding_cache_warmed = not EMBEDDING_CACHE_WARM_START
+        # Held while the interest index or the affinity matrices reload
+        self._reload_lock = threading.RLock()
+        self._init_cooldowns()
+
+    def close(self):
+        self._stop_cooldown_sync()
+        if self.driver is None:
+            db.close_driver()
+        else:
+            self.driver.close()
+
+    def _run(self, flow):
+        """Drive ``flow`` to its return value, doing every step in this thread."""
+        value, error = None, None
+        while True:
+            try:
+                step = flow.send(value) if error is None else flow.throw(error)
+            except StopIteration as done:
+                return done.value
+            try:
+                value, error = self._step(*step), None
+            except Exception as e:
+                value, error = None, e
+
+    def _step(self, kind, target, args):
+        if kind == "read":
+            return db.read_query(target, driver=self.driver, **args)
+        if kind == "write":
+            return db.write_query(target, driver=self.driver, **args)
+        if kind == "transaction":
+            return db.write_statements(target, driver=self.driver)
+        if kind == "compute":
+            return target(*args)
+        if kind == "exclusive":
+            with self._reload_lock:
+                return self._run(target)
+        if kind == "background":
+            threading.Thread(target=self._run, args=(target,), name="background-flow", daemon=True).start()
+            return None
+        raise ValueError(f"Unknown flow step: {kind}")
+
+    # Public interface: each call runs the flow of the same name (awaitable in asgi.py)
+
+    def user_exists(self, user_id):
+        return self._run(self._user_exists(user_id))
+
+    def create_user(self, user_id, user_data=None):
+        """Create the user if missing; returns True if a new node was created."""
+        return self._run(self._create_user(user_id, user_data or {}))
+
+    def get_user_interests(self, user_id, include_vectors=True):
+        return self._run(self._get_user_interests(user_id, include_vectors))
+
+    def get_user_profile(self, user_id, include_vectors=True):
+        """``(body, etag)`` of the user's interests as JSON, from the profile cache when fresh."""
+        return self._run(self._get_user_profile(user_id, include_vectors))
+
+    def warm_embedding_cache(self):
+        """Load stored Interest name/vector pairs into the embedding cache."""
+        return self._run(self._warm_embedding_cache())
+
+    def update_user_interests(self, user_id, interests):
+        """Replace a user's interests in one write transaction."""
+        return self._run(self._update_user_interests(user_id, interests))
+
+    def bulk_update_user_interests(self, entries):
+        """Replace the interests of many users at once.
+
+        ``entries`` is a list of ``{"user_id": ..., "interests": [...], "name": optional}``.
+        Every interest name is embedded in one batched pass, then the deletes and
+        all MERGEs run inside a single write transaction (retried by the driver
+        on transient errors). Returns counts of users and links written.
+        """
+        return self._run(self._bulk_update_user_interests(entries))
+
+    def find_similar_users(self, user_id, limit=10):
+        """Users whose interests are closest to ``user_id``'s, from the affinity matrices."""
+        return self._run(self._find_similar_users(user_id, limit))
+
+    def find_similar_interests(self, interest_id, limit=10, user_id=None):
+        return self._run(self._find_similar_interests(interest_id, limit, user_id))
+
+    def find_similar_interests_batch(self, interest_ids, limit=10, user_ids=None):
+        """Similar interests and recommended users for many source interests in one pass.
+
+        ``user_ids`` optionally names the picker of each interest, whose
+        centroid then drives the global fallback for that pick.
+        """
+        return self._run(self._find_similar_interests_batch(interest_ids, limit, user_ids))
+
+    def sync_cooldowns(self, pull=True):
+        """Write queued notifications back to the graph and fold in everyone else's.
+
+        Returns the number of notifications written. Rows whose write fails are
+        queued again for the next sync.
+        """
+        return self._run(self._sync_cooldowns(pull))
+
+    # Profiles
+
+    def _user_exists(self, user_id):
+        log.debug("user_exists", extra={"user_id": user_id})
+        records = yield read(USER_EXISTS_QUERY, user_id=user_id)
+        return bool(records) and records[0]["count"] > 0
+
+    def _create_user(self, user_id, user_data):
+        log.debug("create_user", extra={"user_id": user_id})
+        records = yield write(CREATE_USER_QUERY, user_id=user_id,
+                              name=user_data.get("name", f"User {user_id}"))
+        return bool(records) and records[0]["created"]
+
+    def _get_user_interests(self, user_id, include_vectors):
+        log.debug("get_user_interests", extra={"user_id": user_id})
+        query = USER_INTERESTS_QUERY if include_vectors else USER_INTEREST_SUMMARY_QUERY
+        records = yield write(query, user_id=user_id)
+        if not include_vectors:
+            return [dict(record) for record in records]
+        return [{**record, "vector": vector_to_list(record["vector"])} for record in records]
+
+    def _get_user_profile(self, user_id, include_vectors):
+        if self.profile_cache.max_size <= 0:
+            return render((yield from self._get_user_interests(user_id, include_vectors)))
+        # Read before the interests: a save in between leaves the entry under the old version
+        version = yield from self._profile_version(user_id)
+        key = (user_id, include_vectors)
+        cached = self.profile_cache.get(key, version)
+        if cached is not None:
+            return cached
+        generation = self.profile_cache.generation
+        rendered = render((yield from self._get_user_interests(user_id, include_vectors)))
+        self.profile_cache.put(key, rendered, generation, version)
+        return rendered
+
+    def _profile_version(self, user_id):
+        records = yield read(PROFILE_VERSION_QUERY, user_id=user_id)
+        return records[0]["version"] if records else None
+
+    def _warm_embedding_cache(self):
+        self._embedding_cache_warmed = True
+        records = yield from self._stored_interest_vectors(embedding_cache.max_size)
+        loaded = yield compute(warm_embedding_cache, records)
+        log.info("Embedding cache warmed from stored interest vectors", extra={"loaded": loaded})
+        return loaded
+
+    def _stored_interest_vectors(self, limit):
+        """Up to ``limit`` stored ``{"name", "description", "vector"}`` rows."""
+        return decode_records((yield read(WARM_CACHE_QUERY, limit=limit)))
+
+    def _update_user_interests(self, user_id, interests):
+        log.debug("update_user_interests", extra={"user_id": user_id, "interests": len(interests)})
+        try:
+            yield from self._bulk_update_user_interests([{"user_id": user_id, "interests": interests}])
+            return True
+        except Exception:
+            log.exception("Error adding interests", extra={"user_id": user_id})
+            return False
+
+    def _bulk_update_user_interests(self, entries):
+        if not self._embedding_cache_warmed:
+            try:
+                yield from self._warm_embedding_cache()
+            except Exception:
+                log.exception("Error warming embedding cache")
+
+        with span("update_interests.embed"):
+            users = yield compute(self._prepare_interest_rows, entries)
+        with span("update_interests.write"):
+            linked = yield from self._replace_interests(users)
+        with span("update_interests.index"):
+            yield compute(self._index_interest_rows, users)
+        return {"users": len(users), "links": linked}
+
+    @staticmethod
+    def _prepare_interest_rows(entries):
+        """Embed every interest in one batch and shape the rows for the UNWIND writes."""
+        all_interests = [interest for entry in entries for interest in entry["interests"]]
+        vectors = embed_interests(all_interests)
+
+        users = []
+        vector_iter = iter(vectors)
+        for entry in entries:
+            rows = []
+            for interest in entry["interests"]:
+                vector = next(vector_iter)
+                rows.append({
+                    "id": interest['id'],
+                    "name": interest['name'],
+                    "description": interest.get('description', ''),
+                    "vector": vector.tolist() if isinstance(vector, np.ndarray) else vector
+                })
+            users.append({"user_id": entry["user_id"], "name": entry.get("name"),
+                          "interests": rows})
+        return users
+
+    def _replace_interests(self, users):
+        """Clear the users' interest links and write the new ones; returns the links written."""
+        records = yield transaction(
+            (CLEAR_USER_INTERESTS_QUERY,
+             {"users": [{"user_id": user["user_id"], "name": user["name"]} for user in users]}),
+            (MERGE_USER_INTERESTS_QUERY, {"users": encode_rows(users)}))
+        return records[0]["linked"]
+
+    def _index_interest_rows(self, users):
+        # Keep the in-process index in step with the graph once the transaction has committed
+        self.profile_cache.invalidate([user["user_id"] for user in users])
+        for user in users:
+            for row in user["interests"]:
+                self.interest_index.upsert(row["id"], row["vector"],
+                                           name=row["name"], description=row["description"])
+            # Only this user's row of the affinity matrices changes; a rebuild
+            # in progress replays it
+            if self.affinity.loaded_at is not None or self.affinity.rebuilding:
+                self.affinity.update_user(user["user_id"],
+                                          [row["id"] for row in user["interests"]],
+                                          self.interest_index)
+
+    @staticmethod
+    def cosine_similarity(a, b):
+        a, b = np.array(a), np.array(b)
+        norm_a = np.linalg.norm(a)
+        norm_b = np.linalg.norm(b)
+        if norm_a == 0 or norm_b == 0:
+            return 0.0
+        return np.dot(a, b) / (norm_a * norm_b)
+
+    # In-process index and affinity matrices
+
+    def _interest_index_stale(self):
+        index = self.interest_index
+        return (index.loaded_at is None
+                or time.monotonic() - index.loaded_at >= INTEREST_INDEX_REFRESH_SECONDS)
+
+    def _rebuild_interest_index(self, records):
+        index = self.interest_index
+        index.rebuild(decode_records(records))
+        log.info("Interest index loaded", extra={"interests": len(index), "backend": index.backend,
+                                                 "precision": index.precision, "bytes": index.nbytes})
+        return index
+
+    def _ensure_interest_index(self):
+        """Load every Interest vector into the in-process index if it is empty or stale."""
+        if self._interest_index_stale():
+            # Only one caller reloads; the others wait and reuse its result
+            yield exclusive(self._reload_interest_index())
+        return self.interest_index
+
+    def _reload_interest_index(self):
+        if self._interest_index_stale():
+            records = yield read(INTEREST_VECTORS_QUERY)
+            yield compute(self._rebuild_interest_index, records)
+
+    def _affinity_stale(self):
+        # Rebuilt together with the interest index so both see the same catalog
+        return (self.affinity.loaded_at is None
+                or self.affinity.loaded_at < self.interest_index.loaded_at)
+
+    def _rebuild_affinity(self, memberships):
+        self.affinity.rebuild(self.interest_index, memberships)
+        log.info("Affinity matrices loaded", extra={"users": len(self.affinity)})
+        return self.affinity
+
+    def _ensure_affinity(self):
+        """Load the affinity matrices on first use; later refreshes run in the background."""
+        yield from self._ensure_interest_index()
+        if self.affinity.loaded_at is None:
+            yield exclusive(self._reload_affinity())
+        elif self._affinity_stale() and not self._affinity_refreshing:
+            # Requests keep ranking with the current matrices while they are rebuilt
+            self._affinity_refreshing = True
+            yield background(self._refresh_affinity())
+        return self.affinity
+
+    def _refresh_affinity(self):
+        try:
+            yield exclusive(self._reload_affinity())
+        except Exception:
+            log.exception("Affinity rebuild failed")
+        finally:
+            self._affinity_refreshing = False
+
+    def _reload_affinity(self):
+        if self._affinity_stale():
+            # Profile updates from here on are replayed on top of the rebuilt matrices
+            self.affinity.track_updates()
+            memberships = yield from self._user_interest_ids()
+            yield compute(self._rebuild_affinity, memberships)
+
+    def _user_interest_ids(self):
+        """``[(user_id, interest ids)]`` for every user with interests."""
+        records = yield read(USER_INTEREST_IDS_QUERY)
+        return [(record["user_id"], record["interest_ids"]) for record in records]
+
+    def _affinity_candidates(self, similar_by_source, limit):
+        """Top affinity-ranked user ids per source interest: one sparse product each."""
+        candidates = {}
+        for source_id, similar in similar_by_source.items():
+            if similar:
+                weights = {item["id"]: item["similarity"] for item in similar}
+                top = self.affinity.top_users(weights, k=limit * AFFINITY_OVERFETCH)
+                candidates[source_id] = [user_id for user_id, _ in top]
+        return candidates
+
+    def _affinity_user_records(self, similar_by_source, candidates, eligible_records):
+        """Shape eligible candidates like SIMILAR_USERS_BATCH_QUERY rows for score_users."""
+        eligible = {record["user_id"]: record["user_name"] for record in eligible_records}
+        records = []
+        for source_id, user_ids in candidates.items():
+            names = {item["id"]: item["name"] for item in similar_by_source[source_id]}
+            for user_id in user_ids:
+                if user_id not in eligible:
+                    continue
+                records.append({
+                    "source_id": source_id,
+                    "user_id": user_id,
+                    "user_name": eligible[user_id],
+                    "interests": [{"interest_id": i, "interest_name": names[i]}
+                                  for i in self.affinity.user_interests(user_id) if i in names]
+                })
+        return records
+
+    def _eligible_user_records(self, user_ids, one_hour_ago_iso):
+        """``{"user_id", "user_name"}`` for those of ``user_ids`` out of their cooldown."""
+        if self.cooldowns is not None:
+            # Cooldowns are checked in-process; Neo4j only supplies the names
+            user_ids = self.cooldowns.filter_eligible(user_ids)
+            return (yield read(USER_NAMES_QUERY, user_ids=user_ids)) if user_ids else []
+        if not user_ids:
+            return []
+        return (yield read(ELIGIBLE_USERS_QUERY, user_ids=user_ids, one_hour_ago_iso=one_hour_ago_iso))
+
+    def _affinity_users(self, similar_by_source, limit, one_hour_ago_iso):
+        yield from self._ensure_affinity()
+        candidates = yield compute(self._affinity_candidates, similar_by_source, limit)
+        user_ids = sorted({user_id for ids in candidates.values() for user_id in ids})
+        eligible_records = yield from self._eligible_user_records(user_ids, one_hour_ago_iso)
+        return self._affinity_user_records(similar_by_source, candidates, eligible_records)
+
+    # Global fallback
+
+    def _fallback_queries(self, requests):
+        """Query vector per ``(source_id, user_id, need, exclude)``: the picker's centroid, else the interest's.
+
+        None when neither exists (or the vector is all zeros), since ranking
+        users against it would return arbitrary ones.
+        """
+        queries = []
+        for source_id, user_id, _, _ in requests:
+            query = self.affinity.user_centroid(user_id) if user_id is not None else None
+            if query is None:
+                query = self.interest_index.get_vector(source_id)
+            queries.append(query if query is not None and np.any(query) else None)
+        return queries
+
+    @staticmethod
+    def _scored_fallback(requests, queries):
+        """Positions of the requests that have a query vector, with those requests and vectors."""
+        positions = [pos for pos, query in enumerate(queries) if query is not None]
+        return positions, [requests[pos] for pos in positions], [queries[pos] for pos in positions]
+
+    @staticmethod
+    def _assign_fallback(requests, candidates, names):
+        """Best eligible candidates per request, in request order, never placing a user twice."""
+        taken = set()
+        results = []
+        complete = True
+        for (_, user_id, need, exclude), ranked in zip(requests, candidates):
+            picked = []
+            for candidate_id, score in ranked:
+                if len(picked) >= need:
+                    break
+                if names.get(candidate_id) is None or candidate_id == user_id \
+                        or candidate_id in exclude or candidate_id in taken:
+                    continue
+                picked.append({"user_id": candidate_id, "user_name": names[candidate_id],
+                               "interests": [], "score": score, "match": "global"})
+                taken.add(candidate_id)
+            complete = complete and len(picked) >= need
+            results.append(picked)
+        return results, complete
+
+    def _global_fallback(self, requests, one_hour_ago_iso, started):
+        """Users for each request's shortfall from the nearest user centroids over the whole graph.
+
+        ``requests`` are ``(source_id, picker user_id or None, need, exclude)``.
+        Users this process has put in their cooldown are masked out of the scan
+        and the rest are checked like affinity candidates. The candidate count
+        grows 4x per round until every request is full, every user has been
+        ranked, or GLOBAL_FALLBACK_BUDGET_MS since ``started`` has passed; the
+        first round always runs. A request with no query vector gets no users.
+        """
+        yield from self._ensure_affinity()
+        results = [[] for _ in requests]
+        queries = yield compute(self._fallback_queries, requests)
+        positions, requests, queries = self._scored_fallback(requests, queries)
+        if not positions:
+            return results
+        names = {}  # user id -> name if eligible, None if still cooling down
+        k = max(need for _, _, need, _ in requests) * GLOBAL_FALLBACK_OVERFETCH
+        while True:
+            candidates = yield compute(self.affinity.nearest_users, queries, k)
+            unchecked = sorted({user_id for ranked in candidates for user_id, _ in ranked} - names.keys())
+            names.update(dict.fromkeys(unchecked))
+            for record in (yield from self._eligible_user_records(unchecked, one_hour_ago_iso)):
+                names[record["user_id"]] = record["user_name"]
+            filled, complete = self._assign_fallback(requests, candidates, names)
+            if complete or k >= len(self.affinity) \
+                    or (time.perf_counter() - started) * 1000 >= GLOBAL_FALLBACK_BUDGET_MS:
+                break
+            k *= 4
+        for pos, users in zip(positions, filled):
+            results[pos] = users
+        return results
+
+    @staticmethod
+    def _batch_fallback_requests(results, user_ids, limit, notified):
+        """Positions of batch results short of ``limit`` users, with their fallback requests."""
+        positions, requests = [], []
+        for pos, result in enumerate(results):
+            need = limit - len(result["recommended_users"])
+            if need > 0 and result["found"]:
+                positions.append(pos)
+                requests.append((result["interest_id"], user_ids[pos] if user_ids else None,
+                                 need, notified))
+        return positions, requests
+
+    @staticmethod
+    def _apply_batch_fallback(results, positions, filled, notified):
+        for pos, users in zip(positions, filled):
+            results[pos]["recommended_users"] += users
+            notified.update(user["user_id"] for user in users)
+
+    # Candidate users
+
+    def _similar_users(self, interest_ids, limit, one_hour_ago_iso):
+        """Candidate users holding any of ``interest_ids`` who are out of their cooldown."""
+        if self.cooldowns is not None:
+            records = yield read(SIMILAR_USERS_CANDIDATES_QUERY, interest_ids=interest_ids,
+                                 candidate_limit=limit * COOLDOWN_OVERFETCH)
+            return self._out_of_cooldown(records)
+        return (yield read(SIMILAR_USERS_QUERY, interest_ids=interest_ids,
+                           one_hour_ago_iso=one_hour_ago_iso))
+
+    def _similar_users_batch(self, requests_param, limit, one_hour_ago_iso):
+        if self.cooldowns is not None:
+            records = yield read(SIMILAR_USERS_BATCH_CANDIDATES_QUERY, requests=requests_param,
+                                 candidate_limit=limit * COOLDOWN_OVERFETCH)
+            return self._out_of_cooldown(records)
+        return (yield read(SIMILAR_USERS_BATCH_QUERY, requests=requests_param,
+                           one_hour_ago_iso=one_hour_ago_iso))
+
+    def _out_of_cooldown(self, records):
+        """The candidate ``records`` whose user the cooldown store says may be recommended."""
+        eligible = set(self.cooldowns.filter_eligible([record["user_id"] for record in records]))
+        return [record for record in records if record["user_id"] in eligible]
+
+    def _find_similar_users(self, user_id, limit):
+        yield from self._ensure_affinity()
+        similar = yield compute(self.affinity.similar_users, user_id, limit)
+        return [{"user_id": other_id, "score": score} for other_id, score in similar]
+
+    @staticmethod
+    def score_users(users, interest_weights, limit):
+        """Score candidate users by the summed similarity of their matching interests."""
+        user_scores = []
+        for user in users:
+            score = 0.0 # Use float for score
+            matched_user_interests = [] # Store interests that contributed to score
+            for interest in user["interests"]:
+                interest_id = interest["interest_id"]
+                if interest_id in interest_weights:
+                    score += interest_weights[interest_id]
+                    matched_user_interests.append(interest) # Add this interest
+
+            # Only include users who actually matched one of the target interests
+            if score > 0:
+                user_scores.append({
+                    "user_id": user["user_id"],
+                    "user_name": user["user_name"],
+                    "interests": matched_user_interests, # Show only relevant interests? Or all? user["interests"]
+                    "score": score
+                })
+
+        # Sort users by score and return top results (apply limit to users here)
+        sorted_users = sorted(user_scores, key=lambda x: x["score"], reverse=True)
+        return sorted_users[:limit] # Apply limit to *users*
+
+    # Cooldowns
+
+    def _update_user_timestamps(self, user_ids, current_time_iso):
+        """Start the one hour cooldown for users that were just recommended."""
+        if not user_ids:
+            return
+        self.affinity.mark_cooled(user_ids, time.time() + COOLDOWN_SECONDS)
+        if self.cooldowns is not None:
+            # Written back to User.lastUpdated in batches by sync_cooldowns
+            self.cooldowns.record(user_ids, datetime.datetime.fromisoformat(current_time_iso).timestamp())
+            return
+        try:
+            yield from self._touch_users(user_ids, current_time_iso)
+        except Exception:
+            log.exception("Error updating user timestamps")
+            # Decide if you want to fail the whole operation or just log the error
+
+    def _touch_users(self, user_ids, current_time_iso):
+        update_result = yield write(UPDATE_USER_TIMESTAMPS_QUERY,
+                                    user_ids=user_ids,
+                                    current_time_iso=current_time_iso)
+        update_count = update_result[0]["updated_count"]
+        log.debug("Updated lastUpdated timestamps", extra={"users": update_count})
+
+    # With COOLDOWN_BACKEND=store (see cooldown_store.py)
+
+    def _init_cooldowns(self):
+        self.cooldowns = None
+        self._cooldown_stop = threading.Event()
+        if COOLDOWN_BACKEND != "store":
+            return
+        self.cooldowns = CooldownStore()
+        if COOLDOWN_SNAPSHOT_PATH:
+            loaded = self.cooldowns.load(COOLDOWN_SNAPSHOT_PATH)
+            log.info("Cooldown snapshot loaded", extra={"path": COOLDOWN_SNAPSHOT_PATH, "cooling": loaded})
+        if COOLDOWN_SYNC_SECONDS > 0:
+            self._start_cooldown_sync()
+
+    def _start_cooldown_sync(self):
+        threading.Thread(target=self._cooldown_loop, name="cooldown-sync", daemon=True).start()
+
+    def _cooldown_loop(self):
+        # The first pass seeds the store from the graph
+        while True:
+            try:
+                self.sync_cooldowns()
+            except Exception:
+                log.exception("Cooldown sync failed")
+            if self._cooldown_stop.wait(COOLDOWN_SYNC_SECONDS):
+                return
+
+    def _stop_cooldown_sync(self):
+        if self.cooldowns is None or self._cooldown_stop.is_set():
+            return
+        self._cooldown_stop.set()
+        try:
+            self.sync_cooldowns(pull=False)
+        except Exception:
+            log.exception("Final cooldown sync failed")
+
+    def _sync_cooldowns(self, pull):
+        rows = self.cooldowns.drain_pending()
+        if rows:
+            try:
+                yield from self._flush_cooldowns(rows)
+            except Exception:
+                self.cooldowns.restore_pending(rows)
+                raise
+            self.cooldowns.mark_flushed(len(rows))
+        if pull:
+            since = time.time() - self.cooldowns.cooldown_seconds
+            self.cooldowns.merge((yield from self._recent_cooldowns(since)))
+        if COOLDOWN_SNAPSHOT_PATH:
+            yield compute(self.cooldowns.save, COOLDOWN_SNAPSHOT_PATH)
+        return len(rows)
+
+    @staticmethod
+    def _cooldown_flush_rows(rows):
+        return [{"user_id": row["user_id"], "notified_ms": int(row["notified_at"] * 1000)}
+                for row in rows]
+
+    def _flush_cooldowns(self, rows):
+        yield write(FLUSH_USER_COOLDOWNS_QUERY, rows=self._cooldown_flush_rows(rows))
+
+    def _recent_cooldowns(self, since):
+        """``{user_id: notified_at}`` for every cooldown the graph has started since ``since``."""
+        records = yield read(RECENT_COOLDOWNS_QUERY, since_ms=int(since * 1000))
+        return {record["user_id"]: record["notified_ms"] / 1000 for record in records}
+
+    @staticmethod
+    def _cooldown_window():
+        """Current time and the cooldown cut-off, both as ISO strings for Neo4j."""
+        current_dt = datetime.datetime.now(datetime.UTC)
+
+        # UNCOMMENT FOR DEBUG / REMOVE ONE HOUR TIME COOLDOWN
+        #one_hour_ago_dt = current_dt
+        one_hour_ago_dt = current_dt - datetime.timedelta(seconds=COOLDOWN_SECONDS)
+
+        # Format for Neo4j (ISO 8601 format usually works well)
+        return current_dt.isoformat(), one_hour_ago_dt.isoformat()
+
+    # Similar interests
+
+    @staticmethod
+    def _similar_interests(index, source_record, limit):
+        """Score the source against every indexed interest in one matrix-vector product."""
+        top_candidates = index.top_k(decode_vector(source_record["vector"]), k=limit,
+                                     exclude_ids=[source_record["id"]],
+                                     threshold=SIMILARITY_THRESHOLD)
+        log.debug("Scored indexed interests", extra={"interests": len(index)})
+
+        # Prepare the similar interests result list
+        similar_interests_results = []
+        for candidate in top_candidates:
+            similar_interests_results.append({
+                "id": candidate["id"],
+                "name": candidate["name"],
+                "description": candidate["description"],
+                "similarity": candidate["similarity"]
+            })
+        return similar_interests_results
+
+    @staticmethod
+    def _similar_from_records(records, limit):
+        """Apply the threshold and limit to rows returned by the vector index queries."""
+        similar = [
+            {"id": record["id"], "name": record["name"],
+             "description": record["description"] or "",
+             "similarity": record["similarity"]}
+            for record in records if record["similarity"] > SIMILARITY_THRESHOLD
+        ]
+        similar.sort(key=lambda item: item["similarity"], reverse=True)
+        return similar[:limit]
+
+    def _similar_interests_in_db(self, source_record, limit):
+        records = yield read(VECTOR_SEARCH_QUERY, k=limit + 1,
+                             vector=source_record["vector"],
+                             interest_id=source_record["id"])
+        return self._similar_from_records(records, limit)
+
+    def _source_interest(self, interest_id):
+        """``{"id", "name", "vector"}`` of the interest, or None if there is no such interest."""
+        records = yield read(SOURCE_INTEREST_QUERY, interest_id=interest_id)
+        return records[0] if records else None
+
+    def _find_similar_interests(self, interest_id, limit, user_id):
+        log.debug("find_similar_interests", extra={"interest_id": interest_id, "limit": limit})
+        started = time.perf_counter()
+
+        final_results = {
+            "similar_interests": [],
+            "recommended_users": [],
+            "timestamp": None
+        }
+
+        # Get the source interest vector
+        with span("find_similar_interests.source_fetch"):
+            source_record = yield from self._source_interest(int(interest_id))
+        if source_record is None or source_record["vector"] is None:
+            # Nothing similar, but still a timestamp
+            log.debug("No source interest or it has no vector", extra={"interest_id": interest_id})
+            final_results["timestamp"] = datetime.datetime.now(datetime.UTC).isoformat()
+            return final_results
+
+        log.debug("Source interest", extra={"interest_id": source_record["id"],
+                                            "interest_name": source_record["name"]})
+
+        if self.similarity_backend == "neo4j":
+            with span("find_similar_interests.vector_search"):
+                similar_interests_results = yield from self._similar_interests_in_db(source_record, limit)
+        else:
+            with span("find_similar_interests.index_load"):
+                index = yield from self._ensure_interest_index()
+            with span("find_similar_interests.interest_scoring"):
+                similar_interests_results = yield compute(self._similar_interests, index, source_record, limit)
+        final_results["similar_interests"] = similar_interests_results
+
+        # --- Datetime calculation using the new method ---
+        current_time_iso, one_hour_ago_iso = self._cooldown_window()
+
+        # Update the timestamp in the final results
+        final_results["timestamp"] = current_time_iso
+
+        # --- Find users ---
+        similar_interest_ids = [item["id"] for item in similar_interests_results]
+
+        # Proceed only if we found similar interests (or can fall back to a global search)
+        users = []
+        if similar_interest_ids:
+            with span("find_similar_interests.user_query"):
+                if USER_RANKING_BACKEND == "affinity":
+                    users = yield from self._affinity_users({source_record["id"]: similar_interests_results},
+                                                            limit, one_hour_ago_iso)
+                else:
+                    users = yield from self._similar_users(similar_interest_ids, limit, one_hour_ago_iso)
+        elif not GLOBAL_FALLBACK:
+            log.debug("No sufficiently similar interests found to recommend users")
+            return final_results # Return interests found (if any) and timestamp
+        log.debug("Candidate users with relevant interests", extra={"users": len(users)})
+
+        # Calculate user scores based on weighted interests
+        # Create weight map from the *actual* similar interests found and limited
+        with span("find_similar_interests.user_scoring"):
+            interest_weights = {item["id"]: item["similarity"] for item in similar_interests_results}
+            top_users = yield compute(self.score_users, users, interest_weights, limit)
+        if GLOBAL_FALLBACK and len(top_users) < limit:
+            with span("find_similar_interests.global_fallback"):
+                top_users += (yield from self._global_fallback(
+                    [(source_record["id"], user_id, limit - len(top_users),
+                      {user["user_id"] for user in top_users})],
+                    one_hour_ago_iso, started))[0]
+        final_results["recommended_users"] = top_users
+
+        # --- Update timestamps for recommended users ---
+        top_user_ids = [user["user_id"] for user in top_users]
+        with span("find_similar_interests.timestamp_update"):
+            yield from self._update_user_timestamps(top_user_ids, current_time_iso)
+
+        return final_results
+
+    @staticmethod
+    def _batch_sources(index, interest_ids):
+        """Source vectors already in the index, plus the ids that must be fetched."""
+        sources = {}
+        missing = []
+        for interest_id in interest_ids:
+            vector = index.get_vector(interest_id)
+            if vector is None:
+                missing.append(interest_id)
+            else:
+                sources[interest_id] = vector
+        return sources, missing
+
+    def _source_vectors(self, interest_ids):
+        """``{id: vector}`` for those of ``interest_ids`` that exist and have a vector."""
+        records = yield read(SOURCE_VECTORS_QUERY, interest_ids=interest_ids)
+        return {record["id"]: decode_vector(record["vector"]) for record in records}
+
+    @staticmethod
+    def _batch_similar_interests(index, interest_ids, sources, limit):
+        """All N x M source/catalog scores in one batched product, top-k per source."""
+        found_ids = [interest_id for interest_id in interest_ids if interest_id in sources]
+        if not found_ids:
+            return {}
+        batch = index.top_k_batch([sources[i] for i in found_ids], k=limit,
+                                  exclude_ids=[[i] for i in found_ids],
+                                  threshold=SIMILARITY_THRESHOLD)
+        return dict(zip(found_ids, batch))
+
+    @classmethod
+    def _batch_similar_from_records(cls, records, limit):
+        by_source = {}
+        for record in records:
+            by_source.setdefault(record["source_id"], []).append(record)
+        return {source_id: cls._similar_from_records(rows, limit)
+                for source_id, rows in by_source.items()}
+
+    @staticmethod
+    def _batch_user_requests(similar_by_source):
+        return [
+            {"source_id": source_id,
+             "interest_ids": [item["id"] for item in similar]}
+            for source_id, similar in similar_by_source.items() if similar
+        ]
+
+    @classmethod
+    def _rank_batch(cls, interest_ids, sources, similar_by_source, user_records, limit):
+        """Per-interest results in request order plus the set of users to cool down.
+
+        A user recommended for an earlier interest in the batch is not
+        recommended again, matching what N sequential calls would have
+        produced under the cooldown.
+        """
+        users_by_source = {}
+        for record in user_records:
+            users_by_source.setdefault(record["source_id"], []).append(record)
+
+        results = []
+        notified = set()
+        for interest_id in interest_ids:
+            similar = similar_by_source.get(interest_id, [])
+            interest_weights = {item["id"]: item["similarity"] for item in similar}
+            candidates = [user for user in users_by_source.get(interest_id, [])
+                          if user["user_id"] not in notified]
+            top_users = cls.score_users(candidates, interest_weights, limit)
+            notified.update(user["user_id"] for user in top_users)
+            results.append({
+                "interest_id": interest_id,
+                "found": interest_id in sources,
+                "similar_interests": similar,
+                "recommended_users": top_users
+            })
+        return results, notified
+
+    def _find_similar_interests_batch(self, interest_ids, limit, user_ids):
+        log.debug("find_similar_interests_batch",
+                  extra={"interests": len(interest_ids), "limit": limit})
+        started = time.perf_counter()
+        interest_ids = [int(interest_id) for interest_id in interest_ids]
+        current_time_iso, one_hour_ago_iso = self._cooldown_window()
+
+        if self.similarity_backend == "neo4j":
+            with span("find_similar_interests_batch.vector_search"):
+                records = yield read(VECTOR_SEARCH_BATCH_QUERY, interest_ids=interest_ids, k=limit + 1)
+            similar_by_source = self._batch_similar_from_records(records, limit)
+            sources = {record["source_id"]: None for record in records}
+        else:
+            with span("find_similar_interests_batch.index_load"):
+                index = yield from self._ensure_interest_index()
+
+            # Source vectors from the index, falling back to one query for any it lacks
+            with span("find_similar_interests_batch.source_fetch"):
+                sources, missing = self._batch_sources(index, interest_ids)
+                if missing:
+                    sources.update((yield from self._source_vectors(missing)))
+
+            with span("find_similar_interests_batch.interest_scoring"):
+                similar_by_source = yield compute(self._batch_similar_interests,
+                                                  index, interest_ids, sources, limit)
+
+        requests_param = self._batch_user_requests(similar_by_source)
+        user_records = []
+        with span("find_similar_interests_batch.user_query"):
+            if USER_RANKING_BACKEND == "affinity":
+                user_records = yield from self._affinity_users(similar_by_source, limit, one_hour_ago_iso)
+            elif requests_param:
+                user_records = yield from self._similar_users_batch(requests_param, limit, one_hour_ago_iso)
+
+        with span("find_similar_interests_batch.user_scoring"):
+            results, notified = yield compute(self._rank_batch, interest_ids, sources,
+                                              similar_by_source, user_records, limit)
+        if GLOBAL_FALLBACK:
+            positions, fallback_requests = self._batch_fallback_requests(results, user_ids, limit, notified)
+            if fallback_requests:
+                with span("find_similar_interests_batch.global_fallback"):
+                    filled = yield from self._global_fallback(fallback_requests, one_hour_ago_iso, started)
+                self._apply_batch_fallback(results, positions, filled, notified)
+        with span("find_similar_interests_batch.timestamp_update"):
+            yield from self._update_user_timestamps(list(notified), current_time_iso)
+
+        return {"results": results, "timestamp": current_time_iso}
@@ -0,0 +1,96 @@
+"""Per-user cache of rendered GET /api/profile/interests responses.
+
+Entries hold the JSON body and its ETag, so a hit is served (or answered with
+304) after one indexed read of the user's ``profileVersion`` instead of the
+interests query, and without re-serialising vectors. Every save of a user's
+interests bumps that version in the graph, so an entry filled by one worker is
+not served by another once the profile has changed. The TTL still bounds how
+long an edit to a shared Interest (its name or description saved through
+another user) can go unseen.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def render(interests):
+    """(body, etag) for a list of interest dicts."""
+    body = json.dumps(interests, separators=(",", ":"), sort_keys=True).encode()
+    return body, hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class ProfileCache:
+    """Thread-safe LRU of ``(user_id, include_vectors) -> (body, etag)``, tagged with the profile version."""
+
+    def __init__(self, max_size=10000, ttl_seconds=30):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds or None
+        self._entries = OrderedDict()  # key -> (body, etag, stored_at, version)
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; a fill that started before one is dropped
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, version=None):
+        """Cached ``(body, etag)`` for ``key`` at ``version``, or None; counts a hit or a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[3] != version or self.ttl_seconds is not None
+                                      and time.monotonic() - entry[2] > self.ttl_seconds):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, value, generation, version=None):
+        """Store ``value`` unless the cache was invalidated after ``generation`` was read."""
+        if self.max_size <= 0:
+            return
+        body, etag = value
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (body, etag, time.monotonic(), version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            self.generation += 1
+            for user_id in user_ids:
+                for include_vectors in (True, False):
+                    if self._entries.pop((user_id, include_vectors), None) is not None:
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
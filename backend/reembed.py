@@ -0,0 +1,239 @@
+"""Rebuild (backfill) every stored Interest.vector with the current embedding settings.
+
+Run after changing EMBEDDING_MODEL, EMBEDDING_WEIGHTING, EMBEDDING_PHRASES
+or EMBEDDING_DESCRIPTION_WEIGHT, then restart the API workers so they load
+the new term weights and drop their cached vectors:
+
+    python reembed.py --chunk-size 1000 --workers 8 --checkpoint reembed.json
+
+Interests are read in id order one page at a time (keyset pagination, so
+rows updated behind the cursor are not revisited). With IDF or SIF weighting
+a first pass fits the term weights over all names and descriptions and saves
+them to TERM_WEIGHTS_PATH. Pages are then embedded on a process pool - each
+worker maps the same converted embedding store (embedding_store.py), so the
+model is shared through the page cache - and written back in page order with
+one UNWIND each. With ``--checkpoint`` the last written id is saved after
+every page and an interrupted run resumes from there.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import db
+import metrics
+from embedding_store import DEFAULT_STORE_DIR, EmbeddingStore
+from embeddings import (EMBEDDING_MODEL, embed_interests, get_model, get_term_weights,
+                        set_term_weights, terms, tokenize)
+from term_weights import EMBEDDING_WEIGHTING, TERM_WEIGHTS_PATH, TermWeights
+from vector_codec import encode_vector
+
+log = logging.getLogger(__name__)
+
+FIRST_INTEREST_PAGE_QUERY = """
+    MATCH (i:Interest)
+    RETURN i.id AS id, i.name AS name, i.description AS description
+    ORDER BY i.id
+    LIMIT $limit
+"""
+
+INTEREST_PAGE_QUERY = """
+    MATCH (i:Interest)
+    WHERE i.id > $after
+    RETURN i.id AS id, i.name AS name, i.description AS description
+    ORDER BY i.id
+    LIMIT $limit
+"""
+
+COUNT_INTERESTS_QUERY = """
+    MATCH (i:Interest)
+    RETURN count(i) AS count
+"""
+
+COUNT_INTERESTS_AFTER_QUERY = """
+    MATCH (i:Interest)
+    WHERE i.id > $after
+    RETURN count(i) AS count
+"""
+
+SET_INTEREST_VECTORS_QUERY = """
+    UNWIND $rows AS row
+    MATCH (i:Interest {id: row.id})
+    SET i.vector = row.vector
+"""
+
+
+def interest_pages(chunk_size, driver=None, after=None):
+    """Yield every Interest after ``after`` as lists of up to ``chunk_size`` dicts, in id order."""
+    while True:
+        if after is None:
+            records = db.read_query(FIRST_INTEREST_PAGE_QUERY, driver=driver, limit=chunk_size)
+        else:
+            records = db.read_query(INTEREST_PAGE_QUERY, driver=driver, after=after, limit=chunk_size)
+        if not records:
+            return
+        yield [dict(record) for record in records]
+        after = records[-1]["id"]
+
+
+def count_interests(driver=None, after=None):
+    if after is None:
+        records = db.read_query(COUNT_INTERESTS_QUERY, driver=driver)
+    else:
+        records = db.read_query(COUNT_INTERESTS_AFTER_QUERY, driver=driver, after=after)
+    return records[0]["count"] if records else 0
+
+
+def fit_term_weights(chunk_size, scheme=EMBEDDING_WEIGHTING, driver=None):
+    """Term and document frequencies over every interest name and description."""
+    key_to_index = get_model().key_to_index
+    weights = TermWeights(scheme)
+    for page in interest_pages(chunk_size, driver):
+        for interest in page:
+            tokens = tokenize(interest["name"] or "") + tokenize(interest["description"] or "")
+            weights.add(terms(tokens, key_to_index))
+    return weights
+
+
+def embed_page(page):
+    """Storage-ready ``{"id", "vector"}`` rows for one page; runs in the pool workers."""
+    vectors = embed_interests(page)
+    return [{"id": interest["id"],
+             "vector": encode_vector(np.asarray(vector, dtype=np.float32).tolist())}
+            for interest, vector in zip(page, vectors)]
+
+
+def _init_worker():
+    # Open the (memory-mapped) model and the term weights before the first page arrives
+    metrics.configure_logging()
+    get_model()
+    get_term_weights()
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+class Progress:
+    """Logs written / total, throughput and ETA at most every ``interval`` seconds."""
+
+    def __init__(self, total, done=0, interval=5.0):
+        self.total = total
+        self.done = done
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.started_at = done
+        self.last_report = 0.0
+
+    def update(self, count, final=False):
+        self.done += count
+        now = time.perf_counter()
+        if not final and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        elapsed = now - self.started
+        rate = (self.done - self.started_at) / elapsed if elapsed else 0.0
+        remaining = max(self.total - self.done, 0)
+        log.info("Re-embed progress", extra={
+            "written": self.done, "total": self.total,
+            "percent": round(100 * self.done / self.total, 1) if self.total else 100.0,
+            "per_second": round(rate, 1),
+            "eta_seconds": round(remaining / rate) if rate else None,
+        })
+
+
+def reembed(chunk_size, fit=True, workers=1, checkpoint=None, driver=None):
+    """Fit the weights (if weighted) and rewrite every Interest.vector; returns a summary."""
+    if get_model() is None:
+        raise RuntimeError("No embedding model could be loaded")
+
+    state = load_checkpoint(checkpoint)
+    if state is not None:
+        if state.get("model") != EMBEDDING_MODEL or state.get("weighting") != EMBEDDING_WEIGHTING:
+            raise RuntimeError(f"Checkpoint {checkpoint} was written with different embedding "
+                               "settings; delete it to start over")
+        # Vectors already written used the saved weights; keep them
+        fit = False
+        log.info("Resuming from checkpoint", extra={"after": state["after"], "written": state["written"]})
+    else:
+        state = {"after": None, "written": 0, "model": EMBEDDING_MODEL,
+                 "weighting": EMBEDDING_WEIGHTING}
+
+    if fit and EMBEDDING_WEIGHTING != "mean":
+        started = time.perf_counter()
+        weights = fit_term_weights(chunk_size, driver=driver)
+        weights.save(TERM_WEIGHTS_PATH)
+        set_term_weights(weights)
+        log.info("Term weights fitted", extra={"scheme": weights.scheme, "documents": weights.documents,
+                                               "distinct_terms": len(weights.doc_freq),
+                                               "path": TERM_WEIGHTS_PATH,
+                                               "seconds": round(time.perf_counter() - started, 1)})
+
+    if workers > 1 and not EmbeddingStore.exists(os.path.join(DEFAULT_STORE_DIR, EMBEDDING_MODEL)):
+        log.warning("No converted embedding store: every worker loads its own copy of the model "
+                    "(see embedding_store.py)", extra={"model": EMBEDDING_MODEL})
+
+    progress = Progress(state["written"] + count_interests(driver, state["after"]), state["written"])
+    executor = ProcessPoolExecutor(workers, initializer=_init_worker) if workers > 1 else None
+    in_flight = deque()  # (last id of the page, future or rows), in page order
+
+    def write_oldest():
+        last_id, pending = in_flight.popleft()
+        rows = pending.result() if executor is not None else pending
+        db.write_query(SET_INTEREST_VECTORS_QUERY, driver=driver, rows=rows)
+        state["after"] = last_id
+        state["written"] += len(rows)
+        if checkpoint:
+            save_checkpoint(checkpoint, state)
+        progress.update(len(rows))
+
+    try:
+        for page in interest_pages(chunk_size, driver, state["after"]):
+            if executor is None:
+                in_flight.append((page[-1]["id"], embed_page(page)))
+            else:
+                in_flight.append((page[-1]["id"], executor.submit(embed_page, page)))
+            # Enough queued to keep every worker busy while the oldest page is written
+            if len(in_flight) > 2 * max(workers, 1) - 1:
+                write_oldest()
+        while in_flight:
+            write_oldest()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    progress.update(0, final=True)
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return {"interests": state["written"], "seconds": round(time.perf_counter() - progress.started, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild every stored Interest.vector")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="interests per read and write")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="embedding processes (1 embeds in this process)")
+    parser.add_argument("--checkpoint", help="file recording the last written id; resumes from it if present")
+    parser.add_argument("--no-fit", action="store_true",
+                        help="reuse the saved term weights instead of refitting them")
+    args = parser.parse_args()
+    metrics.configure_logging()
+    summary = reembed(args.chunk_size, fit=not args.no_fit, workers=args.workers,
+                      checkpoint=args.checkpoint)
+    log.info("Re-embed finished", extra=summary)
+    db.close_driver()
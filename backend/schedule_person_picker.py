@@ -3,52 +3,88 @@ import numpy as np
 import time
 import random
 import requests
-from neo4j import GraphDatabase
 from dotenv import load_dotenv
+import argparse
+import logging
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import startup
+from db import get_driver, read_query
+from fairness_queue import FairnessQueue
 
 load_dotenv()
 
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+log = logging.getLogger(__name__)
+
 VITE_API_URL = os.getenv("VITE_API_URL")
+# Number of users picked per coaster round, all resolved in one batch API call
+COASTER_ROUND_SIZE = int(os.getenv("COASTER_ROUND_SIZE", "1"))
 
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+# Daemon settings
+SCHEDULER_TICK_SECONDS = float(os.getenv("SCHEDULER_TICK_SECONDS", "300"))
+SCHEDULER_SYNC_SECONDS = float(os.getenv("SCHEDULER_SYNC_SECONDS", "60"))
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "50"))
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+COOLDOWN_SECONDS = float(os.getenv("COOLDOWN_SECONDS", "3600"))
+# Re-read a little before the last sync so clock skew between hosts can't hide changes
+SCHEDULER_SYNC_OVERLAP_SECONDS = float(os.getenv("SCHEDULER_SYNC_OVERLAP_SECONDS", "5"))
+# POST every round's picks to the ASGI push channel (/api/coasters/dispatch, see coaster_hub.py)
+COASTER_PUSH = os.getenv("COASTER_PUSH", "false").lower() in ("1", "true", "yes")
 
-def get_random_user_interest():
-    print(f'get random user')
+ALL_USERS_QUERY = """
+    MATCH (u:User)
+    OPTIONAL MATCH (u)-[:INTERESTED_IN]->(i:Interest)
+    RETURN u.id AS user_id, collect(i.id) AS interests,
+           u.lastUpdated.epochMillis AS last_notified_ms
+"""
 
+# Users whose interests changed, or who were created/notified, since the last sync.
+# One branch per timestamp so each is a seek on its range index (schema.py); an
+# OR of the two predicates makes the planner scan every User instead
+CHANGED_USERS_QUERY = """
+    CALL {
+        MATCH (u:User) WHERE u.interestsUpdatedAt >= datetime({epochMillis: $since_ms})
+        RETURN u
+        UNION
+        MATCH (u:User) WHERE u.lastUpdated >= datetime({epochMillis: $since_ms})
+        RETURN u
+    }
+    OPTIONAL MATCH (u)-[:INTERESTED_IN]->(i:Interest)
+    RETURN u.id AS user_id, collect(i.id) AS interests,
+           u.lastUpdated.epochMillis AS last_notified_ms
+"""
 
+RANDOM_USER_INTERESTS_QUERY = """
+    MATCH (u:User)-[:INTERESTED_IN]->(i:Interest)
+    WITH u, COLLECT(i.id) AS interests, u.id AS user_id
+    WHERE SIZE(interests) > 0
+    RETURN user_id, interests
+    ORDER BY rand()
+    LIMIT $count
+"""
+
+def get_random_user_interest():
     """Fetch a random interest ID and the corresponding user ID."""
-    with driver.session() as session:
-        result = session.run(
-            "MATCH (u:User)-[:INTERESTED_IN]->(i:Interest) "
-            "WITH u, COLLECT(i.id) AS interests, u.id AS user_id "
-            "WHERE SIZE(interests) > 0 "
-            "RETURN user_id, interests "
-            "ORDER BY rand() "
-            "LIMIT 1"
-        )
-        record = result.single() # Get the single returned record.
-
-        print(f'record: {record}')
-
-
-        if record:
-            interests = record["interests"] # Access the list of interests
-            user_id = record["user_id"] # access the user_id
-
-            print(f'interests: {interests}')
-
-            if interests:
-                return random.choice(interests), user_id # return both the interestID and the user_id
-            else:
-                print("No interests found for the randomly selected user.")
-                return None, None
+    records = read_query(RANDOM_USER_INTERESTS_QUERY, count=1)
+    record = records[0] if records else None # Get the single returned record.
+
+    if record:
+        interests = record["interests"] # Access the list of interests
+        user_id = record["user_id"] # access the user_id
+
+        log.debug("Picked random user", extra={"user_id": user_id, "interests": len(interests)})
+
+        if interests:
+            return random.choice(interests), user_id # return both the interestID and the user_id
         else:
-            print("No users with interests found.")
+            log.info("No interests found for the randomly selected user")
             return None, None
+    else:
+        log.info("No users with interests found")
+        return None, None
 
 
 def fetch_similar_users():
@@ -57,21 +93,63 @@ def fetch_similar_users():
     if interest_id is None:
         return
 
-    print(f'interest_id: {interest_id}')
-
-
     # /api/interests/similar/<interest_id>
-    response = requests.get(f"{VITE_API_URL}/interests/similar/{interest_id}")
-
-    print(f'resp: {response.json()}')
+    response = requests.get(f"{VITE_API_URL}/interests/similar/{interest_id}",
+                            params={"user_id": original_user_id})
 
     if response.status_code == 200:
-        similar_users_json = response.json()
-        print(f'Similar Users Found: {similar_users_json}')
-        similar_users = get_user_ids(similar_users_json)
+        similar_users = get_user_ids(response.json())
+        log.debug("Similar users found", extra={"interest_id": interest_id,
+                                                "users": len(similar_users)})
         return similar_users
     else:
-        print(f"Failed to fetch similar users. Status Code: {response.status_code}")
+        log.warning("Failed to fetch similar users", extra={"status": response.status_code})
+
+
+def get_random_user_interests(count):
+    """Fetch ``count`` random users, each with one random interest ID."""
+    records = read_query(RANDOM_USER_INTERESTS_QUERY, count=count)
+    return [(random.choice(record["interests"]), record["user_id"]) for record in records]
+
+
+def fetch_similar_users_round(round_size=COASTER_ROUND_SIZE):
+    """Resolve a whole coaster round with one POST to the batch similarity endpoint.
+
+    Returns a dict mapping each picked user ID to the user IDs to notify.
+    """
+    picks = get_random_user_interests(round_size)
+    if not picks:
+        log.info("No users with interests found")
+        return {}
+    return request_similar_users(picks)
+
+
+def request_similar_users(picks):
+    """POST (interest_id, user_id) picks to the batch endpoint; {user_id: [user IDs to notify]}."""
+    # /api/interests/similar:batch
+    response = requests.post(f"{VITE_API_URL}/interests/similar:batch",
+                             json={"interest_ids": [interest_id for interest_id, _ in picks],
+                                   "user_ids": [user_id for _, user_id in picks]})
+
+    if response.status_code != 200:
+        log.warning("Failed to fetch similar users", extra={"status": response.status_code})
+        return {}
+
+    results = response.json()["results"]
+    return {
+        original_user_id: get_user_ids(result)
+        for (_, original_user_id), result in zip(picks, results)
+    }
+
+
+def publish_picks(user_ids_by_pick):
+    """Send a round's picks to the connected coasters; returns the number of messages queued."""
+    # /api/coasters/dispatch
+    response = requests.post(f"{VITE_API_URL}/coasters/dispatch", json={"picks": user_ids_by_pick})
+    if response.status_code != 200:
+        log.warning("Failed to dispatch picks", extra={"status": response.status_code})
+        return 0
+    return response.json()["delivered"]
 
 
 def get_user_ids(similar_users):
@@ -83,16 +161,113 @@ def get_user_ids(similar_users):
 
 
 
-# Schedule the task to run every 5 minutes
-#schedule.every(1).minutes.do(fetch_similar_users)
+class CoasterScheduler:
+    """Long-running scheduler that picks users from an in-memory fairness queue.
+
+    The queue is loaded from Neo4j once and then kept current with small
+    incremental syncs, so a tick only pops the longest-waiting eligible users
+    locally and fires their picks concurrently on a thread pool.
+    """
 
-print("Scheduler started. Running every 5 minutes...")
+    def __init__(self, round_size=COASTER_ROUND_SIZE, batch_size=SCHEDULER_BATCH_SIZE,
+                 workers=SCHEDULER_WORKERS, cooldown_seconds=COOLDOWN_SECONDS):
+        self.round_size = round_size
+        self.batch_size = batch_size
+        self.queue = FairnessQueue(cooldown_seconds)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="coaster")
+        self.last_sync = None
+
+    def sync(self):
+        """Load all users on the first call, then only users changed since the last sync."""
+        started = time.time()
+        if self.last_sync is None:
+            records = read_query(ALL_USERS_QUERY)
+        else:
+            since_ms = int((self.last_sync - SCHEDULER_SYNC_OVERLAP_SECONDS) * 1000)
+            records = read_query(CHANGED_USERS_QUERY, since_ms=since_ms)
+        for record in records:
+            last_notified_ms = record["last_notified_ms"]
+            self.queue.upsert(record["user_id"], record["interests"],
+                              last_notified_ms / 1000 if last_notified_ms else None)
+        self.last_sync = started
+        log.info("Synced users", extra={"synced": len(records), **self.queue.stats()})
 
-# # Keep the script running
-# while True:
-#     schedule.run_pending()
-#     time.sleep(1)
+    def tick(self):
+        """Pop this round's eligible users and dispatch them in concurrent batches."""
+        picked = self.queue.pop_eligible(self.round_size)
+        if not picked:
+            log.info("No eligible users this tick")
+            return []
+        futures = []
+        for start in range(0, len(picked), self.batch_size):
+            chunk = picked[start:start + self.batch_size]
+            futures.append(self.executor.submit(self._dispatch, chunk))
+        return futures
 
-user_id_list = fetch_similar_users()
-print(user_id_list)
+    def _dispatch(self, chunk):
+        user_ids = [user_id for user_id, _ in chunk]
+        picks = [(random.choice(interests), user_id) for user_id, interests in chunk]
+        try:
+            user_ids_by_pick = request_similar_users(picks)
+        except Exception:
+            log.exception("Pick failed", extra={"users": len(chunk)})
+            self.queue.release(user_ids)
+            return {}
+        if not user_ids_by_pick:
+            self.queue.release(user_ids)
+            return {}
 
+        notified = set(user_ids)
+        for recommended in user_ids_by_pick.values():
+            notified.update(recommended)
+        self.queue.mark_notified(notified)
+        log.info("Users that have similar interests", extra={"picks": user_ids_by_pick})
+        if COASTER_PUSH:
+            try:
+                publish_picks(user_ids_by_pick)
+            except Exception:
+                # The picks still count: the cooldown has started either way
+                log.exception("Dispatch failed", extra={"users": len(notified)})
+        return user_ids_by_pick
+
+    def run(self, tick_seconds=SCHEDULER_TICK_SECONDS, sync_seconds=SCHEDULER_SYNC_SECONDS):
+        if self.last_sync is None:
+            self.sync()
+        schedule.every(sync_seconds).seconds.do(self.sync)
+        schedule.every(tick_seconds).seconds.do(self.tick)
+        log.info("Scheduler started", extra={"tick_seconds": tick_seconds})
+
+        # Keep the script running
+        while True:
+            schedule.run_pending()
+            time.sleep(1)
+
+
+def warm_up():
+    """Connect to Neo4j and load the fairness queue as timed startup stages; returns the scheduler."""
+    scheduler = CoasterScheduler()
+    startup.stage("connection", lambda: get_driver().verify_connectivity())
+    startup.stage("queue_sync", scheduler.sync)
+    return scheduler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick users and find people with similar interests")
+    parser.add_argument("--once", action="store_true",
+                        help="run a single random round and exit instead of the daemon")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report import time per module and init time per stage of a cold start, then exit")
+    parser.add_argument("--startup-budget", type=float,
+                        help="seconds allowed for import plus init (default STARTUP_BUDGET_SECONDS)")
+    args = parser.parse_args()
+    metrics.configure_logging()
+
+    if args.profile_startup:
+        sys.exit(startup.run_profile("schedule_person_picker", "warm_up", args.startup_budget))
+    if args.once:
+        user_ids_by_pick = fetch_similar_users_round()
+        print(user_ids_by_pick)
+        if COASTER_PUSH and user_ids_by_pick:
+            publish_picks(user_ids_by_pick)
+    else:
+        warm_up().run()
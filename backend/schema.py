@@ -0,0 +1,112 @@
+"""Neo4j schema bootstrap: constraints, indexes and the Interest vector index.
+
+Every statement is idempotent (``IF NOT EXISTS``), so this is safe to run on
+every startup as well as by hand:
+
+    python schema.py
+"""
+import logging
+import os
+
+from dotenv import load_dotenv
+
+import db
+import metrics
+from vector_codec import VECTOR_STORAGE
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+# Run ensure_schema() when the API starts
+SCHEMA_BOOTSTRAP = os.getenv("SCHEMA_BOOTSTRAP", "true").lower() in ("1", "true", "yes")
+# Name of the native vector index used when SIMILARITY_BACKEND=neo4j
+INTEREST_VECTOR_INDEX = os.getenv("INTEREST_VECTOR_INDEX", "interest_vector")
+# Used for the vector index when no Interest has a stored vector yet
+DEFAULT_VECTOR_DIMENSIONS = int(os.getenv("INTEREST_VECTOR_DIMENSIONS", "100"))
+
+CONSTRAINTS = [
+    ("user_id_unique", "User",
+     "CREATE CONSTRAINT user_id_unique IF NOT EXISTS FOR (u:User) REQUIRE u.id IS UNIQUE"),
+    ("interest_id_unique", "Interest",
+     "CREATE CONSTRAINT interest_id_unique IF NOT EXISTS FOR (i:Interest) REQUIRE i.id IS UNIQUE"),
+]
+
+INDEXES = [
+    "CREATE RANGE INDEX user_last_updated IF NOT EXISTS FOR (u:User) ON (u.lastUpdated)",
+    "CREATE RANGE INDEX user_interests_updated IF NOT EXISTS FOR (u:User) ON (u.interestsUpdatedAt)",
+]
+
+# Labels come from CONSTRAINTS above, never from user input
+DUPLICATE_IDS_QUERY = """
+    MATCH (n:{label})
+    WITH n.id AS id, count(*) AS copies
+    WHERE copies > 1
+    RETURN id, copies
+    LIMIT 10
+"""
+
+VECTOR_DIMENSIONS_QUERY = """
+    MATCH (i:Interest)
+    WHERE i.vector IS NOT NULL
+    RETURN size(i.vector) AS dimensions
+    LIMIT 1
+"""
+
+
+def vector_index_statement(dimensions):
+    # Schema commands don't take parameters, so the values are formatted in
+    return (
+        f"CREATE VECTOR INDEX {INTEREST_VECTOR_INDEX} IF NOT EXISTS "
+        f"FOR (i:Interest) ON (i.vector) "
+        f"OPTIONS {{indexConfig: {{`vector.dimensions`: {int(dimensions)}, "
+        f"`vector.similarity_function`: 'cosine'}}}}"
+    )
+
+
+def ensure_schema(driver=None):
+    """Create constraints and indexes that are missing. Returns a summary dict.
+
+    A uniqueness constraint is skipped (and reported) if duplicate ids already
+    exist for that label; the vector index is skipped on Neo4j versions
+    without vector index support and when vectors are stored packed.
+    """
+    summary = {"applied": [], "skipped": {}}
+
+    for name, label, statement in CONSTRAINTS:
+        duplicates = db.read_query(DUPLICATE_IDS_QUERY.format(label=label), driver=driver)
+        if duplicates:
+            examples = [record["id"] for record in duplicates]
+            log.warning("Skipping constraint: duplicate ids exist",
+                        extra={"constraint": name, "label": label, "examples": examples})
+            summary["skipped"][name] = f"duplicate ids: {examples}"
+            continue
+        db.write_query(statement, driver=driver)
+        summary["applied"].append(name)
+
+    for statement in INDEXES:
+        db.write_query(statement, driver=driver)
+        summary["applied"].append(statement.split()[3])
+
+    if VECTOR_STORAGE != "float":
+        # The native vector index only covers float arrays
+        summary["skipped"][INTEREST_VECTOR_INDEX] = f"VECTOR_STORAGE={VECTOR_STORAGE}"
+        log.info("Schema ensured", extra=summary)
+        return summary
+
+    records = db.read_query(VECTOR_DIMENSIONS_QUERY, driver=driver)
+    dimensions = records[0]["dimensions"] if records else DEFAULT_VECTOR_DIMENSIONS
+    try:
+        db.write_query(vector_index_statement(dimensions), driver=driver)
+        summary["applied"].append(INTEREST_VECTOR_INDEX)
+    except Exception as e:
+        log.warning("Skipping vector index: %s", e, extra={"index": INTEREST_VECTOR_INDEX})
+        summary["skipped"][INTEREST_VECTOR_INDEX] = str(e)
+
+    log.info("Schema ensured", extra=summary)
+    return summary
+
+
+if __name__ == "__main__":
+    metrics.configure_logging()
+    ensure_schema()
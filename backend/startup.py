@@ -0,0 +1,214 @@
+"""Timed init stages, readiness and cold-start profiling for the backend processes.
+
+Each process (an API worker, the scheduler) runs its initialisation as named
+stages through ``stage``: opening the graph connection, the schema check,
+loading the embedding model, the first queue sync. Every stage runs once, its
+duration is logged and exported under ``startup`` on ``/metrics``, and
+``ready`` tells a readiness probe whether all of them have finished. A
+stage that raises is recorded in ``report()["errors"]`` and runs again on the
+next attempt.
+
+``--profile-startup`` (api.py, schedule_person_picker.py) measures a real
+cold start: it launches a fresh interpreter with ``-X importtime``, imports
+the module, runs its init stages and reports import time per module (from
+CPython's own instrumentation) and init time per stage as JSON. It exits
+non-zero when import plus init exceeds STARTUP_BUDGET_SECONDS:
+
+    python api.py --profile-startup
+    python schedule_person_picker.py --profile-startup --startup-budget 1.5
+"""
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+# "eager" opens the graph connection when the server starts; "lazy" leaves it,
+# the schema check and the model to the first request or readiness probe, so
+# the app modules can be imported cheaply (tests, pre-fork)
+STARTUP_MODE = os.getenv("STARTUP_MODE", "eager")
+# Not made to wait for (or retry) startup stages by the request hooks
+PROBE_PATHS = frozenset({"/ready", "/metrics"})
+# Import plus init time allowed by --profile-startup before it reports a failure
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "3"))
+# Modules listed per ranking in the profile report
+STARTUP_PROFILE_TOP = int(os.getenv("STARTUP_PROFILE_TOP", "15"))
+
+_stages = {}        # name -> seconds, in the order the stages finished
+_errors = {}        # name -> last error, until the stage succeeds
+_run_lock = threading.RLock()   # held while a stage runs; stages may run stages they depend on
+_lock = threading.Lock()        # state only, so probes never wait for a running stage
+_warm_up = None
+
+metrics.register_stats("startup", lambda: {f"{name}_seconds": seconds
+                                           for name, seconds in _stages.items()})
+
+
+def stage(name, fn):
+    """Run ``fn`` as init stage ``name`` unless it already ran; errors propagate and it can be retried."""
+    if name in _stages:
+        return
+    with _run_lock:
+        if name in _stages:
+            return
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            with _lock:
+                _errors[name] = f"{type(e).__name__}: {e}"
+            raise
+        with _lock:
+            _errors.pop(name, None)
+            _stages[name] = time.perf_counter() - started
+        log.info("Startup stage finished", extra={"stage": name, "seconds": round(_stages[name], 3)})
+
+
+def ready(names):
+    with _lock:
+        return all(name in _stages for name in names)
+
+
+def warm_up(stages, background=True):
+    """Run ``[(name, fn)]`` in order, by default on a daemon thread; a failed run is retried on the next call."""
+    global _warm_up
+    if not background:
+        for name, fn in stages:
+            stage(name, fn)
+        return
+    if ready(name for name, _ in stages):
+        return
+    with _lock:
+        if _warm_up is not None and _warm_up.is_alive():
+            return
+        _warm_up = threading.Thread(target=_warm_up_quietly, args=(stages,),
+                                    name="startup-warm-up", daemon=True)
+        _warm_up.start()
+
+
+def _warm_up_quietly(stages):
+    try:
+        warm_up(stages, background=False)
+    except Exception:
+        log.exception("Startup warm-up failed")
+
+
+def report():
+    """Finished stages in milliseconds and the errors of those that failed."""
+    with _lock:
+        return {"stages": {name: round(seconds * 1000, 3) for name, seconds in _stages.items()},
+                "errors": dict(_errors)}
+
+
+# --- Cold-start profiling -----------------------------------------------------
+
+# Imports the target first, before this module or anything else is loaded, so
+# its whole import tree is attributed to it
+_CHILD_CODE = """
+import sys, time
+started = time.perf_counter()
+module = __import__(sys.argv[1])  # importlib.import_module would skip -X importtime for it
+imported = time.perf_counter()
+import startup
+startup.profile_child(module, sys.argv[2], imported - started)
+"""
+_CHILD_MARKER = "startup-profile: "
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)\s*$")
+
+
+def parse_importtime(text):
+    """``-X importtime`` output as a forest of ``{"module", "self_ms", "cumulative_ms", "imports"}``."""
+    pending = {}    # depth -> entries waiting for the parent printed after them
+    for line in text.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        depth = (len(indent) - 1) // 2
+        pending.setdefault(depth, []).append({
+            "module": module,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+            "imports": pending.pop(depth + 1, []),
+        })
+    return pending.get(0, [])
+
+
+def _walk(entries):
+    for entry in entries:
+        yield entry
+        yield from _walk(entry["imports"])
+
+
+def _summary(entry):
+    return {key: entry[key] for key in ("module", "self_ms", "cumulative_ms")}
+
+
+def profile_child(module, init, import_seconds):
+    """Child side of ``profile_startup``: run the module's init and print the stage timings."""
+    started = time.perf_counter()
+    error = None
+    try:
+        getattr(module, init)()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    result = {"import_seconds": import_seconds, "init_seconds": time.perf_counter() - started,
+              "error": error, **report()}
+    print(_CHILD_MARKER + json.dumps(result), flush=True)
+
+
+def profile_startup(module, init, budget_seconds=STARTUP_BUDGET_SECONDS, top=STARTUP_PROFILE_TOP):
+    """Cold-start report for ``module`` (imported, then ``module.init()`` run) in a fresh interpreter."""
+    env = {**os.environ, "STARTUP_MODE": "lazy"}
+    started = time.perf_counter()
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", _CHILD_CODE, module, init],
+                           cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                           capture_output=True, text=True)
+    process_seconds = time.perf_counter() - started
+
+    result = next((json.loads(line[len(_CHILD_MARKER):]) for line in child.stdout.splitlines()
+                   if line.startswith(_CHILD_MARKER)), None)
+    if result is None:
+        raise RuntimeError(f"Profiling {module} failed:\n{child.stderr[-2000:]}")
+
+    root = next((entry for entry in parse_importtime(child.stderr) if entry["module"] == module), None)
+    imports = root["imports"] if root else []
+    cold_start = result["import_seconds"] + result["init_seconds"]
+    return {
+        "module": module,
+        "budget_seconds": budget_seconds,
+        "cold_start_seconds": round(cold_start, 3),
+        "within_budget": cold_start <= budget_seconds and not result["error"] and not result["errors"],
+        "process_seconds": round(process_seconds, 3),
+        "import_seconds": round(result["import_seconds"], 3),
+        "init_seconds": round(result["init_seconds"], 3),
+        "stages_ms": result["stages"],
+        # A failed stage already explains why the init call failed
+        "errors": result["errors"] or ({"init": result["error"]} if result["error"] else {}),
+        # Direct imports of the module, costliest subtree first
+        "imports": [_summary(entry) for entry in
+                    sorted(imports, key=lambda entry: -entry["cumulative_ms"])[:top]],
+        # Costliest modules anywhere under it, by their own time
+        "slowest_modules": [_summary(entry) for entry in
+                            sorted(_walk(imports), key=lambda entry: -entry["self_ms"])[:top]],
+    }
+
+
+def run_profile(module, init, budget_seconds=None):
+    """Print the ``profile_startup`` report and return the exit status (1 when over budget or failed)."""
+    budget_seconds = STARTUP_BUDGET_SECONDS if budget_seconds is None else budget_seconds
+    profile = profile_startup(module, init, budget_seconds)
+    print(json.dumps(profile, indent=2))
+    return 0 if profile["within_budget"] else 1
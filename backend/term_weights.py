@@ -0,0 +1,73 @@
+"""IDF / SIF term weights for interest embeddings, fitted on the Interest corpus.
+
+Weights are fitted by reembed.py and saved next to the embedding store, so
+every worker embeds with the same weights as the stored vectors were built
+with. Terms are model keys after phrase merging (see embeddings.py), so a
+phrase like ``machine_learning`` is counted as one term.
+"""
+import json
+import math
+import os
+from collections import Counter
+
+from dotenv import load_dotenv
+
+from embedding_store import DEFAULT_STORE_DIR
+
+load_dotenv()
+
+# "mean" (unweighted, the original behaviour), "idf" or "sif"
+EMBEDDING_WEIGHTING = os.getenv("EMBEDDING_WEIGHTING", "mean")
+# SIF smoothing: weight = a / (a + p(term))
+SIF_A = float(os.getenv("SIF_A", "1e-3"))
+TERM_WEIGHTS_PATH = os.getenv("TERM_WEIGHTS_PATH", os.path.join(DEFAULT_STORE_DIR, "term_weights.json"))
+
+
+class TermWeights:
+    """Document and term frequencies of a corpus, turned into per-term weights."""
+
+    def __init__(self, scheme=EMBEDDING_WEIGHTING, sif_a=SIF_A):
+        if scheme not in ("mean", "idf", "sif"):
+            raise ValueError(f"Unknown EMBEDDING_WEIGHTING: {scheme}")
+        self.scheme = scheme
+        self.sif_a = sif_a
+        self.documents = 0
+        self.terms = 0
+        self.doc_freq = Counter()
+        self.term_freq = Counter()
+
+    def add(self, terms):
+        """Count one document's terms."""
+        self.documents += 1
+        self.terms += len(terms)
+        self.term_freq.update(terms)
+        self.doc_freq.update(set(terms))
+
+    def weight(self, term):
+        if self.scheme == "idf":
+            # Smoothed, so a term seen in every document still counts a little
+            return math.log((1 + self.documents) / (1 + self.doc_freq.get(term, 0))) + 1.0
+        if self.scheme == "sif" and self.terms:
+            return self.sif_a / (self.sif_a + self.term_freq.get(term, 0) / self.terms)
+        return 1.0
+
+    def save(self, path=TERM_WEIGHTS_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"scheme": self.scheme, "sif_a": self.sif_a, "documents": self.documents,
+                       "terms": self.terms, "doc_freq": self.doc_freq,
+                       "term_freq": self.term_freq}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=TERM_WEIGHTS_PATH, scheme=EMBEDDING_WEIGHTING):
+        """Frequencies saved by ``save``, weighted with ``scheme``."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        weights = cls(scheme, data.get("sif_a", SIF_A))
+        weights.documents = data["documents"]
+        weights.terms = data["terms"]
+        weights.doc_freq = Counter(data["doc_freq"])
+        weights.term_freq = Counter(data["term_freq"])
+        return weights
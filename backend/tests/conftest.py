@@ -0,0 +1,30 @@
+"""Shared fixtures; the backend modules import each other as siblings, so put backend/ on the path."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import embeddings  # noqa: E402
+from benchmarks.fake_model import FakeEmbeddingModel  # noqa: E402
+
+
+@pytest.fixture
+def fake_model():
+    """The deterministic benchmark model in place of the real one, restored afterwards."""
+    saved = embeddings._model, embeddings._model_loaded
+    model = FakeEmbeddingModel()
+    embeddings.set_model(model)
+    yield model
+    embeddings._model, embeddings._model_loaded = saved
+    embeddings.embedding_cache.clear()
+
+
+@pytest.fixture
+def memory_conn(tmp_path, fake_model):
+    """An empty, unpersisted in-memory graph."""
+    from memory_graph import MemoryGraphConnection
+    conn = MemoryGraphConnection(path=str(tmp_path / "graph.json"), persistence="none")
+    yield conn
+    conn.close()
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from affinity import AffinityModel
+from interest_index import InterestIndex
+
+DIM = 16
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+def clustered(rng, n, centres):
+    return (centres[rng.integers(0, len(centres), n)]
+            + 0.5 * rng.standard_normal((n, DIM))).astype(np.float32)
+
+
+def similarity_rows(model):
+    """``S`` as {interest id: {neighbour id: score}}, independent of column order."""
+    similarity = model._similarity_csr()
+    ids = model._interest_ids
+    rows = {}
+    for col, interest_id in enumerate(ids):
+        span = slice(similarity.indptr[col], similarity.indptr[col + 1])
+        rows[interest_id] = dict(zip((ids[c] for c in similarity.indices[span]),
+                                     similarity.data[span].tolist()))
+    return rows
+
+
+def test_similarity_is_sparse_top_k(rng):
+    centres = rng.standard_normal((10, DIM))
+    index = InterestIndex()
+    index.rebuild({"id": i, "vector": v} for i, v in enumerate(clustered(rng, 500, centres)))
+    model = AffinityModel(threshold=0.5, neighbours=8)
+    model.rebuild(index, [])
+
+    _, matrix = index.snapshot()
+    dense = matrix @ matrix.T
+    for interest_id, row in similarity_rows(model).items():
+        assert row[interest_id] == 1.0
+        assert 1 <= len(row) <= 8
+        assert all(score > 0.5 for score in row.values())
+        others = {i: s for i, s in row.items() if i != interest_id}
+        expected = np.delete(dense[interest_id], interest_id)
+        expected = np.sort(expected[expected > 0.5])[::-1][:len(others)]
+        np.testing.assert_allclose(sorted(others.values(), reverse=True), expected, atol=1e-5)
+
+
+def test_update_user_matches_a_rebuild(rng):
+    centres = rng.standard_normal((10, DIM))
+    n = 400
+    index = InterestIndex()
+    index.rebuild({"id": i, "vector": v} for i, v in enumerate(clustered(rng, n, centres)))
+    memberships = {f"u{u}": [int(i) for i in rng.choice(n, 4, replace=False)] for u in range(200)}
+    model = AffinityModel(threshold=0.5, neighbours=10)
+    model.rebuild(index, memberships.items())
+
+    # Re-embed some interests and add new ones, then save the profiles that hold them
+    changed = [int(i) for i in rng.choice(n, 25, replace=False)]
+    for interest_id, vector in zip(changed, clustered(rng, len(changed), centres)):
+        index.upsert(interest_id, vector)
+    added = list(range(n, n + 15))
+    for interest_id, vector in zip(added, clustered(rng, len(added), centres)):
+        index.upsert(interest_id, vector)
+    touched = changed + added
+    for u, start in enumerate(range(0, len(touched), 5)):
+        user_id = f"u{u}"
+        memberships[user_id] = touched[start:start + 5]
+        model.update_user(user_id, memberships[user_id], index)
+    memberships["new"] = [added[0], changed[0]]
+    model.update_user("new", memberships["new"], index)
+
+    rebuilt = AffinityModel(threshold=0.5, neighbours=10)
+    rebuilt.rebuild(index, memberships.items())
+    incremental, expected = similarity_rows(model), similarity_rows(rebuilt)
+    assert incremental.keys() == expected.keys()
+    for interest_id, row in expected.items():
+        assert incremental[interest_id].keys() == row.keys(), interest_id
+        np.testing.assert_allclose([incremental[interest_id][i] for i in row], list(row.values()),
+                                   atol=1e-5)
+
+    for user_id in ["u0", "u3", "u150", "new"]:
+        found, wanted = model.similar_users(user_id, k=10), rebuilt.similar_users(user_id, k=10)
+        assert [u for u, _ in found] == [u for u, _ in wanted]
+        np.testing.assert_allclose([s for _, s in found], [s for _, s in wanted], rtol=1e-5)
+
+
+def test_rebuild_replays_updates_made_while_it_ran(rng):
+    centres = rng.standard_normal((5, DIM))
+    index = InterestIndex()
+    index.rebuild({"id": i, "vector": v} for i, v in enumerate(clustered(rng, 50, centres)))
+    model = AffinityModel(threshold=0.5, neighbours=10)
+    model.rebuild(index, [("a", [1, 2])])
+
+    model.track_updates()
+    stale_memberships = [("a", [1, 2])]
+    # Saved after the memberships were read, but before the rebuild swapped them in
+    model.update_user("a", [3], index)
+    model.update_user("b", [1], index)
+    assert model.rebuilding
+    model.rebuild(index, stale_memberships)
+    assert not model.rebuilding
+    assert model.user_interests("a") == (3,)
+    assert model.user_interests("b") == (1,)
@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from cooldown_store import CooldownStore
+
+# The start of the current bucket: the wheel only sweeps forward from the time the store was made
+NOW = time.time() // 60 * 60
+
+
+@pytest.fixture
+def store():
+    return CooldownStore(cooldown_seconds=600, bucket_seconds=60, write_back=True)
+
+
+def test_record_and_filter(store):
+    store.record(["a", "b"], now=NOW)
+    assert not store.eligible("a", now=NOW + 1)
+    assert store.eligible("c", now=NOW + 1)
+    assert store.filter_eligible(["c", "a", "d", "b"], now=NOW + 1) == ["c", "d"]
+    # The cooldown ends exactly cooldown_seconds after the notification
+    assert store.filter_eligible(["a", "b"], now=NOW + 600) == ["a", "b"]
+
+
+def test_sweep_drops_whole_buckets_once_past(store):
+    store.record(["a"], now=NOW)
+    store.record(["b"], now=NOW + 120)
+    assert store.stats(now=NOW + 600)["users"] == 2
+    # a's bucket is only dropped once it lies wholly in the past
+    bucket_end = (store._bucket(NOW + 600) + 1) * 60
+    assert store.stats(now=bucket_end)["users"] == 1
+    assert store.stats(now=NOW + 120 + 660)["users"] == 0
+    assert store.stats(now=NOW + 120 + 660)["expired"] == 2
+    assert store.stats(now=NOW + 120 + 660)["buckets"] == 0
+
+
+def test_renotified_user_survives_the_sweep_of_its_old_bucket(store):
+    store.record(["a"], now=NOW)
+    store.record(["a"], now=NOW + 300)
+    assert store.stats(now=NOW + 720)["users"] == 1
+    assert not store.eligible("a", now=NOW + 720)
+    assert store.stats(now=NOW + 300 + 660)["users"] == 0
+
+
+def test_merge_keeps_the_latest_notification(store):
+    store.record(["a"], now=NOW)
+    merged = store.merge({"a": NOW - 100, "b": NOW - 50, "c": NOW - 700}, now=NOW)
+    # a already has a later cooldown and c's has ended; only b starts
+    assert merged == 1
+    assert store._until["a"] == NOW + 600
+    assert store._until["b"] == NOW + 550
+    assert "c" not in store._until
+    assert store.merge({"a": NOW + 10}, now=NOW + 10) == 1
+    assert store._until["a"] == NOW + 610
+
+
+def test_merge_does_not_queue_a_write_back(store):
+    store.merge({"a": NOW}, now=NOW)
+    store.record(["b"], now=NOW)
+    assert store.drain_pending() == [{"user_id": "b", "notified_at": NOW}]
+    assert store.drain_pending() == []
+
+
+def test_snapshot_round_trip(store, tmp_path):
+    store.record(["a"], now=NOW)
+    path = str(tmp_path / "cooldowns.json")
+    store.save(path)
+    restored = CooldownStore(cooldown_seconds=600, bucket_seconds=60)
+    restored.load(path)
+    assert restored._until["a"] == NOW + 600
+    assert restored.drain_pending() == [{"user_id": "a", "notified_at": NOW}]
+
+
+def test_candidates_are_filtered_in_process(monkeypatch):
+    """With the store, the candidate query has no cooldown list and cooling users are dropped after it."""
+    import neo4j_connection
+    from benchmarks.graph_stub import StubDriver, StubGraph
+    from neo4j_connection import Neo4jConnection
+
+    monkeypatch.setattr(neo4j_connection, "COOLDOWN_BACKEND", "store")
+    monkeypatch.setattr(neo4j_connection, "COOLDOWN_SYNC_SECONDS", 0)
+    graph = StubGraph()
+    queries = []
+    run = graph.run
+    monkeypatch.setattr(graph, "run", lambda query, params: queries.append(params) or run(query, params))
+    conn = Neo4jConnection(StubDriver(graph))
+    for user_id in ["a", "b", "c"]:
+        graph.users[user_id] = {"name": user_id, "lastUpdated": None}
+        graph.user_interests[user_id] = {1: None}
+        graph.interest_users.setdefault(1, {})[user_id] = None
+    graph.interests[1] = {"name": "one", "description": "", "vector": None}
+    conn.cooldowns.record(["b"])
+
+    records = conn._run(conn._similar_users([1], 3, "2000-01-01T00:00:00"))
+    assert [record["user_id"] for record in records] == ["a", "c"]
+    assert queries[-1] == {"interest_ids": [1], "candidate_limit": 3 * neo4j_connection.COOLDOWN_OVERFETCH}
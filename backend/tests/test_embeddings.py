@@ -0,0 +1,16 @@
+import pytest
+
+import embeddings
+
+
+def test_require_model_fails_without_a_model(monkeypatch):
+    # As after both the configured and the fallback model failed to load
+    monkeypatch.setattr(embeddings, "_model", None)
+    monkeypatch.setattr(embeddings, "_model_loaded", True)
+    assert embeddings.get_model() is None
+    with pytest.raises(RuntimeError):
+        embeddings.require_model()
+
+
+def test_require_model_returns_the_loaded_model(fake_model):
+    assert embeddings.require_model() is fake_model
@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+import schedule_person_picker
+from fairness_queue import FairnessQueue
+from schedule_person_picker import CoasterScheduler
+
+NOW = 1_000_000.0
+
+
+@pytest.fixture
+def queue():
+    return FairnessQueue(cooldown_seconds=100)
+
+
+def ids(picked):
+    return [user_id for user_id, _ in picked]
+
+
+def test_pop_eligible_oldest_first_and_past_the_cooldown(queue):
+    queue.upsert("new", [1])                        # never notified
+    queue.upsert("old", [1], last_notified=NOW - 500)
+    queue.upsert("recent", [1], last_notified=NOW - 150)
+    queue.upsert("cooling", [1], last_notified=NOW - 50)
+    assert ids(queue.pop_eligible(10, now=NOW)) == ["new", "old", "recent"]
+    assert queue.pop_eligible(10, now=NOW) == []    # all popped ones are in flight
+    assert ids(queue.pop_eligible(10, now=NOW + 60)) == ["cooling"]
+
+
+def test_pop_eligible_respects_count_and_returns_interests(queue):
+    for i in range(5):
+        queue.upsert(f"u{i}", [i, i + 1], last_notified=NOW - 1000 + i)
+    assert queue.pop_eligible(2, now=NOW) == [("u0", [0, 1]), ("u1", [1, 2])]
+    assert ids(queue.pop_eligible(2, now=NOW)) == ["u2", "u3"]
+
+
+def test_release_keeps_the_users_place(queue):
+    queue.upsert("a", [1], last_notified=NOW - 500)
+    queue.upsert("b", [1], last_notified=NOW - 400)
+    assert ids(queue.pop_eligible(1, now=NOW)) == ["a"]
+    queue.release(["a"])
+    assert ids(queue.pop_eligible(2, now=NOW)) == ["a", "b"]
+
+
+def test_mark_notified_starts_the_cooldown(queue):
+    queue.upsert("a", [1], last_notified=NOW - 500)
+    queue.upsert("b", [1], last_notified=NOW - 400)
+    assert ids(queue.pop_eligible(1, now=NOW)) == ["a"]
+    queue.mark_notified(["a", "unknown"], now=NOW)
+    assert ids(queue.pop_eligible(5, now=NOW)) == ["b"]
+    queue.mark_notified(["b"], now=NOW + 10)
+    # a waited longest once both are past the cooldown again
+    assert ids(queue.pop_eligible(5, now=NOW + 200)) == ["a", "b"]
+    assert queue.stats(now=NOW)["in_flight"] == 2
+
+
+def test_stale_heap_entries_are_skipped_and_compacted(queue):
+    queue.upsert("a", [1], last_notified=NOW - 500)
+    for step in range(1, 200):
+        # Each newer notification pushes a new entry and leaves the old one stale
+        queue.upsert("a", [1], last_notified=NOW - 500 + step)
+    queue.upsert("b", [1], last_notified=NOW - 400)
+    assert queue.stats(now=NOW)["heap_size"] <= 2 * len(queue) + 64 + 1
+    assert ids(queue.pop_eligible(5, now=NOW)) == ["b", "a"]
+
+    queue.upsert("gone", [1], last_notified=NOW - 900)
+    queue.upsert("gone", [])                        # no interests left: dropped
+    queue.remove("b")
+    queue.release(["a", "b"])
+    assert ids(queue.pop_eligible(5, now=NOW)) == ["a"]
+    assert len(queue) == 1
+
+
+def test_upsert_never_moves_a_notification_back(queue):
+    queue.upsert("a", [1], last_notified=NOW - 10)
+    queue.upsert("a", [2], last_notified=NOW - 500)
+    assert queue.pop_eligible(5, now=NOW) == []
+    assert queue.pop_eligible(5, now=NOW + 100) == [("a", [2])]
+
+
+def test_sync_upsert_during_an_in_flight_dispatch(monkeypatch):
+    """A sync that lands while a pick is out must neither lose the user nor let it be picked twice."""
+    scheduler = CoasterScheduler(round_size=10, batch_size=10, workers=1, cooldown_seconds=100)
+    scheduler.queue.upsert("a", [1], last_notified=NOW - 500)
+    scheduler.queue.upsert("b", [2], last_notified=NOW - 400)
+    started, resume = threading.Event(), threading.Event()
+    outcome = {}
+
+    def request_similar_users(picks):
+        started.set()
+        resume.wait(5)
+        return outcome["result"]
+
+    monkeypatch.setattr(schedule_person_picker, "request_similar_users", request_similar_users)
+
+    # The pick fails after a sync brought a's new interests and a newer notification
+    outcome["result"] = {}
+    [future] = scheduler.tick()
+    assert started.wait(5)
+    scheduler.queue.upsert("a", [3], last_notified=NOW - 300)
+    assert scheduler.tick() == []                   # both still in flight
+    resume.set()
+    assert future.result(5) == {}
+    assert scheduler.queue.pop_eligible(5, now=NOW) == [("b", [2]), ("a", [3])]
+    scheduler.queue.release(["a", "b"])
+
+    # The pick succeeds: the cooldown starts whatever the sync said meanwhile
+    started.clear(), resume.clear()
+    outcome["result"] = {"a": ["c"], "b": []}
+    scheduler.queue.upsert("c", [4], last_notified=NOW - 900)
+    futures = scheduler.tick()
+    assert started.wait(5)
+    scheduler.queue.upsert("b", [5], last_notified=NOW - 200)
+    resume.set()
+    assert [f.result(5) for f in futures] == [{"a": ["c"], "b": []}]
+    assert scheduler.queue.pop_eligible(5) == []
+    assert scheduler.queue.stats()["in_flight"] == 0
+    scheduler.executor.shutdown()
@@ -0,0 +1,169 @@
+import numpy as np
+import pytest
+
+from interest_index import InterestIndex
+
+
+def catalog(n=2000, dim=32, clusters=20, seed=0):
+    """Clustered vectors, so nearest neighbours are well separated and IVF lists are meaningful."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim))
+    vectors = centres[rng.integers(0, clusters, n)] + 0.4 * rng.standard_normal((n, dim))
+    return vectors.astype(np.float32)
+
+
+def records(vectors):
+    return [{"id": i, "name": f"i{i}", "description": "", "vector": v.tolist()}
+            for i, v in enumerate(vectors)]
+
+
+def brute_force(vectors, query, k, exclude_ids=()):
+    """(ids, cosine similarities) of the ``k`` rows closest to ``query``."""
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normed @ (query / np.linalg.norm(query))
+    scores[list(exclude_ids)] = -np.inf
+    order = np.argsort(-scores, kind="stable")[:k]
+    return [int(i) for i in order], scores[order]
+
+
+def queries(n=25, dim=32, seed=1):
+    # Near the catalog's own points, like a lookup from an existing interest
+    return catalog(seed=0)[:n] + 0.05 * np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def recall(found, expected):
+    return len(set(found) & set(expected)) / len(expected)
+
+
+def assert_same_results(found, expected):
+    """Same ids in the same order; scores may differ by float rounding between BLAS paths."""
+    assert [r["id"] for r in found] == [r["id"] for r in expected]
+    np.testing.assert_allclose([r["similarity"] for r in found],
+                               [r["similarity"] for r in expected], atol=1e-5)
+
+
+def test_exact_matches_brute_force():
+    vectors = catalog()
+    index = InterestIndex()
+    index.rebuild(records(vectors))
+    for query in queries():
+        ids, scores = brute_force(vectors, query, 10)
+        results = index.top_k(query, k=10)
+        assert [r["id"] for r in results] == ids
+        np.testing.assert_allclose([r["similarity"] for r in results], scores, atol=1e-5)
+
+
+def test_exact_exclusion_and_threshold():
+    vectors = catalog()
+    index = InterestIndex()
+    index.rebuild(records(vectors))
+    query = vectors[7]
+    ids, scores = brute_force(vectors, query, 10, exclude_ids=[7])
+    assert [r["id"] for r in index.top_k(query, k=10, exclude_ids=[7])] == ids
+    threshold = float(scores[4])
+    assert [r["id"] for r in index.top_k(query, k=10, exclude_ids=[7], threshold=threshold)] == ids[:4]
+
+
+def test_batch_matches_single_queries():
+    vectors = catalog()
+    index = InterestIndex()
+    index.rebuild(records(vectors))
+    batch = queries()
+    for found, query in zip(index.top_k_batch(batch, k=10), batch):
+        assert_same_results(found, index.top_k(query, k=10))
+
+
+@pytest.mark.parametrize("rerank, tolerance", [(0, 2e-2), (4, 2e-3)])
+def test_int8_close_to_brute_force(rerank, tolerance):
+    vectors = catalog()
+    index = InterestIndex(precision="int8", rerank=rerank)
+    index.rebuild(records(vectors))
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    recalls = []
+    for query in queries():
+        ids, _ = brute_force(vectors, query, 10)
+        results = index.top_k(query, k=10)
+        recalls.append(recall([r["id"] for r in results], ids))
+        # Every reported score is the true cosine up to quantisation error
+        true = normed[[r["id"] for r in results]] @ (query / np.linalg.norm(query))
+        np.testing.assert_allclose([r["similarity"] for r in results], true, atol=tolerance)
+    assert np.mean(recalls) >= (0.99 if rerank else 0.9)
+
+
+def test_ivf_close_to_brute_force():
+    vectors = catalog()
+    index = InterestIndex(backend="ivf", ivf_min_size=100, ivf_lists=20, ivf_probe=4)
+    index.rebuild(records(vectors))
+    assert index._ivf is not None
+    recalls = []
+    for query in queries():
+        ids, _ = brute_force(vectors, query, 10)
+        recalls.append(recall([r["id"] for r in index.top_k(query, k=10)], ids))
+    assert np.mean(recalls) >= 0.9
+
+
+def test_ivf_probing_every_list_is_exact():
+    vectors = catalog()
+    index = InterestIndex(backend="ivf", ivf_min_size=100, ivf_lists=20, ivf_probe=20)
+    index.rebuild(records(vectors))
+    for query in queries():
+        ids, _ = brute_force(vectors, query, 10)
+        assert [r["id"] for r in index.top_k(query, k=10)] == ids
+
+
+@pytest.mark.parametrize("options", [{}, {"precision": "int8", "rerank": 4},
+                                     {"backend": "ivf", "ivf_min_size": 100, "ivf_lists": 20, "ivf_probe": 20}])
+def test_upserts_match_a_rebuild(options):
+    vectors = catalog()
+    rng = np.random.default_rng(2)
+    incremental = InterestIndex(**options)
+    incremental.rebuild(records(vectors[:1500]))
+    # New ids, then replaced vectors for existing ones
+    for i in range(1500, len(vectors)):
+        incremental.upsert(i, vectors[i], name=f"i{i}")
+    for i in rng.choice(len(vectors), size=200, replace=False):
+        vectors[i] = catalog(n=1, seed=int(i) + 100)[0]
+        assert incremental.upsert(int(i), vectors[i], name=f"i{i}")
+
+    rebuilt = InterestIndex(**options)
+    rebuilt.rebuild(records(vectors))
+    assert len(incremental) == len(rebuilt) == len(vectors)
+    for query in queries():
+        expected = [r["id"] for r in rebuilt.top_k(query, k=10)]
+        assert recall([r["id"] for r in incremental.top_k(query, k=10)], expected) >= 0.9
+    if not options:
+        for query in queries():
+            assert_same_results(incremental.top_k(query, k=10), rebuilt.top_k(query, k=10))
+
+
+def test_upsert_rejects_mismatched_vectors():
+    index = InterestIndex()
+    assert index.upsert(1, [1.0, 0.0])
+    assert not index.upsert(2, [1.0, 0.0, 0.0])
+    assert not index.upsert(3, [])
+    assert len(index) == 1
+
+
+def test_update_user_interests_updates_the_index(memory_conn, fake_model):
+    import embeddings
+
+    def name(topic):
+        return " ".join(fake_model.topic_words(topic)[:2])
+
+    interests = [{"id": 1, "name": name(0), "description": ""},
+                 {"id": 2, "name": name(1), "description": ""}]
+    assert memory_conn.update_user_interests("alice", interests)
+    index = memory_conn.interest_index
+    assert 1 in index and 2 in index
+    vector = np.asarray(embeddings.embed_interests(interests[:1])[0], dtype=np.float32)
+    np.testing.assert_allclose(index.get_vector(1), vector / np.linalg.norm(vector), atol=1e-6)
+
+    # A new interest is added, and re-using an id with new text replaces its vector
+    changed = [{"id": 2, "name": name(2), "description": ""},
+               {"id": 3, "name": name(3), "description": ""}]
+    assert memory_conn.update_user_interests("bob", changed)
+    assert 3 in index and len(index) == 3
+    vector = np.asarray(embeddings.embed_interests(changed[:1])[0], dtype=np.float32)
+    np.testing.assert_allclose(index.get_vector(2), vector / np.linalg.norm(vector), atol=1e-6)
+    assert index.top_k(vector, k=1)[0]["id"] == 2
+    assert index.top_k(vector, k=1)[0]["name"] == name(2)
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from benchmarks.graph_stub import StubDriver, StubGraph
+from neo4j_connection import PROFILE_VERSION_QUERY, Neo4jConnection
+from profile_cache import ProfileCache, render
+
+
+def test_entries_are_tagged_with_the_profile_version():
+    cache = ProfileCache(max_size=10, ttl_seconds=None)
+    value = render([{"id": 1}])
+    cache.put(("a", True), value, cache.generation, version=1)
+    assert cache.get(("a", True), version=1) == value
+    assert cache.get(("a", True), version=2) is None
+    # A mismatched entry is dropped, not just skipped
+    assert cache.get(("a", True), version=1) is None
+
+
+def test_a_fill_racing_an_invalidation_is_dropped():
+    cache = ProfileCache(max_size=10, ttl_seconds=None)
+    generation = cache.generation
+    cache.invalidate(["a"])
+    cache.put(("a", True), render([]), generation, version=1)
+    assert cache.get(("a", True), version=1) is None
+
+
+@pytest.fixture
+def workers(fake_model, monkeypatch):
+    """Two connections over one graph, like two API workers in front of one Neo4j."""
+    graph = StubGraph()
+    reads = []
+    run = graph.run
+    monkeypatch.setattr(graph, "run", lambda query, params: reads.append(query) or run(query, params))
+    return graph, reads, Neo4jConnection(StubDriver(graph)), Neo4jConnection(StubDriver(graph))
+
+
+def interests(fake_model, topic, interest_id):
+    return [{"id": interest_id, "name": " ".join(fake_model.topic_words(topic)[:2]), "description": ""}]
+
+
+def test_a_save_through_one_worker_is_seen_by_the_other(workers, fake_model):
+    graph, reads, first, second = workers
+    assert first.update_user_interests("a", interests(fake_model, 0, 1))
+    body, etag = second.get_user_profile("a", include_vectors=False)
+    assert [row["id"] for row in json.loads(body)] == [1]
+
+    # A repeat only reads the version
+    reads.clear()
+    assert second.get_user_profile("a", include_vectors=False) == (body, etag)
+    assert reads == [PROFILE_VERSION_QUERY]
+
+    assert first.update_user_interests("a", interests(fake_model, 1, 2))
+    body, new_etag = second.get_user_profile("a", include_vectors=False)
+    assert [row["id"] for row in json.loads(body)] == [2]
+    assert new_etag != etag
+    assert graph.users["a"]["profileVersion"] == 2
+
+
+def test_cache_off_skips_the_version_read(workers, fake_model):
+    graph, reads, first, _ = workers
+    first.profile_cache = ProfileCache(max_size=0)
+    first.update_user_interests("a", interests(fake_model, 0, 1))
+    reads.clear()
+    first.get_user_profile("a", include_vectors=False)
+    assert PROFILE_VERSION_QUERY not in reads
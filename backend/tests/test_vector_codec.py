@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from interest_index import InterestIndex
+from vector_codec import (
+    FLOAT16_TAG,
+    INT8_TAG,
+    decode_records,
+    decode_vector,
+    encode_rows,
+    encode_vector,
+    vector_to_list,
+)
+
+
+def vectors(n=500, dim=100, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_float_storage_is_unchanged():
+    vector = [0.25, -1.5, 3.0]
+    assert encode_vector(vector, "float") is vector
+
+
+@pytest.mark.parametrize("storage, tag, size", [("float16", FLOAT16_TAG, 1 + 2 * 100),
+                                                ("int8", INT8_TAG, 1 + 4 + 100)])
+def test_packed_round_trip(storage, tag, size):
+    for vector in vectors(n=50):
+        packed = encode_vector(vector.tolist(), storage)
+        assert isinstance(packed, bytes) and packed[:1] == tag and len(packed) == size
+        decoded = decode_vector(packed)
+        assert decoded.dtype == np.float32 and decoded.shape == vector.shape
+        # float16 keeps ~3 significant digits; int8 is off by at most half a step of peak / 127
+        tolerance = np.abs(vector) * 1e-3 if storage == "float16" else np.abs(vector).max() / 254 + 1e-6
+        assert np.all(np.abs(decoded - vector) <= tolerance + 1e-7)
+
+
+def test_int8_zero_vector_round_trips():
+    decoded = decode_vector(encode_vector([0.0, 0.0, 0.0], "int8"))
+    assert decoded.tolist() == [0.0, 0.0, 0.0]
+
+
+def test_decode_reads_plain_float_lists():
+    vector = [0.5, -0.25, 1.0]
+    assert decode_vector(vector) is vector
+    assert decode_vector(None) is None
+    assert vector_to_list(vector) == vector
+    assert vector_to_list(encode_vector(vector, "float16")) == vector
+
+
+def test_decode_rejects_unknown_tags():
+    with pytest.raises(ValueError):
+        decode_vector(b"x\x00\x00")
+    with pytest.raises(ValueError):
+        encode_vector([1.0], "bfloat16")
+
+
+def test_records_in_mixed_formats_decode_alike():
+    vector = vectors(n=1)[0]
+    records = [{"id": 1, "vector": vector.tolist()},
+               {"id": 2, "vector": encode_vector(vector, "float16")},
+               {"id": 3, "vector": encode_vector(vector, "int8")}]
+    decoded = decode_records(records)
+    assert [record["id"] for record in decoded] == [1, 2, 3]
+    for record in decoded:
+        np.testing.assert_allclose(record["vector"], vector, atol=np.abs(vector).max() / 100)
+
+
+def test_encode_rows_packs_every_interest():
+    users = [{"user_id": "a", "interests": [{"id": 1, "vector": [1.0, 2.0]}]}]
+    assert encode_rows(users, "float") is users
+    packed = encode_rows(users, "int8")
+    assert packed[0]["interests"][0]["vector"][:1] == INT8_TAG
+    assert users[0]["interests"][0]["vector"] == [1.0, 2.0]
+
+
+@pytest.mark.parametrize("storage", ["float16", "int8"])
+def test_int8_index_with_rerank_over_packed_vectors(storage):
+    """Vectors read back from packed storage, scored as int8 codes and reranked, stay close to exact cosine."""
+    stored = vectors()
+    index = InterestIndex(precision="int8", rerank=4)
+    index.rebuild(decode_records([{"id": i, "name": str(i), "vector": encode_vector(v, storage)}
+                                  for i, v in enumerate(stored)]))
+    normed = stored / np.linalg.norm(stored, axis=1, keepdims=True)
+    hits = 0
+    for query in stored[:40] + 0.3 * vectors(n=40, seed=1):
+        exact = normed @ (query / np.linalg.norm(query))
+        expected = set(np.argsort(-exact)[:10].tolist())
+        results = index.top_k(query, k=10)
+        hits += len(expected & {r["id"] for r in results})
+        np.testing.assert_allclose([r["similarity"] for r in results],
+                                   exact[[r["id"] for r in results]], atol=5e-3)
+    assert hits / (40 * 10) >= 0.95
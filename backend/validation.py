@@ -0,0 +1,63 @@
+"""Request body checks shared by the Flask (api.py) and ASGI (asgi.py) routes.
+
+Each function returns the values a route passes on to the connection, or
+raises ``InvalidRequest``, which the routes answer with a 400 and the message.
+"""
+from neo4j_connection import MAX_BULK_USERS, MAX_SIMILAR_BATCH_SIZE
+
+
+class InvalidRequest(ValueError):
+    """A malformed request body; the message is sent back as ``{"error": ...}``."""
+
+
+def _integer(value):
+    """``value`` as an int if it is one or a string of digits, else None; bools are not ids."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        return int(value)
+    return None
+
+
+def interest_id(value):
+    """The integer id in ``/api/interests/similar/<interest_id>``."""
+    parsed = _integer(value)
+    if parsed is None:
+        raise InvalidRequest("interest_id must be an integer")
+    return parsed
+
+
+def bulk_entries(body):
+    """The ``[{user_id, interests, name?}]`` entries of a bulk interest import."""
+    entries = body.get("users") if isinstance(body, dict) else body
+    if not isinstance(entries, list) or not entries:
+        raise InvalidRequest("Expected a non-empty list of {user_id, interests}")
+    if len(entries) > MAX_BULK_USERS:
+        raise InvalidRequest(f"At most {MAX_BULK_USERS} users per request")
+    for entry in entries:
+        if not isinstance(entry, dict) or "user_id" not in entry or not isinstance(entry.get("interests"), list):
+            raise InvalidRequest("Every entry needs a user_id and an interests list")
+    return entries
+
+
+def similar_batch(body, default_limit):
+    """``(interest_ids, limit, user_ids)`` of a similar:batch body; ``limit`` defaults to the query string's."""
+    body = body or {}
+    interest_ids = body.get("interest_ids") or []
+    limit = body.get("limit", default_limit)
+    if not isinstance(interest_ids, list) or not interest_ids:
+        raise InvalidRequest("interest_ids must be a non-empty list")
+    if len(interest_ids) > MAX_SIMILAR_BATCH_SIZE:
+        raise InvalidRequest(f"At most {MAX_SIMILAR_BATCH_SIZE} interest_ids per batch")
+    interest_ids = [_integer(value) for value in interest_ids]
+    if None in interest_ids:
+        raise InvalidRequest("interest_ids must all be integers")
+    limit = _integer(limit)
+    if limit is None or limit < 1:
+        raise InvalidRequest("limit must be a positive integer")
+    user_ids = body.get("user_ids")
+    if user_ids is not None and (not isinstance(user_ids, list) or len(user_ids) != len(interest_ids)):
+        raise InvalidRequest("user_ids must be a list as long as interest_ids")
+    return interest_ids, limit, user_ids
@@ -0,0 +1,69 @@
+"""How Interest.vector is stored in Neo4j.
+
+``VECTOR_STORAGE=float`` (default) keeps a list of floats, which Neo4j stores
+as a double array and the native vector index requires. ``float16`` and
+``int8`` pack the vector into a byte array instead: 2 bytes, or 1 byte plus
+one float32 scale, per dimension rather than 8, both on disk and over Bolt.
+Packed values start with a format tag, so reads accept either form and
+vectors move to the configured format as profiles are saved.
+"""
+import os
+import struct
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "float")
+
+FLOAT16_TAG = b"h"
+INT8_TAG = b"b"
+
+
+def encode_vector(vector, storage=VECTOR_STORAGE):
+    """The property value to store for ``vector`` in the given format."""
+    if storage == "float":
+        return vector
+    array = np.asarray(vector, dtype=np.float32).ravel()
+    if storage == "float16":
+        return FLOAT16_TAG + array.astype("<f2").tobytes()
+    if storage == "int8":
+        peak = float(np.abs(array).max()) if array.size else 0.0
+        scale = peak / 127 if peak else 1.0
+        codes = np.rint(array / scale).astype(np.int8)
+        return INT8_TAG + struct.pack("<f", scale) + codes.tobytes()
+    raise ValueError(f"Unknown VECTOR_STORAGE: {storage}")
+
+
+def decode_vector(value):
+    """float32 array for a packed vector; float lists (and None) are returned as they are."""
+    if not isinstance(value, (bytes, bytearray)):
+        return value
+    tag, payload = bytes(value[:1]), memoryview(value)[1:]
+    if tag == FLOAT16_TAG:
+        return np.frombuffer(payload, dtype="<f2").astype(np.float32)
+    if tag == INT8_TAG:
+        (scale,) = struct.unpack_from("<f", payload)
+        return np.frombuffer(payload[4:], dtype=np.int8).astype(np.float32) * np.float32(scale)
+    raise ValueError(f"Unknown packed vector format: {tag!r}")
+
+
+def vector_to_list(value):
+    """A stored vector in either form as a JSON-friendly list of floats."""
+    vector = decode_vector(value)
+    return vector.tolist() if isinstance(vector, np.ndarray) else vector
+
+
+def decode_records(records):
+    """Dicts of ``records`` with their ``vector`` field decoded."""
+    return [{**record, "vector": decode_vector(record["vector"])} for record in records]
+
+
+def encode_rows(users, storage=VECTOR_STORAGE):
+    """The UNWIND rows of a profile write with every interest vector encoded for storage."""
+    if storage == "float":
+        return users
+    return [{**user, "interests": [{**row, "vector": encode_vector(row["vector"], storage)}
+                                   for row in user["interests"]]}
+            for user in users]